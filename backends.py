@@ -0,0 +1,87 @@
+# backends.py
+"""
+預測器 / 定價器 registry（lazy loading）
+
+登記時只記 "module:attr" 字串，第一次 get_* 才真正 import，
+所以只用規則定價或讀 CSV 的路徑不會載入 Prophet / xgboost / sklearn。
+
+    fcst = get_forecaster("prophet")(hist, periods=7)
+    model = get_pricer("xgboost")(hist)   # (pipeline, mae) | None
+"""
+from __future__ import annotations
+import importlib
+import importlib.util
+import threading
+
+# name -> (target, 需要的第三方套件)
+_FORECASTERS: dict[str, tuple[object, tuple[str, ...]]] = {}
+_PRICERS: dict[str, tuple[object, tuple[str, ...]]] = {}
+_RESOLVED: dict[tuple[str, str], object] = {}
+_LOCK = threading.Lock()
+
+
+def _resolve(target):
+    if callable(target):
+        return target
+    mod_name, _, attr = target.partition(":")
+    return getattr(importlib.import_module(mod_name), attr)
+
+
+def _get(table: dict, kind: str, name: str):
+    if name not in table:
+        raise KeyError(f"unknown {kind}: {name!r}（可用：{sorted(table)}）")
+    with _LOCK:
+        fn = _RESOLVED.get((kind, name))
+        if fn is None:
+            fn = _RESOLVED[(kind, name)] = _resolve(table[name][0])
+        return fn
+
+
+def _available(table: dict) -> list[str]:
+    return sorted(
+        name for name, (_, deps) in table.items()
+        if all(importlib.util.find_spec(d) is not None for d in deps)
+    )
+
+
+def register_forecaster(name: str, target, requires: tuple[str, ...] = ()) -> None:
+    """target：callable 或 "module:attr"；簽名 fn(df, periods=7) -> forecast_df"""
+    _FORECASTERS[name] = (target, tuple(requires))
+    _RESOLVED.pop(("forecaster", name), None)
+
+
+def register_pricer(name: str, target, requires: tuple[str, ...] = ()) -> None:
+    """target：callable 或 "module:attr"；簽名 fn(history) -> (model, mae) | None"""
+    _PRICERS[name] = (target, tuple(requires))
+    _RESOLVED.pop(("pricer", name), None)
+
+
+def get_forecaster(name: str):
+    return _get(_FORECASTERS, "forecaster", name)
+
+
+def get_pricer(name: str):
+    return _get(_PRICERS, "pricer", name)
+
+
+def available_forecasters() -> list[str]:
+    """已登記且相依套件有安裝的預測器（不會觸發 import）"""
+    return _available(_FORECASTERS)
+
+
+def available_pricers() -> list[str]:
+    return _available(_PRICERS)
+
+
+def _rule_pricer(history):
+    """規則定價：不需要模型，infer_price_range 收到 None 就走 rule"""
+    return None
+
+
+# ---------- 內建 ----------
+register_forecaster("prophet", "data_utils:fit_prophet_and_forecast", requires=("prophet",))
+register_forecaster("prophet_fast", "data_utils:fit_prophet_fast", requires=("prophet",))
+register_forecaster("hw", "data_utils:fit_hw_and_forecast")
+register_forecaster("fallback", "data_utils:fallback_forecast")
+register_pricer("xgboost", "data_utils:get_pricing_model", requires=("xgboost", "sklearn"))
+register_pricer("rule", _rule_pricer)
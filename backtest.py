@@ -0,0 +1,240 @@
+# backtest.py
+"""
+Rolling-origin（expanding window）回測：任何登記在 backends.py 的預測器 / 定價器
+
+    python backtest.py --csv sample_data/occupancy_history.csv --models prophet hw fallback
+    python backtest.py --csv priced.csv --kind pricer --models xgboost rule --folds 6
+
+    per_h, summary = backtest(hist, ["prophet", "hw"], horizon=7, n_folds=8)
+
+- 每個 fold：train = origin 之前的全部資料，test = origin 之後 horizon 天
+- folds 切成連續的幾段丟進 process pool；同一段裡相鄰 folds 可 warm start
+  （目前 prophet 支援：上一個 fold 的參數當 Stan 起始值）
+- 報表：每個 horizon 的 MAE / MAPE / coverage（實際值落在 lo~hi 的比例），
+  以及每個模型的計算成本（fit 秒數），好挑「達標裡最便宜」的模型
+- 定價器在 worker 裡用暫存 model registry，不會覆蓋 models/pricing 的正式模型
+"""
+from __future__ import annotations
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from backends import get_forecaster, get_pricer
+
+
+# ---------- folds ----------
+def make_origins(dates: pd.Series, horizon: int = 7, n_folds: int = 8, step: int | None = None,
+                 min_train: int = 28) -> list[pd.Timestamp]:
+    """最後 n_folds 個 origin（由舊到新），間隔 step 天（預設 = horizon）；train 至少 min_train 天"""
+    step = int(step or horizon)
+    d = pd.DatetimeIndex(dates.drop_duplicates().sort_values())
+    if len(d) == 0:
+        return []
+    last = d.max() - pd.Timedelta(days=int(horizon))
+    first_ok = d.min() + pd.Timedelta(days=int(min_train) - 1)
+    origins = [last - pd.Timedelta(days=step * i) for i in range(int(n_folds))]
+    return sorted(o for o in origins if o >= first_ok)
+
+
+def _chunks(items: list, n: int) -> list[list]:
+    """切成 n 段連續區間（長度差最多 1）"""
+    n = max(1, min(n, len(items)))
+    return [[items[i] for i in idx] for idx in np.array_split(np.arange(len(items)), n)]
+
+
+# ---------- warm start ----------
+def _prophet_warm(train: pd.DataFrame, periods: int, state):
+    from data_utils import fit_prophet_model, prophet_warm_start_params
+
+    try:
+        model, fcst = fit_prophet_model(train, periods=periods, init=state)
+    except Exception:
+        if state is None:
+            raise
+        model, fcst = fit_prophet_model(train, periods=periods)  # 參數形狀對不上 → cold
+    return fcst, prophet_warm_start_params(model)
+
+
+# name -> fn(train, periods, state) -> (fcst, new_state)
+WARM_FITTERS = {"prophet": _prophet_warm}
+
+
+# ---------- worker ----------
+def _init_worker(model_dir: str) -> None:
+    # fork 出來的 worker 會繼承父 process 已建好的 registry（指向正式目錄）→ 清掉，改用暫存目錄重建
+    import model_registry
+
+    os.environ["PRICING_MODEL_DIR"] = model_dir
+    model_registry._DEFAULT_REGISTRY = None
+
+
+def _forecast_folds(name: str, df: pd.DataFrame, origins: list, horizon: int, warm: bool) -> list[dict]:
+    warm_fn = WARM_FITTERS.get(name) if warm else None
+    fn = None if warm_fn is not None else get_forecaster(name)
+    state, out = None, []
+    for origin in origins:
+        train = df[df["date"] <= origin]
+        test = df[(df["date"] > origin) & (df["date"] <= origin + pd.Timedelta(days=horizon))]
+        t = time.perf_counter()
+        try:
+            if warm_fn is not None:
+                fcst, state = warm_fn(train, horizon, state)
+            else:
+                fcst = fn(train, periods=horizon)
+        except Exception as e:
+            out.append({"model": name, "origin": origin, "fit_s": time.perf_counter() - t, "error": repr(e)})
+            continue
+        fit_s = time.perf_counter() - t
+        m = test[["date", "occupancy_pct"]].merge(fcst[["date", "occ_pred", "occ_lo", "occ_hi"]], on="date")
+        out.append({
+            "model": name, "origin": origin, "fit_s": fit_s, "error": None,
+            "h": ((m["date"] - origin).dt.days).to_numpy(),
+            "y": m["occupancy_pct"].to_numpy(dtype=float),
+            "pred": m["occ_pred"].to_numpy(dtype=float),
+            "lo": m["occ_lo"].to_numpy(dtype=float),
+            "hi": m["occ_hi"].to_numpy(dtype=float),
+        })
+    return out
+
+
+def _pricer_folds(name: str, df: pd.DataFrame, origins: list, horizon: int, warm: bool) -> list[dict]:
+    from data_utils import price_arrays
+
+    fn = get_pricer(name)
+    comp = df["comp_mean"] if "comp_mean" in df.columns else (
+        (df["comp_min"] + df["comp_max"]) / 2.0 if {"comp_min", "comp_max"} <= set(df.columns) else None
+    )
+    df = df.assign(comp_mean=np.nan if comp is None else comp)
+    out = []
+    for origin in origins:
+        train = df[df["date"] <= origin]
+        test = df[(df["date"] > origin) & (df["date"] <= origin + pd.Timedelta(days=horizon))].dropna(subset=["price"])
+        t = time.perf_counter()
+        try:
+            trained = fn(train)
+        except Exception as e:
+            out.append({"model": name, "origin": origin, "fit_s": time.perf_counter() - t, "error": repr(e)})
+            continue
+        fit_s = time.perf_counter() - t
+        model = trained[0] if trained is not None else None
+        mid, band, _ = price_arrays(model, test["occupancy_pct"], test["comp_mean"], test["date"])
+        out.append({
+            "model": name, "origin": origin, "fit_s": fit_s, "error": None,
+            "h": ((test["date"] - origin).dt.days).to_numpy(),
+            "y": test["price"].to_numpy(dtype=float),
+            "pred": mid, "lo": mid - band, "hi": mid + band,
+        })
+    return out
+
+
+def _run_chunk(job: tuple) -> list[dict]:
+    kind, name, df, origins, horizon, warm = job
+    runner = _forecast_folds if kind == "forecaster" else _pricer_folds
+    return runner(name, df, origins, horizon, warm)
+
+
+# ---------- 報表 ----------
+def _metrics(folds: list[dict]) -> tuple[pd.DataFrame, pd.DataFrame]:
+    ok = [f for f in folds if f["error"] is None]
+    rows = pd.DataFrame({
+        "model": [f["model"] for f in ok for _ in range(len(f["y"]))],
+        **{k: np.concatenate([f[k] for f in ok] or [np.empty(0)]) for k in ("h", "y", "pred", "lo", "hi")},
+    })
+    rows["abs_err"] = (rows["y"] - rows["pred"]).abs()
+    rows["ape"] = rows["abs_err"] / rows["y"].abs().where(rows["y"] != 0) * 100.0  # y=0 不算 MAPE
+    rows["covered"] = ((rows["y"] >= rows["lo"]) & (rows["y"] <= rows["hi"])).astype(float)
+
+    def agg(g):
+        return g.agg(mae=("abs_err", "mean"), mape=("ape", "mean"), coverage=("covered", "mean"), n=("y", "size"))
+
+    per_h = agg(rows.groupby(["model", "h"])).reset_index()
+    summary = agg(rows.groupby("model")).reset_index() if len(rows) else pd.DataFrame(columns=["model"])
+
+    cost = pd.DataFrame([{"model": f["model"], "fit_s": f["fit_s"], "failed": f["error"] is not None} for f in folds])
+    cost = cost.groupby("model").agg(
+        folds=("fit_s", "size"), failed=("failed", "sum"), fit_s_total=("fit_s", "sum"), fit_s_mean=("fit_s", "mean")
+    ).reset_index()
+    summary = cost.merge(summary, on="model", how="left").sort_values("mae", na_position="last")
+    return per_h, summary.reset_index(drop=True)
+
+
+def backtest(
+    df: pd.DataFrame,
+    models: list[str],
+    kind: str = "forecaster",
+    horizon: int = 7,
+    n_folds: int = 8,
+    step: int | None = None,
+    min_train: int = 28,
+    max_workers: int | None = None,
+    warm_start: bool = True,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    回傳 (per_horizon_df, summary_df)
+    - per_horizon_df：model, h（第幾天）, mae, mape, coverage, n
+    - summary_df：model, folds, failed, fit_s_total, fit_s_mean, mae, mape, coverage, n（依 mae 排序）
+    - kind："forecaster"（比 occupancy_pct）或 "pricer"（比 price；需要 price 欄位）
+    """
+    if kind not in ("forecaster", "pricer"):
+        raise ValueError(f"unknown kind: {kind!r}")
+    if kind == "pricer" and "price" not in df.columns:
+        raise ValueError("pricer 回測需要 'price' 欄位")
+    df = df.sort_values("date").reset_index(drop=True)
+    origins = make_origins(df["date"], horizon=horizon, n_folds=n_folds, step=step, min_train=min_train)
+    if not origins:
+        raise ValueError("資料太短，切不出任何 fold（調小 min_train / n_folds）")
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = max(1, int(max_workers))
+    n_chunks = max(1, max_workers // max(1, len(models)))  # 每個模型分幾段（段內循序、可 warm start）
+    jobs = [
+        (kind, name, df, chunk, int(horizon), warm_start)
+        for name in models
+        for chunk in _chunks(origins, n_chunks)
+    ]
+
+    with tempfile.TemporaryDirectory() as model_dir:
+        with ProcessPoolExecutor(
+            max_workers=min(max_workers, len(jobs)), initializer=_init_worker, initargs=(model_dir,)
+        ) as pool:
+            folds = [f for chunk in pool.map(_run_chunk, jobs) for f in chunk]
+    return _metrics(folds)
+
+
+def main(argv=None):
+    from data_utils import load_occupancy_csv
+
+    ap = argparse.ArgumentParser(description="rolling-origin backtest")
+    ap.add_argument("--csv", default="sample_data/occupancy_history.csv")
+    ap.add_argument("--kind", choices=["forecaster", "pricer"], default="forecaster")
+    ap.add_argument("--models", nargs="+", default=None, help="預設：所有可用的預測器 / 定價器")
+    ap.add_argument("--horizon", type=int, default=7)
+    ap.add_argument("--folds", type=int, default=8)
+    ap.add_argument("--step", type=int, default=None)
+    ap.add_argument("--min-train", type=int, default=28)
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--no-warm-start", action="store_true")
+    args = ap.parse_args(argv)
+
+    from backends import available_forecasters, available_pricers
+    models = args.models or (available_forecasters() if args.kind == "forecaster" else available_pricers())
+    t = time.perf_counter()
+    per_h, summary = backtest(
+        load_occupancy_csv(args.csv), models, kind=args.kind, horizon=args.horizon, n_folds=args.folds,
+        step=args.step, min_train=args.min_train, max_workers=args.workers, warm_start=not args.no_warm_start,
+    )
+    pd.set_option("display.width", 160)
+    print(summary.round(3).to_string(index=False))
+    print()
+    print(per_h.pivot(index="h", columns="model", values="mae").round(2).to_string())
+    print(f"\nwall {time.perf_counter() - t:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+# bench.py
+"""
+Pipeline benchmark：合成資料 × 每個階段的 wall time 與 peak memory
+
+    python bench.py                                  # 預設 tiny, small
+    python bench.py --scales tiny small medium --save bench_baseline.json
+    python bench.py --compare bench_baseline.json --tolerance 0.25   # 變慢超過 25% → exit code 1
+
+- 每個 (scale, stage) 都在全新的 python process 裡跑：快取 / registry 都是冷的，
+  peak memory = 該階段期間 RSS 高水位 − 階段開始前的 RSS
+- 合成資料寫在 bench_data/<scale>.csv（多館全量）與 <scale>_single.csv（單館），重跑直接沿用
+- 計時取 --repeat 次裡最快的一次
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# name -> (days, properties)
+SCALES = {
+    "tiny": (30, 1),
+    "small": (365, 1),
+    "medium": (3 * 365, 10),
+    "large": (10 * 365, 100),
+    "xl": (10 * 365, 1000),
+}
+STAGES = [
+    "load_csv",
+    "load_cached",
+    "fit_prophet",
+    "fit_prophet_fast",
+    "train_xgb",
+    "infer_price_range",
+    "dynamic_pricing",
+    "run_crew",
+]
+DATA_DIR = Path("bench_data")
+
+
+# ---------- 合成資料 ----------
+def synthetic_history(days: int = 30, properties: int = 1, seed: int = 0, start: str = "2015-01-01") -> pd.DataFrame:
+    """
+    date × property_id 的入住率 / 房價 / 競品價（向量化產生，10 年 × 1000 館約 1 秒）
+    入住率 = 各館水準 + 週末加成 + 年季節 + 雜訊；房價跟著入住率與競品均價走
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start, periods=days, freq="D")
+    n = days * properties
+    t = np.tile(np.arange(days), properties)
+    dow = np.tile(dates.dayofweek.to_numpy(), properties)
+    level = np.repeat(rng.uniform(55, 80, properties), days)
+    comp_level = np.repeat(rng.uniform(100, 200, properties), days)
+
+    occ = (
+        level
+        + 8.0 * (dow >= 4)
+        + 10.0 * np.sin(2 * np.pi * t / 365.25)
+        + rng.normal(0, 4, n)
+    ).clip(5, 100)
+    comp_mean = comp_level * (1 + 0.05 * np.sin(2 * np.pi * t / 365.25)) + rng.normal(0, 5, n)
+    spread = rng.uniform(20, 60, n)
+    price = comp_mean * (0.9 + 0.6 * occ / 100.0) + 6.0 * (dow >= 4) + rng.normal(0, 5, n)
+
+    return pd.DataFrame({
+        "date": np.tile(dates.values, properties),
+        "property_id": np.repeat([f"P{i:04d}" for i in range(properties)], days),
+        "occupancy_pct": occ.round(2),
+        "price": price.round(2),
+        "comp_min": (comp_mean - spread / 2).round(2),
+        "comp_max": (comp_mean + spread / 2).round(2),
+    })
+
+
+def ensure_data(scale: str, data_dir: Path = DATA_DIR) -> tuple[Path, Path]:
+    """回傳 (全量 csv, 單館 csv)；已存在就不重產"""
+    days, props = SCALES[scale]
+    data_dir.mkdir(parents=True, exist_ok=True)
+    full, single = data_dir / f"{scale}.csv", data_dir / f"{scale}_single.csv"
+    if not full.exists() or not single.exists():
+        df = synthetic_history(days, props)
+        df.to_csv(full, index=False, date_format="%Y-%m-%d")
+        df[df["property_id"] == df["property_id"].iloc[0]].drop(columns="property_id").to_csv(
+            single, index=False, date_format="%Y-%m-%d"
+        )
+    return full, single
+
+
+# ---------- 子 process：只跑一個階段 ----------
+def _rss_mb() -> float:
+    """目前 RSS（Linux 讀 /proc；其他平台退回 ru_maxrss）"""
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return _peak_mb()
+
+
+def _reset_peak() -> None:
+    """Linux：把 VmHWM 歸零成目前 RSS，準備工作的高水位才不會算進階段裡"""
+    try:
+        with open("/proc/self/clear_refs", "w") as fh:
+            fh.write("5")
+    except OSError:
+        pass
+
+
+def _peak_mb() -> float:
+    try:
+        with open("/proc/self/status") as fh:
+            for line in fh:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 2**10
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+_WARM_IMPORTS = ["prophet", "xgboost", "sklearn.pipeline", "sklearn.compose", "sklearn.metrics",
+                 "sklearn.model_selection", "pyarrow"]
+
+
+def _prepare(stage: str, full: str, single: str):
+    """回傳要計時的 callable；準備工作（讀資料、先訓練好模型、import 重型套件）不計時"""
+    import importlib
+    import data_utils as du
+
+    for mod in _WARM_IMPORTS:  # import 時間交給 startup_bench.py 量
+        try:
+            importlib.import_module(mod)
+        except ImportError:
+            pass
+
+    if stage == "load_csv":
+        return lambda: du.load_occupancy_csv(full, use_cache=False)
+    if stage == "load_cached":
+        du.load_occupancy_csv(full)  # 建 arrow cache
+        return lambda: du.load_occupancy_csv(full)
+    if stage == "fit_prophet":
+        hist = du.load_occupancy_csv(single)
+        return lambda: du.fit_prophet_and_forecast(hist, periods=7, use_cache=False, fast=False)
+    if stage == "fit_prophet_fast":
+        hist = du.load_occupancy_csv(single)
+        # 前一天的 fit → warm start（同一個 series_key）
+        du.fit_prophet_and_forecast(hist.iloc[:-1], periods=7, use_cache=False, fast=True, series_key="bench")
+        return lambda: du.fit_prophet_and_forecast(hist, periods=7, use_cache=False, fast=True, series_key="bench")
+    if stage == "train_xgb":
+        hist = du.load_occupancy_csv(full)
+        return lambda: du.train_xgb_pricing_model(hist)
+    if stage == "infer_price_range":
+        hist = du.load_occupancy_csv(full)
+        model, _ = du.train_xgb_pricing_model(hist)
+        return lambda: du.infer_price_range(model, avg_occ=72.0, comp_min=120.0, comp_max=180.0)
+    if stage == "dynamic_pricing":
+        hist = du.load_occupancy_csv(full)
+        return lambda: du.dynamic_pricing(hist, comp_min=120.0, comp_max=180.0)
+    if stage == "run_crew":
+        from crew_core import run_crew
+        from stub_llm import StubLLM
+        return lambda: run_crew("下週雙人房多少？", csv_path=single, llm=StubLLM(), use_cache=False, route=False)
+    raise ValueError(f"unknown stage: {stage!r}")
+
+
+def _child(stage: str, full: str, single: str) -> dict:
+    fn = _prepare(stage, full, single)
+    _reset_peak()
+    before = _rss_mb()
+    t = time.perf_counter()
+    fn()
+    dt = time.perf_counter() - t
+    return {"seconds": dt, "peak_mb": _peak_mb(), "peak_delta_mb": max(0.0, _peak_mb() - before)}
+
+
+# ---------- 父 process ----------
+def run_stage(stage: str, scale: str, repeat: int = 1) -> dict:
+    full, single = ensure_data(scale)
+    runs = []
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as models:
+            env = {**os.environ, "PRICING_MODEL_DIR": models, "HOTEL_LLM": "stub"}
+            env.pop("FORECAST_CACHE_DIR", None)
+            out = subprocess.run(
+                [sys.executable, __file__, "--_child", stage, str(full), str(single)],
+                capture_output=True, text=True, env=env,
+            )
+        if out.returncode != 0:
+            return {"error": (out.stderr.strip().splitlines() or ["?"])[-1]}
+        runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    best = min(runs, key=lambda r: r["seconds"])
+    best["peak_delta_mb"] = max(r["peak_delta_mb"] for r in runs)
+    return best
+
+
+def compare(results: dict, baseline: dict, tolerance: float = 0.25, min_seconds: float = 0.05) -> list[str]:
+    """回傳 regression 清單；太短的階段（< min_seconds）只看記憶體，避免雜訊誤報"""
+    problems = []
+    for key, cur in results["stages"].items():
+        base = baseline.get("stages", {}).get(key)
+        if base is None or "error" in base or "error" in cur:
+            continue
+        if cur["seconds"] > min_seconds and cur["seconds"] > base["seconds"] * (1 + tolerance):
+            problems.append(f"{key}: time {base['seconds']:.3f}s → {cur['seconds']:.3f}s")
+        if cur["peak_delta_mb"] > max(base["peak_delta_mb"] * (1 + tolerance), base["peak_delta_mb"] + 16):
+            problems.append(f"{key}: memory {base['peak_delta_mb']:.0f}MB → {cur['peak_delta_mb']:.0f}MB")
+    return problems
+
+
+def main(argv=None) -> int:
+    if argv is None and len(sys.argv) > 1 and sys.argv[1] == "--_child":
+        print(json.dumps(_child(*sys.argv[2:5])))
+        return 0
+
+    ap = argparse.ArgumentParser(description="pipeline benchmark")
+    ap.add_argument("--scales", nargs="+", default=["tiny", "small"], choices=list(SCALES))
+    ap.add_argument("--stages", nargs="+", default=STAGES, choices=STAGES)
+    ap.add_argument("--repeat", type=int, default=1)
+    ap.add_argument("--out", default="bench_results.json")
+    ap.add_argument("--save", default=None, help="同時寫成新的 baseline")
+    ap.add_argument("--compare", default=None, help="跟 baseline 比較，有 regression → exit code 1")
+    ap.add_argument("--tolerance", type=float, default=0.25)
+    args = ap.parse_args(argv)
+
+    results = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "stages": {},
+    }
+    print(f"{'scale':<8}{'stage':<20}{'seconds':>10}{'peak Δ MB':>11}")
+    for scale in args.scales:
+        for stage in args.stages:
+            r = run_stage(stage, scale, repeat=args.repeat)
+            results["stages"][f"{scale}/{stage}"] = r
+            if "error" in r:
+                print(f"{scale:<8}{stage:<20}{'ERROR':>10}  {r['error']}")
+            else:
+                print(f"{scale:<8}{stage:<20}{r['seconds']:>10.3f}{r['peak_delta_mb']:>11.1f}")
+
+    for path in filter(None, [args.out, args.save]):
+        Path(path).write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    if args.compare:
+        problems = compare(results, json.loads(Path(args.compare).read_text(encoding="utf-8")), args.tolerance)
+        for p in problems:
+            print("REGRESSION", p)
+        return 1 if problems else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
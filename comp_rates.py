@@ -0,0 +1,399 @@
+# comp_rates.py
+"""
+競品價表（rate shop）：排好序的欄式儲存 + 向量化 as-of join
+
+    store = CompetitorRateStore.open("data/comp_rates")      # 目錄不存在 → 空的 store
+    store.append(shop_df)                                     # date, competitor, [room_type], price, [observed_at]
+    store.save()
+    feats = store.attach(hist)                                # 每列加上 comp_min / comp_mean / comp_max / comp_p25 ...
+
+    python comp_rates.py --ingest rateshop.csv --store data/comp_rates
+    python comp_rates.py --store data/comp_rates --bench-rows 5000000   # 合成資料量測 append / attach
+
+- 一個 store = 一組競品（comp set）；多館就各開一個目錄
+- 儲存：一或多個段落目錄，每段是依 (competitor × room_type, 入住日, observed_at) 排序的四個 .npy
+  （mmap 讀取）；meta.json（字典 + 段落清單）最後原子替換
+- as-of：每一列（入住日 D、時間點 T）取每家競品「T 之前最後一次」對 D 的報價，再跨競品算統計量
+  · T 預設是 D 當天結束：歷史列 = 入住當天看到的價，未來列 = 目前最新的價
+  · rows 有 as_of 欄位就用它（例如訂價當下的時間）
+  · max_age_days：比 T（或最後一次抓價，取較早者）舊太多的報價不算
+- append：新資料自己排好序成為一個新段落，不碰舊資料（成本只跟新資料量有關）；
+  save() 只寫還沒存過的段落。查詢時才把各段合併成一份（timsort 合併已排序的 run，每次 open/append 後一次），
+  同一 (競品, 房型, 入住日, observed_at) 重複以後來的為準
+- 段落超過 MAX_SEGMENTS → save() 時合併成一段重寫（攤提後仍是線性）
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_PERCENTILES = (25, 50, 75)
+_COLUMNS = ("day", "t", "entity", "price")
+_DAY = 86_400
+_CHUNK_CELLS = 4_000_000  # attach 時每塊 rows × entities 的上限（控制暫存記憶體）
+MAX_SEGMENTS = 16
+
+
+def _epoch_seconds(values) -> np.ndarray:
+    return pd.to_datetime(values).to_numpy(dtype="datetime64[s]").astype(np.int64)
+
+
+class CompetitorRateStore:
+    def __init__(self, root: str | Path | None = None):
+        self.root = None if root is None else Path(root)
+        self.competitors: list[str] = []
+        self.room_types: list[str] = []
+        self.entities: list[tuple[int, int]] = []  # (competitor code, room_type code)
+        # 每段：{"dir": 磁碟上的段落目錄（None = 還沒存）, "cols": (day, t, entity, price)}，各段自己排好序
+        self._segments: list[dict] = []
+        self._merged = None
+        self._index = None
+
+    # ---------- 欄位（各段合併後的視圖） ----------
+    def _columns(self) -> tuple[np.ndarray, ...]:
+        """
+        day（入住日 epoch 天 int32）、t（observed_at epoch 秒 int64）、entity（int32）、price（float32）
+        多段 → 第一次用到時合併（stable 排序 + 去重）並快取；單段直接回傳（mmap，不複製）
+        """
+        if self._merged is not None:
+            return self._merged
+        if not self._segments:
+            self._merged = (np.empty(0, np.int32), np.empty(0, np.int64), np.empty(0, np.int32), np.empty(0, np.float32))
+        elif len(self._segments) == 1:
+            self._merged = self._segments[0]["cols"]
+        else:
+            day, t, entity, price = (np.concatenate([np.asarray(seg["cols"][i]) for seg in self._segments])
+                                     for i in range(len(_COLUMNS)))
+            self._merged = self._sorted_unique(day, t, entity, price)
+        return self._merged
+
+    day = property(lambda self: self._columns()[0])
+    t = property(lambda self: self._columns()[1])
+    entity = property(lambda self: self._columns()[2])
+    price = property(lambda self: self._columns()[3])
+
+    # ---------- 讀寫 ----------
+    @classmethod
+    def open(cls, root: str | Path, mmap: bool = True) -> "CompetitorRateStore":
+        store = cls(root)
+        meta_p = store.root / "meta.json"
+        if not meta_p.exists():
+            return store
+        meta = json.loads(meta_p.read_text(encoding="utf-8"))
+        store.competitors, store.room_types = meta["competitors"], meta["room_types"]
+        store.entities = [tuple(e) for e in meta["entities"]]
+        for name in meta.get("segments", ["."]):  # 舊格式：四個 .npy 直接放在 root
+            cols = tuple(np.load(store.root / name / f"{c}.npy", mmap_mode="r" if mmap else None) for c in _COLUMNS)
+            store._segments.append({"dir": name, "cols": cols})
+        return store
+
+    def save(self, root: str | Path | None = None) -> Path:
+        """
+        只寫還沒存過的段落，最後原子替換 meta.json；段落超過 MAX_SEGMENTS（或存到別的目錄）→ 合併成一段重寫
+        """
+        root = Path(root) if root is not None else self.root
+        if root is None:
+            raise ValueError("需要 root（open() 時給的目錄或 save(root)）")
+        root.mkdir(parents=True, exist_ok=True)
+        old_dirs = [seg["dir"] for seg in self._segments if seg["dir"] is not None]
+        if root != self.root or len(self._segments) > MAX_SEGMENTS:
+            cols = self._columns()
+            self._segments = [{"dir": None, "cols": cols}] if len(cols[0]) else []
+        else:
+            old_dirs = []
+        for seg in self._segments:
+            if seg["dir"] is None:
+                seg["dir"] = self._write_segment(root, seg["cols"])
+        meta = {"competitors": self.competitors, "room_types": self.room_types,
+                "entities": [list(e) for e in self.entities], "rows": len(self),
+                "segments": [seg["dir"] for seg in self._segments]}
+        tmp = root / "meta.json.tmp"
+        tmp.write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, root / "meta.json")
+        if root == self.root:  # 合併後舊段落已不在 meta 裡
+            for name in old_dirs:
+                if name == ".":
+                    for c in _COLUMNS:
+                        (root / f"{c}.npy").unlink(missing_ok=True)
+                else:
+                    shutil.rmtree(root / name, ignore_errors=True)
+        self.root = root
+        return root
+
+    @staticmethod
+    def _write_segment(root: Path, cols) -> str:
+        seg_dir = Path(tempfile.mkdtemp(prefix="seg-", dir=root))
+        for name, arr in zip(_COLUMNS, cols):
+            np.save(seg_dir / f"{name}.npy", np.asarray(arr))
+        return seg_dir.name
+
+    def __len__(self) -> int:
+        return len(self.price)
+
+    def __repr__(self) -> str:
+        return (f"CompetitorRateStore(rows={len(self)}, competitors={len(self.competitors)}, "
+                f"room_types={len(self.room_types)}, segments={len(self._segments)})")
+
+    # ---------- append ----------
+    @staticmethod
+    def _codes(values, vocab: list[str]) -> np.ndarray:
+        """字串 → 字典編碼（新值接在 vocab 尾端，既有編碼不變）"""
+        inv, uniq = pd.factorize(pd.Series(values).astype(str), use_na_sentinel=False)
+        lookup = {v: i for i, v in enumerate(vocab)}
+        for v in uniq:
+            if v not in lookup:
+                lookup[v] = len(vocab)
+                vocab.append(v)
+        return np.array([lookup[v] for v in uniq], dtype=np.int32)[inv]
+
+    def _encode(self, df: pd.DataFrame):
+        df = df.rename(columns=lambda c: c.strip().lower())
+        missing = [c for c in ("date", "competitor", "price") if c not in df.columns]
+        if missing:
+            raise ValueError(f"競品價表缺欄位: {missing}")
+        price = df["price"].to_numpy(dtype=np.float32)
+        keep = ~np.isnan(price)
+        df, price = df[keep], price[keep]
+        stay = _epoch_seconds(df["date"]) // _DAY
+        t = _epoch_seconds(df["observed_at"]) if "observed_at" in df.columns else stay * _DAY
+        comp = self._codes(df["competitor"], self.competitors)
+        room = self._codes(df["room_type"] if "room_type" in df.columns else np.full(len(df), ""), self.room_types)
+
+        pairs = {e: i for i, e in enumerate(self.entities)}
+        packed = comp.astype(np.int64) << 32 | room
+        inv, uniq = pd.factorize(packed)
+        ids = np.empty(len(uniq), dtype=np.int32)
+        for j, p in enumerate(uniq.tolist()):
+            e = (p >> 32, p & 0xFFFFFFFF)
+            if e not in pairs:
+                pairs[e] = len(self.entities)
+                self.entities.append(e)
+            ids[j] = pairs[e]
+        return stay.astype(np.int32), t, ids[inv], price
+
+    def append(self, df: pd.DataFrame) -> int:
+        """
+        新增報價列（不用先排序）成為一個新段落；回傳這次加入的列數。
+        之後要 save() 才會寫回磁碟（只寫新段落）
+        """
+        if not len(df):
+            return 0
+        cols = self._sorted_unique(*self._encode(df))
+        if not len(cols[0]):
+            return 0
+        self._segments.append({"dir": None, "cols": cols})
+        self._merged = None
+        self._index = None
+        return len(cols[0])
+
+    def _sorted_unique(self, day, t, entity, price) -> tuple[np.ndarray, ...]:
+        """依 (entity, day, t) stable 排序；同一 (entity, day, observed_at) 重複 → 留最後一筆（後 append 的）"""
+        if not len(day):
+            return day, t, entity, price
+        order = self._sort_order(day, t, entity)
+        day, t, entity, price = day[order], t[order], entity[order], price[order]
+        last = np.ones(len(day), dtype=bool)
+        last[:-1] = (entity[1:] != entity[:-1]) | (day[1:] != day[:-1]) | (t[1:] != t[:-1])
+        return day[last], t[last], entity[last], price[last]
+
+    def _sort_order(self, day, t, entity) -> np.ndarray:
+        """依 (entity, day, t) 的 stable 排序；三個鍵打包成單一 int64（放不下才退回 lexsort）"""
+        day0, t0 = int(day.min()), int(t.min())
+        d_span, t_span = int(day.max()) - day0 + 1, int(t.max()) - t0 + 1
+        if len(self.entities) * d_span * t_span >= 2 ** 63:
+            return np.lexsort((t, day, entity))
+        key = (entity.astype(np.int64) * d_span + (day.astype(np.int64) - day0)) * t_span + (t - t0)
+        return np.argsort(key, kind="stable")
+
+    def ingest_csv(self, path: str | Path, chunksize: int = 1_000_000) -> int:
+        """大 CSV 逐塊讀、每塊各自 append 成一個段落（記憶體只放一塊）；回傳加入的列數"""
+        return sum(self.append(chunk) for chunk in pd.read_csv(path, chunksize=chunksize))
+
+    # ---------- as-of join ----------
+    def _build_index(self):
+        """
+        (entity, day) 分組：group_keys 排序、group_start 為每組起點；
+        組內 observed_at 遞增 → 用 gid * t_span + (t - t0) 當單一遞增鍵，一次 searchsorted 找「T 之前最後一筆」
+        """
+        if self._index is not None:
+            return self._index
+        day0 = int(self.day.min())
+        d_span = int(self.day.max()) - day0 + 1
+        t0 = int(self.t.min())
+        t_span = int(self.t.max()) - t0 + 2
+        key = self.entity.astype(np.int64) * d_span + (self.day.astype(np.int64) - day0)
+        new_group = np.ones(len(key), dtype=bool)
+        new_group[1:] = key[1:] != key[:-1]
+        group_start = np.flatnonzero(new_group)
+        gid = np.cumsum(new_group) - 1
+        asof_key = gid * t_span + (self.t - t0)
+        self._index = {"day0": day0, "d_span": d_span, "t0": t0, "t_span": t_span, "t_max": int(self.t.max()),
+                       "group_keys": key[group_start], "group_start": group_start, "asof_key": asof_key}
+        return self._index
+
+    def lookup(self, days, as_of, max_age_days: float | None = None, entities=None) -> np.ndarray:
+        """
+        (入住日 epoch 天, as-of epoch 秒) × entity → 當時最新報價矩陣 [n, len(entities)]（沒有就 NaN）
+        查詢依 (day, as_of) 排好再做時 searchsorted 最快（attach 會先排序）
+        """
+        ent = np.arange(len(self.entities), dtype=np.int64) if entities is None else np.asarray(entities, np.int64)
+        n = len(days)
+        out = np.full((len(ent), n), np.nan, dtype=np.float32)
+        if not len(self) or not n or not len(ent):
+            return out.T
+        ix = self._build_index()
+        rel_day = np.asarray(days, dtype=np.int64) - ix["day0"]
+        in_range = (rel_day >= 0) & (rel_day < ix["d_span"])
+        # entity-major：每個 entity 一段遞增的查詢鍵
+        key = ent[:, None] * ix["d_span"] + rel_day[None, :]
+        g = np.searchsorted(ix["group_keys"], key)
+        g_ok = g < len(ix["group_keys"])
+        g = np.minimum(g, len(ix["group_keys"]) - 1)
+        found = g_ok & (ix["group_keys"][g] == key) & in_range[None, :]
+
+        tq = np.asarray(as_of, dtype=np.int64)
+        rel_t = np.clip(tq - ix["t0"], -1, ix["t_span"] - 1)
+        pos = np.searchsorted(ix["asof_key"], g * ix["t_span"] + rel_t[None, :], side="right") - 1
+        ok = found & (pos >= ix["group_start"][g])
+        pos = np.maximum(pos, 0)
+        if max_age_days is not None:
+            ref = np.minimum(tq, ix["t_max"])[None, :]
+            ok &= (ref - self.t[pos]) <= float(max_age_days) * _DAY
+        out[ok] = self.price[pos[ok]]
+        return out.T
+
+    @staticmethod
+    def _stats(prices: np.ndarray, percentiles) -> dict[str, np.ndarray]:
+        """跨競品統計（NaN = 沒報價）；百分位用 numpy 預設的線性內插"""
+        s = np.sort(prices, axis=1)  # NaN 排最後
+        cnt = (~np.isnan(s)).sum(axis=1)
+        has = cnt > 0
+        last = np.maximum(cnt - 1, 0)
+        rows = np.arange(len(s))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out = {
+                "comp_min": np.where(has, s[:, 0], np.nan),
+                "comp_mean": np.where(has, np.nansum(s, axis=1, dtype=np.float64) / cnt, np.nan),
+                "comp_max": np.where(has, s[rows, last], np.nan),
+            }
+        for q in percentiles:
+            h = last * (q / 100.0)
+            lo = np.floor(h).astype(np.int64)
+            hi = np.minimum(lo + 1, last)
+            v = s[rows, lo] + (h - lo) * (s[rows, hi] - s[rows, lo])
+            out[f"comp_p{int(q)}"] = np.where(has, v, np.nan)
+        out["comp_n"] = cnt
+        return out
+
+    def attach(
+        self,
+        rows: pd.DataFrame,
+        as_of=None,
+        room_type: str | None = None,
+        max_age_days: float | None = None,
+        percentiles=DEFAULT_PERCENTILES,
+    ) -> pd.DataFrame:
+        """
+        rows（至少要 date）加上 comp_min, comp_mean, comp_max, comp_p<q>, comp_n；
+        同名欄位在 store 有資料的列會被覆寫，其餘保留
+        - as_of：純量 / 等長陣列；沒給則用 rows["as_of"]，再沒有就是入住日當天結束
+        - room_type：只比這個房型；沒給則用 rows["room_type"]；空字串 / 沒有房型 → 所有房型一起比
+          （store 裡沒有的房型 → comp_* 為 NaN，comp_n = 0）
+        """
+        days = rows["date"].to_numpy(dtype="datetime64[D]").astype(np.int64)
+        if as_of is None and "as_of" in rows.columns:
+            as_of = rows["as_of"]
+        if as_of is None:
+            tq = (days + 1) * _DAY - 1
+        elif np.ndim(as_of) == 0:
+            tq = np.full(len(rows), int(pd.Timestamp(as_of).timestamp()), dtype=np.int64)
+        else:
+            tq = _epoch_seconds(as_of)
+
+        # 每列要比的房型：-1 = 不分房型（所有 entity），-2 = store 裡沒有這個房型
+        if room_type is None and "room_type" in rows.columns and len(self.room_types) > 1:
+            room = rows["room_type"].astype(str).to_numpy()
+        else:
+            room = np.full(len(rows), "" if room_type is None else str(room_type), dtype=object)
+        want = pd.Index(self.room_types).get_indexer(room).astype(np.int64)
+        want[want < 0] = -2
+        want[(room == "") & (len(self.room_types) > 1 or "" not in self.room_types)] = -1
+
+        names = ["comp_min", "comp_mean", "comp_max", *[f"comp_p{int(q)}" for q in percentiles], "comp_n"]
+        cols = {k: np.full(len(rows), np.nan) for k in names}
+        cols["comp_n"] = np.zeros(len(rows), dtype=np.int64)
+        ent_room = np.array([r for _, r in self.entities], dtype=np.int64)
+        for r in np.unique(want):
+            if r == -2:
+                continue
+            ents = np.flatnonzero(ent_room == r) if r >= 0 else np.arange(len(self.entities))
+            idx = np.flatnonzero(want == r)
+            idx = idx[np.lexsort((tq[idx], days[idx]))]  # 查詢排序 → searchsorted 走快路徑
+            step = max(1, _CHUNK_CELLS // max(1, len(ents)))
+            for lo in range(0, len(idx), step):
+                sub = idx[lo:lo + step]
+                p = self.lookup(days[sub], tq[sub], max_age_days, entities=ents)
+                for k, v in self._stats(p, percentiles).items():
+                    cols[k][sub] = v
+        covered = cols["comp_n"] > 0
+        for k in names[:-1]:
+            if k in rows.columns:  # store 沒涵蓋的列保留原本的值（例如 CSV 自帶的 comp_min / comp_max）
+                cols[k] = np.where(covered, cols[k], rows[k].to_numpy(dtype=float))
+        return rows.assign(**cols)
+
+
+def _synthetic(n_rows: int, n_comp: int = 12, room_types=("std", "dbl", "suite"), seed: int = 0) -> pd.DataFrame:
+    """合成 rate shop：每天對未來 90 天抓價"""
+    rng = np.random.default_rng(seed)
+    stay = rng.integers(0, 3 * 365, n_rows)
+    lead = rng.integers(0, 90, n_rows)
+    base = pd.Timestamp("2022-01-01")
+    return pd.DataFrame({
+        "date": base + pd.to_timedelta(stay, unit="D"),
+        "competitor": np.array([f"C{i:02d}" for i in range(n_comp)])[rng.integers(0, n_comp, n_rows)],
+        "room_type": np.array(room_types)[rng.integers(0, len(room_types), n_rows)],
+        "price": rng.normal(150, 25, n_rows).round(0),
+        "observed_at": base + pd.to_timedelta(stay - lead, unit="D") + pd.to_timedelta(rng.integers(0, 86_400, n_rows), unit="s"),
+    })
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="competitor rate store: ingest rate-shop CSVs and run as-of joins")
+    ap.add_argument("--store", default="data/comp_rates")
+    ap.add_argument("--ingest", nargs="*", default=[], help="rate-shop CSV(s) to append")
+    ap.add_argument("--bench-rows", type=int, default=0, help="benchmark on N synthetic rows (store not saved)")
+    args = ap.parse_args(argv)
+
+    if args.bench_rows:
+        store = CompetitorRateStore()
+        df = _synthetic(args.bench_rows)
+        half = len(df) // 2
+        t = time.perf_counter(); store.append(df.iloc[:half]); t1 = time.perf_counter() - t
+        t = time.perf_counter(); store.append(df.iloc[half:]); t2 = time.perf_counter() - t
+        rows = pd.DataFrame({"date": pd.date_range("2022-01-01", periods=3 * 365, freq="D")})
+        rows = rows.merge(pd.DataFrame({"room_type": ["std", "dbl", "suite"]}), how="cross")
+        rows = pd.concat([rows] * max(1, args.bench_rows // 50_000), ignore_index=True)
+        t = time.perf_counter(); out = store.attach(rows, max_age_days=30); t3 = time.perf_counter() - t
+        print(f"{store}: append {t1:.2f}s + incremental {t2:.2f}s, attach {len(out):,} rows {t3:.2f}s, "
+              f"coverage {(out['comp_n'] > 0).mean():.1%}")
+        return
+
+    store = CompetitorRateStore.open(args.store)
+    for path in args.ingest:
+        t = time.perf_counter()
+        store.ingest_csv(path)
+        print(f"ingest {path}: {time.perf_counter() - t:.2f}s")
+    if args.ingest:
+        store.save()
+    print(store)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,77 +2,211 @@ import os
 from dotenv import load_dotenv
 load_dotenv()
 
-from crewai import Agent, Task, Crew
+import asyncio
+import contextvars
+import functools
+import threading
+import time
 
 from data_utils import (
     load_occupancy_csv,
-    fit_prophet_and_forecast, summarize_forecast,
-    train_xgb_pricing_model, infer_price_range
+    fit_prophet_and_forecast, fit_hw_and_forecast,
+    get_pricing_model, infer_price_range, apply_occupancy_boost
 )
+from intent_router import route as route_question
+from response_cache import get_response_cache, make_response_key
+from tracing import span, enabled as tracing_enabled
 
 # --------- 共用 LLM ---------
 MODEL = os.getenv("OPENAI_MODEL", "gpt-5")
 
-# --------- 定義 Agents ---------
-customer_agent = Agent(
-    role="Front Desk",
-    goal="理解客人需求，轉交後台分析",
-    backstory="你是專業櫃檯，熟悉飯店QA與流程",
-    llm=MODEL
-)
+# --------- 定義 Agents（lazy：第一次用到才 import crewai 並建立） ---------
+AGENT_SPECS = {
+    "customer_agent": dict(
+        role="Front Desk",
+        goal="理解客人需求，轉交後台分析",
+        backstory="你是專業櫃檯，熟悉飯店QA與流程",
+    ),
+    "forecast_agent": dict(
+        role="Forecast Analyst",
+        goal="用提供的真實預測數字，產出清楚的入住率摘要（中英各一段）",
+        backstory="你是收益管理分析師，擅長把數字說人話",
+    ),
+    "pricing_agent": dict(
+        role="Pricing Analyst",
+        goal="用真實的建議價區間，寫出定價邏輯與風險緩衝",
+        backstory="你是定價專家，懂競品、需求壓力與定位",
+    ),
+    "response_agent": dict(
+        role="Bilingual Concierge",
+        goal="整合結果，輸出一段中文+一段英文的對客回覆",
+        backstory="你是多語客服，回覆專業簡潔、可直接貼給客人",
+    ),
+}
 
-forecast_agent = Agent(
-    role="Forecast Analyst",
-    goal="用提供的真實預測數字，產出清楚的入住率摘要（中英各一段）",
-    backstory="你是收益管理分析師，擅長把數字說人話",
-    llm=MODEL
-)
 
-pricing_agent = Agent(
-    role="Pricing Analyst",
-    goal="用真實的建議價區間，寫出定價邏輯與風險緩衝",
-    backstory="你是定價專家，懂競品、需求壓力與定位",
-    llm=MODEL
-)
+@functools.lru_cache(maxsize=None)
+def get_agents(model: str = MODEL) -> dict:
+    """
+    建立並記住 4 個 Agent（同一個 model 只建一次）
+    預設用 CrewAI 內建 LLM（litellm 的 provider 路由 / proxy 照常）；
+    HOTEL_LLM=crewai-pool → Agent 的 LLM 改走 llm_client 的共用 client（限流 / 並行控制 / 記帳，只支援 OpenAI 相容 API）
+    """
+    from crewai import Agent
+    llm = model
+    if os.getenv("HOTEL_LLM", "").lower() == "crewai-pool":
+        from llm_client import crewai_llm
+        llm = crewai_llm(model) or model
+    return {name: Agent(llm=llm, **spec) for name, spec in AGENT_SPECS.items()}
+
+
+def __getattr__(name):
+    # 相容舊用法：crew_core.customer_agent 等
+    if name in AGENT_SPECS:
+        return get_agents()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# --------- 任務定義（全部加 expected_output） ---------
+# depends_on：CrewAI 循序模式的串接順序
+# needs：真正的資料相依（並行模式 kickoff_async 依此建 DAG；task2/3 只吃 facts，可同時跑）
+TASK_SPECS = [
+    dict(
+        name="task1",
+        agent="customer_agent",
+        description=(
+            "客人問題：{question}\n"
+            "請用一兩句話重述客戶需求，準備轉交後台分析。"
+        ),
+        expected_output="兩句以內的中文摘要（可附英文一句）。",
+        depends_on=[],
+        needs=[],
+    ),
+    dict(
+        name="task2",
+        agent="forecast_agent",
+        description=(
+            "請用以下真實預測資料，產出入住率摘要（中文+English）：\n"
+            "- 期間：{forecast_window}\n"
+            "- 平均入住率：{avg_occ}%\n"
+            "- 區間：{min_occ}% ~ {max_occ}%\n"
+            "- 來源：{occ_source}\n"
+            "先中文一段、再 English 一段。"
+        ),
+        expected_output="兩段文字：第一段中文摘要，第二段 English 摘要。",
+        depends_on=["task1"],
+        needs=[],  # 只用 facts
+    ),
+    dict(
+        name="task3",
+        agent="pricing_agent",
+        description=(
+            "根據真實資料產出定價說明（條列）：\n"
+            "- 競品價：USD {comp_min} ~ {comp_max}\n"
+            "- 建議價區間：USD {price_lo} ~ {price_hi}（中位 {price_mid}）\n"
+            "- 方法：{pricing_basis}（xgboost 代表真模型，否則為 rule）\n"
+            "- 請條列 3–5 點為什麼這樣定（需求壓力、競品定位、風險緩衝、敏感度）。"
+        ),
+        expected_output="條列清單（3-5 點），最後一行再次標示區間與中位價（USD）。",
+        depends_on=["task2"],
+        needs=[],  # 只用 facts
+    ),
+    dict(
+        name="task4",
+        agent="response_agent",
+        description=(
+            "整合上面內容，輸出對客回覆（中文 + 英文），包含：\n"
+            "1) 預測摘要（平均 {avg_occ}%，期間 {forecast_window}）\n"
+            "2) 建議價區間（USD {price_lo} ~ {price_hi}，中位 {price_mid}）\n"
+            "3) 下一步需要的資訊（入住日期/人數/特殊需求）。語氣專業、簡潔。"
+        ),
+        expected_output="兩段：第一段中文正式回覆，第二段 English 正式 reply。",
+        depends_on=["task3"],
+        needs=["task1", "task2", "task3"],
+    ),
+]
 
-response_agent = Agent(
-    role="Bilingual Concierge",
-    goal="整合結果，輸出一段中文+一段英文的對客回覆",
-    backstory="你是多語客服，回覆專業簡潔、可直接貼給客人",
-    llm=MODEL
-)
+
+def render_tasks(facts: dict) -> list[dict]:
+    """把 facts 填進 TASK_SPECS（不建立 CrewAI 物件）"""
+    return [{**spec, "description": spec["description"].format(**facts)} for spec in TASK_SPECS]
+
+
+def default_llm():
+    """
+    HOTEL_LLM=stub → 本機 StubLLM；HOTEL_LLM=pool → 共用的限流 client（llm_client.py）直接呼叫；
+    否則 None（走 CrewAI + OPENAI_MODEL；HOTEL_LLM=crewai-pool 時 agent 的 LLM 呼叫經過共用 client，見 get_agents）
+    """
+    mode = os.getenv("HOTEL_LLM", "").lower()
+    if mode == "stub":
+        from stub_llm import StubLLM
+        return StubLLM()
+    if mode == "pool":
+        from llm_client import get_llm_client
+        return get_llm_client()
+    return None
+
+
+def llm_name(llm=None) -> str:
+    return MODEL if llm is None else getattr(llm, "model", type(llm).__name__)
 
 
 # --------- 主流程 ---------
-def run_crew(
+def build_facts(
     user_question: str,
     csv_path: str = "sample_data/occupancy_history.csv",
     comp_min: float = 120.0,
     comp_max: float = 180.0,
-    event_boost: float = 0.0
-):
-    # 1) 真數字計算
+    store: str | None = None,
+    property_id: str = "default",
+    event_boost: float = 0.0,
+) -> dict:
+    """
+    真數字計算：預測 + 定價 → facts dict（不呼叫 LLM）
+
+    store：precompute.py 產生的 SQLite 路徑 → 直接查表（毫秒級）；
+    comp_min / comp_max / event_boost 跟夜間 run 不同時用存下來的 occ_pred 重新定價，查不到才現算
+    （夜間 run 用的是 rate shop 逐日競品價時，comp_min / comp_max 不採用；facts["comp_source"] 標示實際依據）
+    event_boost：活動/季節加成（%），套在預測入住率上
+    """
+    with span("build_facts") as sp:
+        if store is not None and os.path.exists(store):
+            from precompute import PrecomputedStore
+            facts = PrecomputedStore(store).facts(
+                user_question, property_id=property_id,
+                comp_min=comp_min, comp_max=comp_max, event_boost=event_boost,
+            )
+            if facts is not None:
+                sp.set(source="store")
+                return facts
+        sp.set(source="compute")
+        return _compute_facts(user_question, csv_path, comp_min, comp_max, event_boost)
+
+
+def _compute_facts(user_question: str, csv_path: str, comp_min: float, comp_max: float,
+                   event_boost: float = 0.0) -> dict:
     hist = load_occupancy_csv(csv_path)
 
     try:
         fcst = fit_prophet_and_forecast(hist, periods=7)
-        fsum = summarize_forecast(fcst)
-        avg_occ = round(fsum["avg_occ"], 1)
-        forecast_window = f"{fsum['start']} ~ {fsum['end']}"
-        min_occ = round(fsum["min_occ"], 1)
-        max_occ = round(fsum["max_occ"], 1)
         occ_src = "Prophet"
     except Exception:
-        # 最簡 fallback：近 14 天均值
-        avg_occ = float(hist.sort_values("date").tail(14)["occupancy_pct"].mean())
-        forecast_window = f"{hist['date'].max().date().isoformat()} ~ +7d"
-        min_occ = max_occ = round(avg_occ, 1)
-        occ_src = "Fallback(14天均值)"
+        # fallback：NumPy Holt-Winters（週季節性）
+        with span("fit_hw_and_forecast", rows=len(hist)):
+            fcst = fit_hw_and_forecast(hist, periods=7)
+        occ_src = "Holt-Winters"
+    fcst, fsum = apply_occupancy_boost(fcst, event_boost)
+    avg_occ = round(fsum["avg_occ"], 1)
+    forecast_window = f"{fsum['start']} ~ {fsum['end']}"
+    min_occ = round(fsum["min_occ"], 1)
+    max_occ = round(fsum["max_occ"], 1)
 
-    xgb_tuple = train_xgb_pricing_model(hist)  # CSV 有 price 才會生效
-    price = infer_price_range(xgb_tuple, avg_occ, comp_min, comp_max)
+    xgb_tuple = get_pricing_model(hist)  # CSV 有 price 才會生效；registry 快取，不會每次重訓
+    xgb_model, xgb_mae = xgb_tuple if xgb_tuple is not None else (None, None)
+    with span("infer_price_range"):
+        price = infer_price_range(xgb_model, avg_occ, comp_min, comp_max, dates=fcst["date"])
 
-    facts = {
+    return {
         "question": user_question,
         "forecast_window": forecast_window,
         "avg_occ": round(avg_occ, 1),
@@ -81,72 +215,323 @@ def run_crew(
         "occ_source": occ_src,
         "comp_min": comp_min,
         "comp_max": comp_max,
+        "comp_source": "fixed",
         "price_mid": round(price["price_mid"], 1),
         "price_lo": round(price["lo"], 1),
         "price_hi": round(price["hi"], 1),
         "pricing_basis": price["basis"],
+        "xgb_mae": None if xgb_mae is None else round(xgb_mae, 2),
     }
 
-    # 2) 任務定義（全部加 expected_output）
-    task1 = Task(
-        description=(
-            f"客人問題：{facts['question']}\n"
-            "請用一兩句話重述客戶需求，準備轉交後台分析。"
-        ),
-        agent=customer_agent,
-        expected_output="兩句以內的中文摘要（可附英文一句）。"
-    )
 
-    task2 = Task(
-        description=(
-            "請用以下真實預測資料，產出入住率摘要（中文+English）：\n"
-            f"- 期間：{facts['forecast_window']}\n"
-            f"- 平均入住率：{facts['avg_occ']}%\n"
-            f"- 區間：{facts['min_occ']}% ~ {facts['max_occ']}%\n"
-            f"- 來源：{facts['occ_source']}\n"
-            "先中文一段、再 English 一段。"
-        ),
-        agent=forecast_agent,
-        depends_on=[task1],
-        expected_output="兩段文字：第一段中文摘要，第二段 English 摘要。"
-    )
+def kickoff(facts: dict, llm=None) -> str:
+    """
+    跑 4 個任務，回傳最終對客回覆文字
+    llm=None → CrewAI；否則 llm.complete(prompt, role) 逐一執行（前置任務輸出當 context）
+    """
+    tasks = render_tasks(facts)
 
-    task3 = Task(
-        description=(
-            "根據真實資料產出定價說明（條列）：\n"
-            f"- 競品價：USD {facts['comp_min']} ~ {facts['comp_max']}\n"
-            f"- 建議價區間：USD {facts['price_lo']} ~ {facts['price_hi']}（中位 {facts['price_mid']}）\n"
-            f"- 方法：{facts['pricing_basis']}（xgboost 代表真模型，否則為 rule）\n"
-            "- 請條列 3–5 點為什麼這樣定（需求壓力、競品定位、風險緩衝、敏感度）。"
-        ),
-        agent=pricing_agent,
-        depends_on=[task2],
-        expected_output="條列清單（3-5 點），最後一行再次標示區間與中位價（USD）。"
-    )
+    if llm is not None:
+        outputs = {}
+        for t in tasks:
+            context = "\n\n".join(outputs[d] for d in t["depends_on"])
+            prompt = t["description"] + (f"\n\n[context]\n{context}" if context else "")
+            prompt += f"\n\n[expected_output] {t['expected_output']}"
+            with span("llm.task", task=t["name"], agent=t["agent"]) as sp:
+                outputs[t["name"]] = llm.complete(prompt, role=AGENT_SPECS[t["agent"]]["role"])
+                _record_tokens(sp, prompt, outputs[t["name"]])
+        return outputs[tasks[-1]["name"]]
 
-    task4 = Task(
-        description=(
-            "整合上面內容，輸出對客回覆（中文 + 英文），包含：\n"
-            f"1) 預測摘要（平均 {facts['avg_occ']}%，期間 {facts['forecast_window']}）\n"
-            f"2) 建議價區間（USD {facts['price_lo']} ~ {facts['price_hi']}，中位 {facts['price_mid']}）\n"
-            "3) 下一步需要的資訊（入住日期/人數/特殊需求）。語氣專業、簡潔。"
-        ),
-        agent=response_agent,
-        depends_on=[task3],
-        expected_output="兩段：第一段中文正式回覆，第二段 English 正式 reply。"
-    )
+    from crewai import Task, Crew
+
+    agents = get_agents()
+    built = {}
+    marks = []  # tracing：各任務完成時間 → 逐 agent 延遲（sequential crew）
+    for t in tasks:
+        extra = {}
+        if tracing_enabled():
+            extra["callback"] = functools.partial(_mark_done, marks, t["name"], t["agent"])
+        built[t["name"]] = Task(
+            description=t["description"],
+            agent=agents[t["agent"]],
+            depends_on=[built[d] for d in t["depends_on"]],
+            expected_output=t["expected_output"],
+            **extra,
+        )
 
     crew = Crew(
-        agents=[customer_agent, forecast_agent, pricing_agent, response_agent],
-        tasks=[task1, task2, task3, task4],
+        agents=list(agents.values()),
+        tasks=list(built.values()),
         verbose=False
     )
 
-    final_output = crew.kickoff()
-    return {
-        "facts": facts,
-        "final": final_output.raw if hasattr(final_output, "raw") else str(final_output)
-    }
+    with span("crew.kickoff", tasks=len(tasks)) as sp:
+        t0 = time.perf_counter()
+        final_output = crew.kickoff()
+        _record_usage(sp, final_output)
+        sp.set(agent_latency_ms={
+            f"{name}:{agent}": round((t - prev) * 1000.0, 1)
+            for (name, agent, t), prev in zip(marks, [t0] + [m[2] for m in marks])
+        })
+    return final_output.raw if hasattr(final_output, "raw") else str(final_output)
+
+
+def _mark_done(marks: list, name: str, agent: str, _task_output) -> None:
+    marks.append((name, agent, time.perf_counter()))
+
+
+def _record_tokens(sp, prompt: str, text: str) -> None:
+    """非 CrewAI 的 LLM：client 沒回報實際 usage 時用粗估（與 StubLLM 同一套）"""
+    if tracing_enabled() and "prompt_tokens" not in getattr(sp, "attrs", {}):
+        from stub_llm import estimate_tokens
+        sp.set(prompt_tokens=estimate_tokens(prompt), completion_tokens=estimate_tokens(text))
+
+
+def _record_usage(sp, crew_output) -> None:
+    """CrewAI：CrewOutput.token_usage（UsageMetrics）"""
+    usage = getattr(crew_output, "token_usage", None)
+    if usage is not None:
+        sp.set(**{k: getattr(usage, k, None) for k in ("prompt_tokens", "completion_tokens", "total_tokens")})
+
+
+_POOL = None
+_POOL_SIZE = 0
+_POOL_LOCK = threading.Lock()
+
+
+def _llm_pool(min_workers: int = 0):
+    """
+    LLM / CrewAI 阻塞呼叫用的 thread pool；batch 並行數變大時換成更大的
+    舊的 pool shutdown(wait=False)：已送出的任務照跑完，之後送不進去（_in_pool 會改用新的）
+    """
+    global _POOL, _POOL_SIZE
+    want = max(min_workers, int(os.getenv("CREW_MAX_THREADS", "16")))
+    with _POOL_LOCK:
+        if _POOL is None or _POOL_SIZE < want:
+            from concurrent.futures import ThreadPoolExecutor
+            old = _POOL
+            _POOL, _POOL_SIZE = ThreadPoolExecutor(max_workers=want, thread_name_prefix="crew"), want
+            if old is not None:
+                old.shutdown(wait=False)
+        return _POOL
+
+
+async def _in_pool(fn, *args):
+    # run_in_executor 不會帶 contextvars → 手動複製，thread 裡的 span 才接得上 parent
+    call = functools.partial(contextvars.copy_context().run, fn, *args)
+    while True:
+        pool = _llm_pool()
+        try:
+            fut = pool.submit(call)
+        except RuntimeError:
+            # 拿到 pool 後剛好被別的 batch 換掉（已 shutdown）→ 用新的重送
+            if pool is _POOL:
+                raise
+            continue
+        return await asyncio.wrap_future(fut)
+
+
+def _node_prompt(task: dict, context: list[str]) -> str:
+    ctx = "\n\n".join(context)
+    prompt = task["description"] + (f"\n\n[context]\n{ctx}" if ctx else "")
+    return prompt + f"\n\n[expected_output] {task['expected_output']}"
+
+
+async def _run_node(task: dict, context: list[str], llm=None) -> str:
+    """單一任務；阻塞的 LLM / CrewAI 呼叫丟到 thread，不卡 event loop"""
+    role = AGENT_SPECS[task["agent"]]["role"]
+    with span("llm.task", task=task["name"], agent=task["agent"]) as sp:
+        return await _run_node_inner(task, context, role, llm, sp)
+
+
+async def _run_node_inner(task: dict, context: list[str], role: str, llm, sp) -> str:
+    if llm is not None:
+        prompt = _node_prompt(task, context)
+        if hasattr(llm, "acomplete"):
+            text = await llm.acomplete(prompt, role=role)
+        else:
+            text = await _in_pool(llm.complete, prompt, role)
+        _record_tokens(sp, prompt, text)
+        return text
+
+    from crewai import Task, Crew
+
+    agent = get_agents()[task["agent"]]
+    desc = task["description"] + ("\n\n前置任務輸出：\n" + "\n\n".join(context) if context else "")
+    crew = Crew(
+        agents=[agent],
+        tasks=[Task(description=desc, agent=agent, expected_output=task["expected_output"])],
+        verbose=False,
+    )
+    out = await _in_pool(crew.kickoff)
+    _record_usage(sp, out)
+    return out.raw if hasattr(out, "raw") else str(out)
+
+
+async def kickoff_async(facts: dict, llm=None) -> str:
+    """
+    依 TASK_SPECS 的 needs 建 DAG 並行執行：task1/2/3 同時跑，task4 等三者完成。
+    延遲 ≈ 最長路徑（兩次 LLM 呼叫），而不是四次相加。
+    """
+    tasks = render_tasks(facts)
+    futs: dict[str, asyncio.Task] = {}
+
+    async def go(t):
+        context = [await futs[d] for d in t["needs"]]
+        return await _run_node(t, context, llm=llm)
+
+    for t in tasks:  # TASK_SPECS 已是拓撲順序
+        futs[t["name"]] = asyncio.ensure_future(go(t))
+    try:
+        await asyncio.gather(*futs.values())
+    finally:
+        for f in futs.values():
+            f.cancel()
+    return futs[tasks[-1]["name"]].result()
+
+
+async def arun_crew(
+    user_question: str,
+    csv_path: str = "sample_data/occupancy_history.csv",
+    comp_min: float = 120.0,
+    comp_max: float = 180.0,
+    llm=None,
+    use_cache: bool = True,
+    facts: dict | None = None,
+    store: str | None = None,
+    property_id: str = "default",
+    route: bool = True,
+    event_boost: float = 0.0,
+):
+    """
+    run_crew 的並行版（asyncio）；回傳格式相同
+    facts：已經算好的 facts（例如 service.py 在 process pool 算）→ 跳過 build_facts
+    """
+    llm = llm if llm is not None else default_llm()
+    with span("run_crew", mode="async", llm=llm_name(llm)) as sp:
+        out = await _arun_crew(
+            user_question, csv_path, comp_min, comp_max, llm, use_cache, facts, store, property_id, route,
+            event_boost,
+        )
+        sp.set(cached=out["cached"], route=out["route"])
+    return out
+
+
+async def _arun_crew(user_question, csv_path, comp_min, comp_max, llm, use_cache, facts, store, property_id, route,
+                     event_boost=0.0):
+    if facts is None:
+        facts = await _in_pool(
+            build_facts, user_question, csv_path, comp_min, comp_max, store, property_id, event_boost
+        )
+    if route:
+        templated = _route(user_question, facts)
+        if templated is not None:
+            return templated
+    if not use_cache:
+        return {"facts": facts, "final": await kickoff_async(facts, llm=llm), "cached": False, "route": "crew"}
+
+    key = make_response_key(user_question, facts, llm_name(llm))
+    ran = []
+
+    async def compute():
+        ran.append(1)
+        return await kickoff_async(facts, llm=llm)
+
+    final = await get_response_cache().aget_or_run(key, compute)
+    return {"facts": facts, "final": final, "cached": not ran, "route": "crew"}
+
+
+def _route(user_question: str, facts: dict) -> dict | None:
+    """常見報價 / 空房問題：facts 套模板直接回（毫秒級、不呼叫 LLM）；其他回 None"""
+    with span("intent_router") as sp:
+        intent, reply = route_question(user_question, facts)
+        sp.set(intent=intent.name, reason=intent.reason)
+    if reply is None:
+        return None
+    return {"facts": facts, "final": reply, "cached": False, "route": intent.name}
+
+
+async def arun_crew_batch(questions: list[str], concurrency: int = 4, **kwargs) -> list[dict]:
+    """多個客人問題並行處理，同時最多 concurrency 個；回傳順序與輸入相同"""
+    concurrency = max(1, int(concurrency))
+    sem = asyncio.Semaphore(concurrency)
+    _llm_pool(min_workers=concurrency * 3)  # 每個問題最多 3 個任務同時跑
+
+    async def one(q):
+        async with sem:
+            return await arun_crew(q, **kwargs)
+
+    return await asyncio.gather(*(one(q) for q in questions))
+
+
+def run_crew_batch(questions: list[str], concurrency: int = 4, **kwargs) -> list[dict]:
+    """同步入口（CLI / Streamlit 用）"""
+    return asyncio.run(arun_crew_batch(questions, concurrency=concurrency, **kwargs))
+
+
+def run_crew(
+    user_question: str,
+    csv_path: str = "sample_data/occupancy_history.csv",
+    comp_min: float = 120.0,
+    comp_max: float = 180.0,
+    event_boost: float = 0.0,
+    llm=None,
+    use_cache: bool = True,
+    concurrent: bool = False,
+    store: str | None = None,
+    property_id: str = "default",
+    route: bool = True,
+):
+    """
+    回傳 {"facts", "final", "cached", "route"}
+
+    concurrent=True：改用 DAG 並行執行（見 kickoff_async）
+    store：夜間預算好的 SQLite（precompute.py）→ facts 直接查表
+    route=True：先過意圖路由（intent_router.py）；單純報價 / 問空房直接套模板回覆，
+    route 欄位是 intent 名稱，走完整 crew 的是 "crew"
+
+    use_cache=True：同問題（正規化後）+ 同 facts + 同模型 → 直接回快取；
+    同時進來的相同請求只會 kickoff 一次（見 response_cache.py）
+    """
+    if concurrent:
+        return asyncio.run(arun_crew(
+            user_question, csv_path=csv_path, comp_min=comp_min, comp_max=comp_max,
+            llm=llm, use_cache=use_cache, store=store, property_id=property_id, route=route,
+            event_boost=event_boost,
+        ))
+
+    llm = llm if llm is not None else default_llm()
+    with span("run_crew", mode="sequential", llm=llm_name(llm)) as sp:
+        out = _run_crew(
+            user_question, csv_path, comp_min, comp_max, llm, use_cache, store, property_id, route, event_boost
+        )
+        sp.set(cached=out["cached"], route=out["route"])
+    return out
+
+
+def _run_crew(user_question, csv_path, comp_min, comp_max, llm, use_cache, store, property_id, route,
+              event_boost=0.0):
+    # 1) 真數字計算（有 store 先查表）
+    facts = build_facts(
+        user_question, csv_path=csv_path, comp_min=comp_min, comp_max=comp_max,
+        store=store, property_id=property_id, event_boost=event_boost,
+    )
+
+    # 2) 常見問題：模板回覆
+    if route:
+        templated = _route(user_question, facts)
+        if templated is not None:
+            return templated
+
+    # 3) LLM（有快取就不呼叫）
+    if not use_cache:
+        return {"facts": facts, "final": kickoff(facts, llm=llm), "cached": False, "route": "crew"}
+
+    cache = get_response_cache()
+    key = make_response_key(user_question, facts, llm_name(llm))
+    ran = []
+    final = cache.get_or_run(key, lambda: ran.append(1) or kickoff(facts, llm=llm))
+    return {"facts": facts, "final": final, "cached": not ran, "route": "crew"}
 
 # --------- 測試入口 ---------
 if __name__ == "__main__":
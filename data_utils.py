@@ -2,43 +2,262 @@
 from __future__ import annotations
 import pandas as pd
 import numpy as np
+import os
+import threading
+from collections import OrderedDict
 from datetime import timedelta
 from pathlib import Path
+from typing import TYPE_CHECKING
 
-# Prophet
-from prophet import Prophet
+# Prophet / XGBoost / sklearn 都很重 → 第一次用到才 import（見 backends.py）
+if TYPE_CHECKING:
+    from sklearn.pipeline import Pipeline
 
-# XGBoost + sklearn
-from xgboost import XGBRegressor
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import mean_absolute_error
-from sklearn.compose import ColumnTransformer
-from sklearn.preprocessing import OneHotEncoder
-from sklearn.pipeline import Pipeline
+import occupancy_store
+from fast_forecast import forecast_matrix, to_forecast_frame
+from forecast_cache import get_forecast_cache, make_forecast_key
+from model_registry import get_model_registry, registry_key
+from occupancy_series import OccupancySeries
+from tracing import span
 
 # ---------- I/O ----------
-def load_occupancy_csv(csv_path: str) -> pd.DataFrame:
+def load_occupancy_csv(
+    csv_path: str,
+    columns: list[str] | None = None,
+    start=None,
+    end=None,
+    lookback_days: int | None = None,
+    stream: bool = False,
+    use_cache: bool = True,
+) -> pd.DataFrame:
+    """
+    讀入住率 CSV（date 已轉 datetime、依日期排序）
+
+    裝了 pyarrow 時走 occupancy_store：第一次轉成 Arrow 快取，之後 memory-map 讀；
+    columns / start / end / lookback_days 只讀需要的欄位與日期範圍，stream=True 逐塊轉換大檔。
+    """
     p = Path(csv_path)
     if not p.exists():
         raise FileNotFoundError(f"CSV not found: {p.resolve()}")
-    df = pd.read_csv(p)
+    with span("load_occupancy_csv", file=p.name) as sp:
+        df = None
+        if use_cache and occupancy_store.available():
+            try:
+                df = occupancy_store.read_occupancy(
+                    p, columns=columns, start=start, end=end, lookback_days=lookback_days, stream=stream
+                )
+                sp.set(source="arrow")
+            except OSError:  # 快取寫不進去（唯讀目錄、磁碟滿）→ 直接讀 CSV
+                df = None
+        if df is None:
+            df = _read_occupancy_pandas(p, columns, start, end, lookback_days)
+            sp.set(source="pandas")
+        sp.set(rows=len(df))
+    return df
+
+def _read_occupancy_pandas(p: Path, columns, start, end, lookback_days) -> pd.DataFrame:
+    keep = None if columns is None else {"date", "occupancy_pct", *columns}
+    df = pd.read_csv(p, usecols=None if keep is None else lambda c: c.strip().lower() in keep)
     # normalize columns
     df.columns = [c.strip().lower() for c in df.columns]
     if "date" not in df.columns or "occupancy_pct" not in df.columns:
         raise ValueError("CSV 需要包含 columns: 'date','occupancy_pct'")
     df["date"] = pd.to_datetime(df["date"])
     df = df.sort_values("date").reset_index(drop=True)
-    return df
+    if start is not None:
+        df = df[df["date"] >= pd.Timestamp(start)]
+    if end is not None:
+        df = df[df["date"] <= pd.Timestamp(end)]
+    if lookback_days is not None and lookback_days > 0 and len(df):
+        df = df[df["date"] >= df["date"].max() - pd.Timedelta(days=int(lookback_days) - 1)]
+    if columns is not None:
+        df = df[["date"] + [c for c in columns if c != "date"]]
+    return df.reset_index(drop=True)
 
 # ---------- Prophet ----------
-def fit_prophet_and_forecast(df: pd.DataFrame, periods: int = 7) -> pd.DataFrame:
-    """fit Prophet on occupancy history and forecast next N days"""
-    tmp = df.rename(columns={"date":"ds","occupancy_pct":"y"})[["ds","y"]].copy()
-    model = Prophet(daily_seasonality=True, weekly_seasonality=True, yearly_seasonality=True)
-    model.fit(tmp)
-    future = model.make_future_dataframe(periods=periods)
-    fcst = model.predict(future)[["ds","yhat","yhat_lower","yhat_upper"]]
-    fcst = fcst.tail(periods).rename(columns={
+def fit_prophet_and_forecast(
+    df: pd.DataFrame,
+    periods: int = 7,
+    daily_seasonality: bool = True,
+    weekly_seasonality: bool = True,
+    yearly_seasonality: bool = True,
+    use_cache: bool = True,
+    fast: bool | None = None,
+    series_key: str | None = None,
+) -> pd.DataFrame:
+    """
+    fit Prophet on occupancy history and forecast next N days
+
+    use_cache=True：同一段序列 + 同參數 → 直接回傳快取結果（見 forecast_cache.py）
+    fast：快速模式（見 fit_prophet_model）；None → 看環境變數 PROPHET_FAST_FIT=1
+    series_key：快速模式 warm start 用的序列身分（見 fit_prophet_model）
+    """
+    params = dict(
+        periods=int(periods),
+        daily_seasonality=daily_seasonality,
+        weekly_seasonality=weekly_seasonality,
+        yearly_seasonality=yearly_seasonality,
+        fast=prophet_fast_default() if fast is None else bool(fast),
+    )
+    with span("fit_prophet_and_forecast", rows=len(df), periods=params["periods"], fast=params["fast"]):
+        if use_cache:
+            key = make_forecast_key(df, model="prophet", **params)
+            return get_forecast_cache().get_or_compute(key, lambda: _fit_prophet(df, series_key=series_key, **params))
+        return _fit_prophet(df, series_key=series_key, **params)
+
+
+def prophet_fast_default() -> bool:
+    return os.getenv("PROPHET_FAST_FIT", "0").lower() in ("1", "true", "yes")
+
+
+def fit_prophet_fast(df: pd.DataFrame, periods: int = 7, **kwargs) -> pd.DataFrame:
+    """fit_prophet_and_forecast 的快速模式（backends 的 "prophet_fast"）"""
+    return fit_prophet_and_forecast(df, periods=periods, fast=True, **kwargs)
+
+
+def _fit_prophet(
+    df: pd.DataFrame,
+    periods: int = 7,
+    daily_seasonality: bool = True,
+    weekly_seasonality: bool = True,
+    yearly_seasonality: bool = True,
+    fast: bool = False,
+    series_key: str | None = None,
+) -> pd.DataFrame:
+    return fit_prophet_model(
+        df,
+        periods=periods,
+        daily_seasonality=daily_seasonality,
+        weekly_seasonality=weekly_seasonality,
+        yearly_seasonality=yearly_seasonality,
+        fast=fast,
+        series_key=series_key,
+    )[1]
+
+def auto_seasonality(dates) -> dict:
+    """
+    依取樣頻率與歷史長度挑季節項：
+    - daily：只有資料比「天」更細才有意義
+    - weekly：至少兩個完整週期（14 天）且資料不比一天粗
+    - yearly：至少一個完整週期（365 天）；回測上比 Prophet 建議的兩年門檻準，
+      一年以內（例如 14 天 lookback）則只是白白拖慢最佳化
+    """
+    sec = np.unique(pd.DatetimeIndex(dates).dropna().to_numpy(dtype="datetime64[s]").astype(np.int64))
+    if len(sec) < 2:
+        return dict(daily_seasonality=False, weekly_seasonality=False, yearly_seasonality=False)
+    step_days = float(np.median(np.diff(sec))) / 86_400
+    span_days = float(sec[-1] - sec[0]) / 86_400 + step_days
+    return dict(
+        daily_seasonality=step_days < 1.0,
+        weekly_seasonality=step_days <= 1.0 and span_days >= 14,
+        yearly_seasonality=span_days >= 365,
+    )
+
+# 快速模式的 warm start：同一條序列（series key）+ 同樣的季節項 / changepoint 數 → 上一次 fit 的結果當起始值
+# 不同序列互不沿用（否則結果會跟呼叫順序有關）；LRU，最多 PROPHET_WARM_MAX 組（長駐的 Streamlit / service 不會一直長）
+_WARM_PARAMS: OrderedDict[tuple, dict] = OrderedDict()
+_WARM_LOCK = threading.Lock()
+_WARM_MAX = int(os.getenv("PROPHET_WARM_MAX", "256"))
+
+
+def _warm_get(key: tuple) -> dict | None:
+    with _WARM_LOCK:
+        params = _WARM_PARAMS.get(key)
+        if params is not None:
+            _WARM_PARAMS.move_to_end(key)
+        return params
+
+
+def _warm_put(key: tuple, params: dict) -> None:
+    with _WARM_LOCK:
+        _WARM_PARAMS[key] = params
+        _WARM_PARAMS.move_to_end(key)
+        while len(_WARM_PARAMS) > _WARM_MAX:
+            _WARM_PARAMS.popitem(last=False)
+
+_Z80 = 1.2816  # Prophet 預設 interval_width=0.8
+
+def _series_identity(df) -> str | None:
+    """property_id / room_type 欄位各只有一個值 → 當序列身分；認不出來 → None"""
+    if not isinstance(df, pd.DataFrame):
+        return None
+    parts = []
+    for col in ("property_id", "room_type"):
+        if col in df.columns:
+            vals = df[col].dropna().unique()
+            if len(vals) != 1:
+                return None
+            parts.append(str(vals[0]))
+    return "|".join(parts) or None
+
+def fit_prophet_model(
+    df: pd.DataFrame,
+    periods: int = 7,
+    daily_seasonality: bool = True,
+    weekly_seasonality: bool = True,
+    yearly_seasonality: bool = True,
+    init: dict | None = None,
+    fast: bool = False,
+    series_key: str | None = None,
+):
+    """
+    同 fit_prophet_and_forecast（不經快取），但連 Prophet 物件一起回傳 → (model, forecast_df)
+    init：warm start 用的起始參數（prophet_warm_start_params 的輸出）
+    df 也可以是 OccupancySeries
+
+    fast=True：
+    - 季節項由 auto_seasonality 決定（傳 False 的仍然關閉）
+    - 沒給 init → 用「同一條序列」同形狀的上一次 fit 當 Stan 起始值；形狀對不上就退回 cold fit。
+      序列身分 = series_key，沒給就看 df 的 property_id / room_type；兩者都沒有 → 不 warm start
+    - uncertainty_samples=0，只預測未來 periods 天；occ_lo / occ_hi 改用
+      yhat ± z·sigma_obs（觀測雜訊的 80% 區間，不含趨勢不確定性，通常比完整模式窄）
+    """
+    from prophet import Prophet
+
+    series_key = series_key if series_key is not None else _series_identity(df)
+    # 只組 ds / y 兩欄（Prophet.fit 自己會再 copy 一次，這裡不必先複製整張表）
+    if isinstance(df, OccupancySeries):
+        tmp = df.to_prophet_frame()
+    else:
+        tmp = pd.DataFrame({"ds": df["date"].to_numpy(), "y": df["occupancy_pct"].to_numpy()})
+    seasonality = dict(
+        daily_seasonality=daily_seasonality,
+        weekly_seasonality=weekly_seasonality,
+        yearly_seasonality=yearly_seasonality,
+    )
+    if not fast:
+        model = Prophet(**seasonality)
+        if init is not None:
+            model.fit(tmp, init=init)
+        else:
+            model.fit(tmp)
+        future = model.make_future_dataframe(periods=periods)
+        fcst = model.predict(future)[["ds","yhat","yhat_lower","yhat_upper"]].tail(periods)
+    else:
+        auto = auto_seasonality(tmp["ds"])
+        seasonality = {k: bool(v) and auto[k] for k, v in seasonality.items()}
+        n_obs = int(tmp["y"].notna().sum())
+        # Prophet 的 changepoint 數規則：min(25, 0.8·n - 1)
+        warm_key = (series_key, *seasonality.values(), min(25, int(n_obs * 0.8) - 1))
+        if init is None and series_key is not None:
+            init = _warm_get(warm_key)
+        model = Prophet(**seasonality, uncertainty_samples=0)
+        try:
+            if init is not None:
+                model.fit(tmp, init=init)
+            else:
+                model.fit(tmp)
+        except Exception:
+            if init is None:
+                raise
+            model = Prophet(**seasonality, uncertainty_samples=0)
+            model.fit(tmp)
+        if series_key is not None:
+            _warm_put(warm_key, prophet_warm_start_params(model))
+        fcst = model.predict(model.make_future_dataframe(periods=periods, include_history=False))
+        band = _Z80 * float(model.params["sigma_obs"][0][0]) * float(model.y_scale)
+        fcst = fcst[["ds", "yhat"]].assign(yhat_lower=fcst["yhat"] - band, yhat_upper=fcst["yhat"] + band)
+    fcst = fcst.rename(columns={
         "ds":"date",
         "yhat":"occ_pred",
         "yhat_lower":"occ_lo",
@@ -47,7 +266,26 @@ def fit_prophet_and_forecast(df: pd.DataFrame, periods: int = 7) -> pd.DataFrame
     # clip 0~100
     for c in ["occ_pred","occ_lo","occ_hi"]:
         fcst[c] = fcst[c].clip(0, 100)
-    return fcst
+    return model, fcst
+
+def prophet_warm_start_params(model) -> dict:
+    """取出已 fit 模型的參數，當下一次 fit 的 Stan 起始值（Prophet 官方 warm start 寫法）"""
+    res = {name: float(model.params[name][0][0]) for name in ("k", "m", "sigma_obs")}
+    for name in ("delta", "beta"):
+        res[name] = model.params[name][0]
+    return res
+
+def fallback_forecast(df: pd.DataFrame, periods: int = 7, window: int = 14) -> pd.DataFrame:
+    """最簡 fallback：近 window 天均值攤平成未來 N 天（欄位同 Prophet 輸出）"""
+    hist = df.sort_values("date")
+    avg = float(hist.tail(window)["occupancy_pct"].mean())
+    start = hist["date"].max() + pd.Timedelta(days=1)
+    return pd.DataFrame({
+        "date": pd.date_range(start, periods=periods, freq="D"),
+        "occ_pred": avg,
+        "occ_lo": avg,
+        "occ_hi": avg,
+    })
 
 def summarize_forecast(fcst: pd.DataFrame) -> dict:
     return {
@@ -58,80 +296,205 @@ def summarize_forecast(fcst: pd.DataFrame) -> dict:
         "end": fcst["date"].max().date().isoformat(),
     }
 
+# ---------- Holt-Winters / NumPy fast path ----------
+def fit_hw_and_forecast(df: pd.DataFrame, periods: int = 7, method: str = "hw") -> pd.DataFrame:
+    """
+    不用 Prophet 的快速預測（fast_forecast.py）；欄位同 fit_prophet_and_forecast。
+    method: "hw"（Holt-Winters）/ "seasonal_naive" / "ses"
+    """
+    s = df.set_index("date")["occupancy_pct"].sort_index()
+    s = s[~s.index.duplicated(keep="last")].asfreq("D")  # 補齊缺日（NaN 由引擎補值）
+    pred, lo, hi = forecast_matrix(s.to_numpy()[None, :], periods=periods, method=method)
+    return to_forecast_frame(pred, lo, hi, last_date=s.index.max())
+
+def summarize_forecast_generic(fcst: pd.DataFrame) -> dict:
+    """同 summarize_forecast，但也吃 Prophet 原生欄位（ds/yhat）"""
+    renamed = fcst.rename(columns={"ds": "date", "yhat": "occ_pred"})
+    if "date" not in renamed.columns:
+        renamed = renamed.rename_axis("date").reset_index()
+    renamed["date"] = pd.to_datetime(renamed["date"])
+    return summarize_forecast(renamed)
+
 # ---------- XGBoost pricing ----------
+PRICING_FEATURES = ["occupancy_pct","comp_mean","dow","is_weekend","month"]
+
+_PRICING_INPUTS = ("date", "occupancy_pct", "price", "comp_mean", "comp_min", "comp_max")
+
 def _build_pricing_features(df: pd.DataFrame) -> pd.DataFrame:
-    out = df.copy()
+    # 只複製用得到的欄位（不是整張 history）；明確 copy，不依賴 pandas 版本的 copy-on-write
+    out = df[[c for c in _PRICING_INPUTS if c in df.columns]].copy()
     # derive competitor mean if provided min/max
     if "comp_mean" not in out.columns:
         if "comp_min" in out.columns and "comp_max" in out.columns:
             out["comp_mean"] = (out["comp_min"] + out["comp_max"]) / 2.0
         else:
             out["comp_mean"] = np.nan  # will be imputed at inference
-    # date features
+    return _add_date_features(out)
+
+def _add_date_features(out: pd.DataFrame) -> pd.DataFrame:
+    # date features（in-place；呼叫端負責 copy）
     out["dow"] = out["date"].dt.dayofweek
     out["is_weekend"] = (out["dow"]>=4).astype(int)
     out["month"] = out["date"].dt.month
     return out
 
-def train_xgb_pricing_model(history: pd.DataFrame) -> tuple[Pipeline, float] | None:
+XGB_DEFAULT_PARAMS = dict(
+    n_estimators=300,
+    max_depth=5,
+    learning_rate=0.07,
+    subsample=0.9,
+    colsample_bytree=0.9,
+    random_state=42,
+)
+
+def train_xgb_pricing_model(history: pd.DataFrame, params: dict | None = None) -> tuple[Pipeline, float] | None:
     """
     Train an XGB regressor if 'price' exists in history.
     Returns (pipeline, mae) or None if price column missing.
+
+    params：覆寫 XGB_DEFAULT_PARAMS（xgb_tuning.py 調出來的設定）
     """
     if "price" not in history.columns:
         return None
 
+    from xgboost import XGBRegressor
+    from sklearn.metrics import mean_absolute_error
+    from sklearn.compose import ColumnTransformer
+    from sklearn.pipeline import Pipeline
+
     df = _build_pricing_features(history)
-    feats = ["occupancy_pct","comp_mean","dow","is_weekend","month"]
-    df = df.dropna(subset=["price"])  # require price labels
+    feats = PRICING_FEATURES
+    df = df.dropna(subset=["price"]).sort_values("date", kind="stable")  # require price labels
     X = df[feats]
     y = df["price"].astype(float)
 
     pre = ColumnTransformer(
-        transformers=[("passthrough","passthrough", ["occupancy_pct","comp_mean","dow","is_weekend","month"])]
+        transformers=[("passthrough","passthrough", feats)]
     )
 
-    model = XGBRegressor(
-        n_estimators=300,
-        max_depth=5,
-        learning_rate=0.07,
-        subsample=0.9,
-        colsample_bytree=0.9,
-        random_state=42
-    )
+    model = XGBRegressor(**{**XGB_DEFAULT_PARAMS, **(params or {})})
 
     pipe = Pipeline(steps=[("prep", pre), ("model", model)])
-    X_tr, X_te, y_tr, y_te = train_test_split(X, y, test_size=0.25, random_state=42)
+    # 時間切分：最後 25% 的日期當 holdout（random split 會拿未來資料訓練，MAE 偏樂觀）
+    cut = min(len(df) - 1, max(1, int(len(df) * 0.75)))
+    X_tr, X_te, y_tr, y_te = X.iloc[:cut], X.iloc[cut:], y.iloc[:cut], y.iloc[cut:]
     pipe.fit(X_tr, y_tr)
     pred = pipe.predict(X_te)
     mae = float(mean_absolute_error(y_te, pred))
     return pipe, mae
 
+def get_pricing_model(history: pd.DataFrame, key: str | None = None, force: bool = False) -> tuple[Pipeline, float] | None:
+    """
+    經 model registry 取得定價模型：資料指紋沒變就直接載入，有新標籤/過期才重訓（force=True 一定重訓）。
+    key=None → registry_key(history)（依 property_id / room_type 或資料本身）。
+    這個 key 有調過參（xgb_tuning.py）→ 重訓時沿用調好的設定。
+    Returns (pipeline, mae) or None if price column missing.
+    """
+    key = key or registry_key(history)
+    with span("get_pricing_model", rows=len(history), key=key):
+        registry = get_model_registry()
+        params = registry.load_params(key)
+        return registry.get_or_train(
+            history,
+            train_fn=lambda h: train_xgb_pricing_model(h, params=params),
+            feats=PRICING_FEATURES,
+            key=key,
+            params=params,
+            force=force,
+        )
+
+def _comp_mean_scalar(comp_min, comp_max, anchor_comp_mean):
+    if anchor_comp_mean is not None:
+        return anchor_comp_mean
+    if comp_min is not None and comp_max is not None:
+        return (comp_min + comp_max) / 2.0
+    return None
+
+def price_arrays(model_or_none, occ, comp_mean, dates) -> tuple[np.ndarray, np.ndarray, str]:
+    """
+    定價核心（純陣列）：occ / comp_mean / dates 等長 → (mid, band, basis)
+    infer_price_grid 與 scenarios.scenario_sweep 共用；predict 只呼叫一次。
+    """
+    occ = np.asarray(occ, dtype=float)
+    comp_mean = np.asarray(comp_mean, dtype=float)
+    if model_or_none is not None and not np.isnan(comp_mean).all():
+        X = pd.DataFrame({"occupancy_pct": occ, "comp_mean": comp_mean, "date": pd.DatetimeIndex(dates)})
+        X = _add_date_features(X)[PRICING_FEATURES]
+        mid = np.asarray(model_or_none.predict(X), dtype=float)
+        return mid, np.maximum(8.0, mid * 0.08), "xgboost"  # ±8% band
+    # rule-of-thumb：competitor mean × (0.9 + 0.6 × occ)
+    base = np.where(np.isnan(comp_mean), 150.0, comp_mean)
+    mid = base * (0.9 + 0.6 * (occ / 100.0))
+    return mid, np.maximum(10.0, mid * 0.12), "rule"
+
+def infer_price_grid(
+    model_or_none,
+    fcst: pd.DataFrame,
+    comp_rates: pd.DataFrame | None = None,
+    comp_min: float | None = None,
+    comp_max: float | None = None,
+    anchor_comp_mean: float | None = None,
+) -> pd.DataFrame:
+    """
+    批次定價：每個預測日（可再乘上房型）一列，特徵矩陣只建一次、predict 只呼叫一次。
+
+    - fcst：至少要 date, occ_pred（可帶 room_type）
+    - comp_rates：競品價表，欄位 date 及/或 room_type + comp_mean（或 comp_min/comp_max）；
+      fcst 沒有 room_type 而 comp_rates 有 → 展開成 date × room_type
+    - comp_min / comp_max / anchor_comp_mean：競品表沒涵蓋到的列用這個純量補
+    回傳 fcst 的欄位 + comp_mean, price_mid, price_lo, price_hi, basis
+    """
+    grid = fcst.reset_index(drop=True)
+    if comp_rates is not None and len(comp_rates):
+        rates = comp_rates.copy()
+        if "comp_mean" not in rates.columns:
+            rates["comp_mean"] = (rates["comp_min"] + rates["comp_max"]) / 2.0
+        on = [c for c in ("date", "room_type") if c in rates.columns and c in grid.columns]
+        extra = [c for c in ("room_type",) if c in rates.columns and c not in grid.columns]
+        rates = rates[on + extra + ["comp_mean"]].drop_duplicates(on + extra, keep="last")
+        grid = grid.merge(rates, on=on, how="left") if on else grid.merge(rates, how="cross")
+    else:
+        grid["comp_mean"] = np.nan
+
+    fill = _comp_mean_scalar(comp_min, comp_max, anchor_comp_mean)
+    if fill is not None:
+        grid["comp_mean"] = grid["comp_mean"].fillna(fill)
+
+    mid, band, basis = price_arrays(
+        model_or_none, grid["occ_pred"].to_numpy(dtype=float), grid["comp_mean"].to_numpy(dtype=float), grid["date"]
+    )
+    grid["price_mid"] = mid
+    grid["price_lo"] = mid - band
+    grid["price_hi"] = mid + band
+    grid["basis"] = basis
+    return grid
+
 def infer_price_range(
     model_or_none,
     avg_occ: float,
     comp_min: float | None,
     comp_max: float | None,
-    anchor_comp_mean: float | None = None
+    anchor_comp_mean: float | None = None,
+    dates=None,
 ) -> dict:
     """
     If model available → use it to predict; else use hybrid rule.
     Returns dict with price_mid, lo, hi.
+
+    dates：要定價的日期（預設明天起 7 天）；模型用真實的 dow/month，不再用固定佔位值。
     """
-    # derive competitor mean
-    comp_mean = anchor_comp_mean
-    if comp_mean is None:
-        if comp_min is not None and comp_max is not None:
-            comp_mean = (comp_min + comp_max) / 2.0
+    comp_mean = _comp_mean_scalar(comp_min, comp_max, anchor_comp_mean)
 
     if model_or_none is not None and comp_mean is not None:
-        # ML prediction
-        X = pd.DataFrame([{
-            "occupancy_pct": avg_occ,
-            "comp_mean": comp_mean,
-            "dow": 5, "is_weekend": 1, "month": 8  # neutral placeholders for "next week"
-        }])
-        price_mid = float(model_or_none.predict(X)[0])
+        # ML prediction（整週一次 predict，取平均）
+        if dates is None:
+            dates = pd.date_range(pd.Timestamp.today().normalize() + pd.Timedelta(days=1), periods=7, freq="D")
+        grid = infer_price_grid(
+            model_or_none,
+            pd.DataFrame({"date": pd.to_datetime(pd.Series(dates)), "occ_pred": avg_occ}),
+            anchor_comp_mean=comp_mean,
+        )
+        price_mid = float(grid["price_mid"].mean())
         band = max(8.0, price_mid * 0.08)  # ±8% band
         return {"price_mid": price_mid, "lo": price_mid - band, "hi": price_mid + band, "basis": "xgboost"}
     else:
@@ -147,6 +510,12 @@ def infer_price_range(
 
 # ================== WRAPPERS FOR STREAMLIT ==================
 
+def _next_week(history: pd.DataFrame, periods: int = 7):
+    """歷史最後一天之後的 N 天（沒有 date 欄位就回 None → 用今天起算）"""
+    if "date" not in history.columns or history["date"].isna().all():
+        return None
+    return pd.date_range(history["date"].max() + pd.Timedelta(days=1), periods=periods, freq="D")
+
 def simple_occupancy_forecast(
     df: pd.DataFrame,
     lookback_days: int | None = None,
@@ -197,12 +566,14 @@ def dynamic_pricing(
     comp_min: float | None = None,
     comp_max: float | None = None,
     anchor_comp_mean: float | None = None,
+    model_key: str | None = None,
 ) -> dict:
     """
     訓練 XGB（若有 price 標籤），否則用規則法。
+    模型經 registry 快取，同一份資料不會重訓（model_key 區分不同飯店/房型；None → 由資料推導）。
     回傳 {price_mid, lo, hi, basis, avg_occ, model_mae}
     """
-    trained = train_xgb_pricing_model(history)
+    trained = get_pricing_model(history, key=model_key)
     model, mae = (trained if trained is not None else (None, None))
 
     # 近一週平均入住率（fallback: 全體平均 or 70）
@@ -220,6 +591,7 @@ def dynamic_pricing(
         comp_min=comp_min,
         comp_max=comp_max,
         anchor_comp_mean=anchor_comp_mean,
+        dates=_next_week(history),
     )
     out["avg_occ"] = avg_occ
     out["model_mae"] = mae
@@ -260,47 +632,77 @@ def simple_occupancy_forecast(
     else:
         boost_pct = float(boost_pct)
 
-    work = df.copy()
-    if lookback_days is not None and lookback_days > 0:
-        cutoff = work["date"].max() - pd.Timedelta(days=int(lookback_days) - 1)
-        work = work[work["date"] >= cutoff].copy()
+    with span("simple_occupancy_forecast", rows=len(df), lookback_days=lookback_days, periods=periods):
+        # 不複製輸入：OccupancySeries → 零拷貝 view；DataFrame → 篩選本身就是新物件
+        if isinstance(df, OccupancySeries):
+            work = df.window(lookback_days=lookback_days)
+        elif lookback_days is not None and lookback_days > 0:
+            cutoff = df["date"].max() - pd.Timedelta(days=int(lookback_days) - 1)
+            work = df[df["date"] >= cutoff]
+        else:
+            work = df
+
+        fcst = fit_prophet_and_forecast(work, periods=periods)
+        with span("apply_occupancy_boost", boost_pct=boost_pct):
+            return apply_occupancy_boost(fcst, boost_pct)
 
-    fcst = fit_prophet_and_forecast(work, periods=periods)
 
+def apply_occupancy_boost(fcst, boost_pct=0.0):
+    """fit 之後的便宜後處理：活動/季節加成（乘法，clip 0~100）→ (fcst, summary)；不改動輸入"""
+    boost_pct = float(boost_pct or 0.0)
     if boost_pct:
         factor = 1.0 + (boost_pct / 100.0)
-        for c in ["occ_pred", "occ_lo", "occ_hi"]:
-            fcst[c] = (fcst[c] * factor).clip(0, 100)
+        fcst = fcst.assign(**{c: (fcst[c] * factor).clip(0, 100) for c in ["occ_pred", "occ_lo", "occ_hi"]})
+    return fcst, summarize_forecast(fcst)
 
-    summary = summarize_forecast(fcst)
-    return fcst, summary
 
+def recent_avg_occ(history) -> float:
+    """定價用的入住率錨點：最近 7 天平均（缺值退回全期平均；沒有欄位 → 70）"""
+    if "occupancy_pct" not in history.columns:
+        return 70.0
+    recent = history.sort_values("date").tail(7)
+    avg_occ = float(recent["occupancy_pct"].mean())
+    if np.isnan(avg_occ):
+        avg_occ = float(history["occupancy_pct"].mean())
+    return avg_occ
 
-def dynamic_pricing(history, comp_min=None, comp_max=None, anchor_comp_mean=None):
-    """回傳 dict：{'price_mid','lo','hi','basis','avg_occ','model_mae'}"""
-    trained = train_xgb_pricing_model(history)
-    model, mae = (trained if trained is not None else (None, None))
-
-    if "occupancy_pct" in history.columns:
-        recent = history.sort_values("date").tail(7)
-        avg_occ = float(recent["occupancy_pct"].mean())
-        if np.isnan(avg_occ):
-            avg_occ = float(history["occupancy_pct"].mean())
-    else:
-        avg_occ = 70.0
 
+def price_with_model(trained, avg_occ, dates, comp_min=None, comp_max=None, anchor_comp_mean=None):
+    """
+    fit 之後的便宜後處理：用已訓練好的 (model, mae)（或 None）算價帶。
+    競品價變動只需要重跑這一步。
+    """
+    model, mae = (trained if trained is not None else (None, None))
     out = infer_price_range(
         model_or_none=model,
         avg_occ=avg_occ,
         comp_min=comp_min,
         comp_max=comp_max,
         anchor_comp_mean=anchor_comp_mean,
+        dates=dates,
     )
     out["avg_occ"] = avg_occ
     out["model_mae"] = mae
     return out
 
 
+def dynamic_pricing(history, comp_min=None, comp_max=None, anchor_comp_mean=None, model_key=None):
+    """回傳 dict：{'price_mid','lo','hi','basis','avg_occ','model_mae'}（模型經 registry 快取）"""
+    with span("dynamic_pricing", rows=len(history), key=model_key) as sp:
+        trained = get_pricing_model(history, key=model_key)
+        with span("price_with_model"):
+            out = price_with_model(
+                trained,
+                recent_avg_occ(history),
+                _next_week(history),
+                comp_min=comp_min,
+                comp_max=comp_max,
+                anchor_comp_mean=anchor_comp_mean,
+            )
+        sp.set(basis=out["basis"])
+    return out
+
+
 def dynamic_price_suggestion(history, comp_min=None, comp_max=None, anchor_comp_mean=None):
     """
     ⚓ 固定回兩個值，給 streamlit 用：
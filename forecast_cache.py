@@ -0,0 +1,175 @@
+# forecast_cache.py
+"""
+Prophet 預測結果快取（content-addressed）
+
+key = hash(輸入序列) + 預測參數（periods / seasonality / lookback 後的視窗）
+- 記憶體 LRU 層：同一個 process 內重複問同一間飯店 → 直接查表
+- 磁碟層（可選）：設定 FORECAST_CACHE_DIR 後，重開程式也能命中
+- 依筆數（max_entries）與存活時間（max_age_s）淘汰
+"""
+from __future__ import annotations
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import pandas as pd
+
+from tracing import current
+
+
+def series_fingerprint(df: pd.DataFrame, cols=("date", "occupancy_pct")) -> str:
+    """對序列內容做 hash（與 index、欄位順序無關）；OccupancySeries 用自己的 fingerprint()"""
+    if hasattr(df, "fingerprint"):
+        return df.fingerprint()
+    part = df[[c for c in cols if c in df.columns]]
+    digest = pd.util.hash_pandas_object(part, index=False).values.tobytes()
+    return hashlib.sha1(digest).hexdigest()
+
+
+def make_forecast_key(df: pd.DataFrame, **params) -> str:
+    """序列 hash + 參數 → 快取 key"""
+    raw = series_fingerprint(df) + json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class ForecastCache:
+    """兩層快取：記憶體 LRU + 可選磁碟層（pickle）"""
+
+    def __init__(
+        self,
+        max_entries: int = 128,
+        max_age_s: float | None = None,
+        disk_dir: str | None = None,
+        max_disk_entries: int = 1024,
+    ):
+        self.max_entries = int(max_entries)
+        self.max_age_s = max_age_s
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.max_disk_entries = int(max_disk_entries)
+        self._mem: OrderedDict[str, tuple[float, pd.DataFrame]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if self.disk_dir is not None:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+
+    # ---------- 內部 ----------
+    def _expired(self, ts: float) -> bool:
+        return self.max_age_s is not None and (time.time() - ts) > self.max_age_s
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / f"{key}.pkl"
+
+    def _mem_put(self, key: str, ts: float, fcst: pd.DataFrame) -> None:
+        self._mem[key] = (ts, fcst)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+            self.evictions += 1
+
+    def _disk_get(self, key: str):
+        if self.disk_dir is None:
+            return None
+        p = self._disk_path(key)
+        if not p.exists():
+            return None
+        ts = p.stat().st_mtime
+        if self._expired(ts):
+            p.unlink(missing_ok=True)
+            return None
+        try:
+            return ts, pd.read_pickle(p)
+        except Exception:
+            # 壞檔就當 miss
+            p.unlink(missing_ok=True)
+            return None
+
+    def _disk_put(self, key: str, fcst: pd.DataFrame) -> None:
+        if self.disk_dir is None:
+            return
+        tmp = self._disk_path(key).with_suffix(".tmp")
+        fcst.to_pickle(tmp)
+        os.replace(tmp, self._disk_path(key))
+        files = sorted(self.disk_dir.glob("*.pkl"), key=lambda f: f.stat().st_mtime)
+        for f in files[: max(0, len(files) - self.max_disk_entries)]:
+            f.unlink(missing_ok=True)
+            self.evictions += 1
+
+    # ---------- 對外 ----------
+    def get(self, key: str) -> pd.DataFrame | None:
+        """命中回傳 copy（呼叫端可放心改欄位，例如 boost）"""
+        with self._lock:
+            item = self._mem.get(key)
+            if item is not None and self._expired(item[0]):
+                del self._mem[key]
+                self.evictions += 1
+                item = None
+            if item is not None:
+                self._mem.move_to_end(key)
+                self.hits += 1
+                return item[1].copy()
+
+            item = self._disk_get(key)
+            if item is not None:
+                self._mem_put(key, item[0], item[1])
+                self.hits += 1
+                self.disk_hits += 1
+                return item[1].copy()
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, fcst: pd.DataFrame) -> None:
+        with self._lock:
+            self._mem_put(key, time.time(), fcst.copy())
+            self._disk_put(key, fcst)
+
+    def get_or_compute(self, key: str, compute) -> pd.DataFrame:
+        hit = self.get(key)
+        if hit is not None:
+            current().set(forecast_cache="hit")
+            return hit
+        current().set(forecast_cache="miss")
+        fcst = compute()
+        self.put(key, fcst)
+        return fcst.copy()
+
+    def clear(self, disk: bool = False) -> None:
+        with self._lock:
+            self._mem.clear()
+            if disk and self.disk_dir is not None:
+                for f in self.disk_dir.glob("*.pkl"):
+                    f.unlink(missing_ok=True)
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._mem),
+        }
+
+
+_DEFAULT_CACHE: ForecastCache | None = None
+
+
+def get_forecast_cache() -> ForecastCache:
+    """全域預設快取；可用環境變數調整：
+    FORECAST_CACHE_DIR（磁碟層路徑）、FORECAST_CACHE_MAX（記憶體筆數）、FORECAST_CACHE_TTL（秒）
+    """
+    global _DEFAULT_CACHE
+    if _DEFAULT_CACHE is None:
+        ttl = os.getenv("FORECAST_CACHE_TTL")
+        _DEFAULT_CACHE = ForecastCache(
+            max_entries=int(os.getenv("FORECAST_CACHE_MAX", "128")),
+            max_age_s=float(ttl) if ttl else None,
+            disk_dir=os.getenv("FORECAST_CACHE_DIR") or None,
+        )
+    return _DEFAULT_CACHE
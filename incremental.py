@@ -0,0 +1,194 @@
+# incremental.py
+"""
+每日增量更新：新資料 append 進歷史 + 模型 warm start
+
+- append_occupancy：新列依 date（及 property_id / room_type）去重後寫進 CSV 與 Arrow 快取
+- Prophet：用上一次 fit 的參數當 Stan 起始值（init=...），收斂步數少很多；
+  模型存成 model_artifacts 格式（PROPHET_MODEL_DIR/<key>），重開 process 也能 warm start
+- XGBoost：只用「新的有標籤列」在舊 booster 上繼續 boosting extra_trees 棵，
+  不從頭訓練；成本跟新資料量成正比。樹數有上限：累積 max_increments 次、總樹數超過 max_trees
+  （預設 = 上次完整訓練樹數的 2 倍）、或距上次完整訓練超過 registry 的 max_age_days
+  → 改成完整重訓（推論延遲不會一直變長）
+
+    r = IncrementalRefresher("sample_data/occupancy_history.csv")
+    out = r.refresh(new_rows)   # {"appended", "forecast", "pricing_model", "warm_start"}
+"""
+from __future__ import annotations
+import hashlib
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import occupancy_store
+from data_utils import (
+    PRICING_FEATURES,
+    _build_pricing_features,
+    fit_prophet_model,
+    get_pricing_model,
+    load_occupancy_csv,
+    prophet_warm_start_params,
+)
+from model_artifacts import load_prophet, prophet_exists, save_prophet
+from model_registry import get_model_registry, registry_key, training_fingerprint
+
+DEDUP_KEYS = ("date", "property_id", "room_type")
+
+
+def append_occupancy(csv_path: str, new_rows: pd.DataFrame) -> pd.DataFrame:
+    """
+    新列寫進歷史；與既有列同 key（date [+ property_id / room_type]）者以新值為準。
+    回傳實際寫入的列（已轉好 date 型別）。
+    """
+    new = new_rows.copy()
+    new.columns = [c.strip().lower() for c in new.columns]
+    new["date"] = pd.to_datetime(new["date"])
+    keys = [k for k in DEDUP_KEYS if k in new.columns]
+    new = new.drop_duplicates(keys, keep="last")
+    if new.empty:
+        return new
+
+    # 只讀可能重疊的日期範圍（有 Arrow 快取時是 pushdown，不會讀整份）
+    existing = load_occupancy_csv(csv_path, start=new["date"].min(), end=new["date"].max())
+    overlap = existing.merge(new[keys], on=keys, how="inner") if len(existing) else existing
+    if overlap.empty:
+        occupancy_store.append_rows(csv_path, new)
+        return new
+
+    # 修正舊資料（少見）：整份重寫
+    full = load_occupancy_csv(csv_path, use_cache=False)
+    key_str = lambda df: df[keys].astype(str).agg("|".join, axis=1)
+    full = full[~key_str(full).isin(set(key_str(new)))]
+    full = pd.concat([full, new], ignore_index=True).sort_values("date")
+    full["date"] = full["date"].dt.strftime("%Y-%m-%d")
+    full.to_csv(csv_path, index=False)
+    return new
+
+
+class IncrementalRefresher:
+    """
+    單一序列（一間飯店 / 一個房型）的每日刷新；Prophet 與定價模型都會寫回磁碟
+    key=None → 第一次 refresh 時由資料推導（registry_key）；資料沒有 property_id 時用 CSV 路徑，
+    每天 append 新列 key 也不會變（重開 process 照樣接得上上次的模型）
+    """
+
+    def __init__(
+        self,
+        csv_path: str,
+        key: str | None = None,
+        periods: int = 7,
+        lookback_days: int | None = None,
+        extra_trees: int = 25,
+        max_increments: int = 14,
+        max_trees: int | None = None,
+    ):
+        self.csv_path = str(csv_path)
+        self.key = key
+        self.periods = int(periods)
+        self.lookback_days = lookback_days
+        self.extra_trees = int(extra_trees)
+        self.max_increments = int(max_increments)
+        self.max_trees = max_trees
+        self._prophet = None
+
+    @property
+    def prophet_prefix(self) -> str:
+        return os.path.join(os.getenv("PROPHET_MODEL_DIR", "models/prophet"), self.key)
+
+    # ---------- Prophet ----------
+    def _forecast(self, hist: pd.DataFrame):
+        if self._prophet is None and prophet_exists(self.prophet_prefix):
+            self._prophet = load_prophet(self.prophet_prefix)  # 上次 process 留下的模型（參數 mmap）
+        init = prophet_warm_start_params(self._prophet) if self._prophet is not None else None
+        warm = init is not None
+        try:
+            model, fcst = fit_prophet_model(hist, periods=self.periods, init=init)
+        except Exception:
+            if init is None:
+                raise
+            # 參數形狀對不上（例如 changepoint 數改變）→ 冷啟動
+            model, fcst = fit_prophet_model(hist, periods=self.periods)
+            warm = False
+        self._prophet = model
+        save_prophet(self.prophet_prefix, model)
+        return fcst, warm
+
+    # ---------- XGBoost ----------
+    def _needs_full_retrain(self, registry, meta: dict, n_trees: int) -> bool:
+        limit = self.max_trees if self.max_trees is not None else 2 * int(meta.get("base_trees") or n_trees)
+        return (
+            int(meta.get("increments", 0)) >= self.max_increments
+            or n_trees + self.extra_trees > limit
+            or registry._stale(meta)
+        )
+
+    def _continue_boosting(self, hist: pd.DataFrame, new_rows: pd.DataFrame):
+        """
+        舊 booster 接著用新標籤列訓練；沒有舊模型 → registry（第一次完整訓練）；
+        增量次數 / 樹數 / 年齡到上限 → 完整重訓
+        讀舊模型到寫回都拿著 registry 的 per-key 鎖：同時兩個更新不會互相蓋掉（舊的 booster 不會後寫贏）
+        """
+        registry = get_model_registry()
+        with registry._lock_for(self.key):
+            return self._continue_boosting_locked(registry, hist, new_rows)
+
+    def _continue_boosting_locked(self, registry, hist: pd.DataFrame, new_rows: pd.DataFrame):
+        prev = registry.load(self.key)
+        labeled = new_rows.dropna(subset=["price"]) if "price" in new_rows.columns else new_rows.iloc[0:0]
+        if prev is None or labeled.empty:
+            return get_pricing_model(hist, key=self.key)
+
+        from sklearn.pipeline import Pipeline
+        from xgboost import XGBRegressor
+
+        pipe, meta = prev
+        old = pipe.named_steps["model"]
+        n_trees = old.get_booster().num_boosted_rounds()
+        if self._needs_full_retrain(registry, meta, n_trees):
+            return get_pricing_model(hist, key=self.key, force=True)
+
+        feats = _build_pricing_features(labeled)[PRICING_FEATURES]
+        X_new = pipe.named_steps["prep"].transform(feats)
+        y_new = labeled["price"].astype(float).to_numpy()
+
+        # 更新前先在新資料上量 MAE（對舊模型來說是真正的 out-of-sample）
+        mae = float(np.mean(np.abs(old.predict(X_new) - y_new)))
+        params = {**old.get_params(), "n_estimators": self.extra_trees}
+        booster = XGBRegressor(**params)
+        booster.fit(X_new, y_new, xgb_model=old.get_booster())
+        # 新的 Pipeline（registry 快取裡的舊物件不動，其他 thread 手上的模型不會被換掉）
+        pipe = Pipeline(steps=[*pipe.steps[:-1], ("model", booster)])
+
+        registry.save(self.key, pipe, {
+            **meta,  # trained_at 維持上次完整訓練的時間 → max_age 到了照樣完整重訓
+            "fingerprint": training_fingerprint(hist, PRICING_FEATURES),
+            "mae": mae,
+            "n_rows": int(hist["price"].notna().sum()),
+            "updated_at": time.time(),
+            "increments": int(meta.get("increments", 0)) + 1,
+            "base_trees": int(meta.get("base_trees") or n_trees),  # 上次完整訓練的樹數
+            "incremental_rows": int(len(labeled)),
+        })
+        return pipe, mae
+
+    # ---------- 對外 ----------
+    def refresh(self, new_rows: pd.DataFrame | None = None) -> dict:
+        appended = append_occupancy(self.csv_path, new_rows) if new_rows is not None else pd.DataFrame()
+        hist = load_occupancy_csv(self.csv_path)
+        if self.key is None:
+            path = os.path.abspath(self.csv_path).encode("utf-8")
+            self.key = registry_key(hist, fallback=f"file-{hashlib.sha1(path).hexdigest()[:12]}")
+        window = hist
+        if self.lookback_days is not None and self.lookback_days > 0:
+            window = hist[hist["date"] >= hist["date"].max() - pd.Timedelta(days=int(self.lookback_days) - 1)]
+        fcst, warm = self._forecast(window)
+        pricing = None
+        if "price" in hist.columns:
+            pricing = self._continue_boosting(hist, appended)
+        return {
+            "appended": int(len(appended)),
+            "forecast": fcst,
+            "pricing_model": pricing,
+            "warm_start": warm,
+        }
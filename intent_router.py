@@ -0,0 +1,163 @@
+# intent_router.py
+"""
+run_crew 前面的意圖路由：常見的「報價 / 有沒有房」問題直接用 facts 套模板回覆（不呼叫 LLM）
+
+    intent = classify("下週房價多少？")            # Intent(name="price_quote", ...)
+    intent, reply = route(question, facts)         # 模板回覆（中文 + English）或 None（交給 crew）
+
+- 分類器：中英關鍵字（英文前後都對齊字界，允許複數）；不認得、或帶特殊需求（景觀、早餐、取消、折扣…）→ "other"，走完整 crew
+- 問題指定了日期 / 月份 / 節日 / 住幾晚 → "other"：模板只會回 facts 的預測期間（forecast_window，預設未來 7 天），不能拿來回答別的日期
+- 問入住率 / 預測 → "other"（rate 只有在「room rate」這類價格片語裡才算報價）
+- 指定房型（雙人房、suite…）→ "other"：facts 的價區間不分房型，模板回不了
+- 報價 + 有沒有房同時問 → 合併成一則回覆
+- 數字全部來自 facts（與 crew 用的是同一份），模板本身不做任何推算
+"""
+from __future__ import annotations
+import re
+from dataclasses import dataclass, field
+
+PRICE_QUOTE = "price_quote"
+AVAILABILITY = "availability"
+PRICE_AND_AVAILABILITY = "price_and_availability"
+OTHER = "other"
+
+_PRICE_WORDS = (
+    "多少", "價格", "價錢", "房價", "費用", "報價", "幾錢", "怎麼算", "一晚",
+    "how much", "price", "cost", "quote", "per night",
+    "room rate", "nightly rate", "daily rate", "night rate", "rate per night", "your rate", "best rate",
+)
+_AVAIL_WORDS = (
+    "有房", "空房", "還有房", "訂得到", "訂的到", "客滿", "滿房", "有沒有房",
+    "available", "availability", "vacancy", "vacancies", "sold out", "any room", "fully booked",
+)
+# 帶這些的問題需要客製回答 → 一律交給 crew
+_SPECIAL_WORDS = (
+    "景", "早餐", "停車", "寵物", "取消", "退款", "退費", "折扣", "優惠", "便宜一點", "升等", "加床",
+    "投訴", "客訴", "抱怨", "為什麼", "團體", "接送", "延退", "會議",
+    "view", "breakfast", "parking", "pet", "cancel", "cancellation", "cancelled", "canceled", "refund",
+    "refundable", "discount", "cheaper", "upgrade", "extra bed", "complain", "complaint", "why", "group",
+    "shuttle", "late checkout", "meeting",
+)
+# 問入住率 / 預測：模板只回價格或有沒有房 → 交給 crew
+_FORECAST_WORDS = (
+    "入住率", "住房率", "住用率", "預測", "预测", "occupancy", "forecast", "occupied",
+)
+# 指定房型：facts 的價區間不分房型 → 交給 crew
+_ROOM_TYPE_WORDS = (
+    "單人房", "单人房", "雙人房", "双人房", "雙床", "双床", "三人房", "四人房", "家庭房", "套房", "豪華", "豪华",
+    "景觀房", "標準房", "标准房", "總統", "总统",
+    "single room", "double", "twin", "triple", "quad", "family room", "suite", "deluxe", "superior",
+    "standard room", "king", "queen", "studio", "penthouse",
+)
+# 指定日期 / 月份 / 節日 / 晚數：模板的 forecast_window 對不上 → 交給 crew
+_MONTHS = ("january|february|march|april|june|july|august|september|october|november|december"
+           "|jan|feb|mar|apr|jun|jul|aug|sep|sept|oct|nov|dec")
+_DATE_PATTERNS = [re.compile(p) for p in (
+    rf"\b(?:{_MONTHS})\b",
+    r"\bmay\s+\d|\d\s*(?:st|nd|rd|th)?\s+(?:of\s+)?may\b|\bin\s+may\b",        # may 只在像日期時算
+    r"\b\d{1,2}(?:st|nd|rd|th)\b",                                             # the 24th
+    r"\b\d{1,4}[/.-]\d{1,2}(?:[/.-]\d{1,4})?\b",                                # 12/24、2025-12-24
+    r"\d+\s*月|[一二三四五六七八九十]+月|\d+\s*[日號号]",                                # 12月24日、24號
+    r"christmas|xmas|new year|easter|thanksgiving|valentine|halloween|holiday|next month",
+    r"聖誕|圣诞|耶誕|跨年|元旦|新年|春節|春节|過年|过年|中秋|端午|清明|連假|连假|國慶|国庆|下個月|下个月|下月",
+    r"\b(?:\d+|two|three|four|five|six|seven|eight|nine|ten|several|a few)\s+nights?\b",   # 3 nights
+    r"(?:[2-9]|\d{2,}|兩|两|二|三|四|五|六|七|八|九|十|幾|几)\s*[晚夜]",                  # 三晚（「一晚」= 每晚價，不算）
+)]
+MAX_QUESTION_CHARS = 120  # 太長的問題通常不只問價格
+
+
+@dataclass
+class Intent:
+    name: str
+    matched: list[str] = field(default_factory=list)
+    reason: str = ""
+
+
+def _hits(text: str, words) -> list[str]:
+    out = []
+    for w in words:
+        if w.isascii():
+            if re.search(rf"\b{re.escape(w)}(?:s|es)?\b", text):  # rate / rates，但不含 rated
+                out.append(w)
+        elif w in text:
+            out.append(w)
+    return out
+
+
+def classify(question: str) -> Intent:
+    """關鍵字分類；回傳 Intent（name 為 PRICE_QUOTE / AVAILABILITY / PRICE_AND_AVAILABILITY / OTHER）"""
+    q = (question or "").strip().lower()
+    if not q:
+        return Intent(OTHER, reason="empty")
+    if len(q) > MAX_QUESTION_CHARS:
+        return Intent(OTHER, reason="too long")
+    special = _hits(q, _SPECIAL_WORDS)
+    if special:
+        return Intent(OTHER, special, reason="special request")
+    forecast = _hits(q, _FORECAST_WORDS)
+    if forecast:
+        return Intent(OTHER, forecast, reason="forecast question")
+    rooms = _hits(q, _ROOM_TYPE_WORDS)
+    if rooms:
+        return Intent(OTHER, rooms, reason="specific room type")
+    dates = [m.group(0) for p in _DATE_PATTERNS for m in [p.search(q)] if m]
+    if dates:
+        return Intent(OTHER, dates, reason="specific dates")
+    price, avail = _hits(q, _PRICE_WORDS), _hits(q, _AVAIL_WORDS)
+    if price and avail:
+        return Intent(PRICE_AND_AVAILABILITY, price + avail)
+    if price:
+        return Intent(PRICE_QUOTE, price)
+    if avail:
+        return Intent(AVAILABILITY, avail)
+    return Intent(OTHER, reason="no keyword")
+
+
+# ---------- 模板 ----------
+def _availability_lines(facts: dict) -> tuple[str, str]:
+    avg, peak = float(facts["avg_occ"]), float(facts["max_occ"])
+    window = facts["forecast_window"]
+    if peak >= 95:
+        return (f"{window} 期間部分日期預估接近客滿（最高約 {peak:.1f}%），建議盡早預訂。",
+                f"Some dates in {window} are expected to be nearly full (peak ~{peak:.1f}%); we recommend booking early.")
+    if avg >= 85:
+        return (f"{window} 期間房量偏緊（平均入住率約 {avg:.1f}%），目前仍可預訂，建議盡早確認。",
+                f"Rooms are limited for {window} (average occupancy ~{avg:.1f}%); bookings are still open, "
+                f"so please confirm soon.")
+    return (f"{window} 期間目前仍有空房（平均入住率約 {avg:.1f}%）。",
+            f"Rooms are available for {window} (average occupancy ~{avg:.1f}%).")
+
+
+def _price_lines(facts: dict) -> tuple[str, str]:
+    lo, hi, avg = facts["price_lo"], facts["price_hi"], facts["avg_occ"]
+    return (f"建議價格區間為 **USD {lo:.0f}–{hi:.0f}**（{facts['forecast_window']}）。"
+            f"此建議基於預估入住率約 **{avg:.1f}%**，並參考競品價 USD {facts['comp_min']:.0f}–{facts['comp_max']:.0f}。",
+            f"Our suggested price range is **USD {lo:.0f}–{hi:.0f}** for {facts['forecast_window']}, "
+            f"based on the expected occupancy (~**{avg:.1f}%**) and competitor rates of "
+            f"USD {facts['comp_min']:.0f}–{facts['comp_max']:.0f}.")
+
+
+def render_reply(intent: str, facts: dict) -> str:
+    """facts → 中文一段 + English 一段（格式同 crew 的最終回覆）"""
+    parts = []
+    if intent in (PRICE_QUOTE, PRICE_AND_AVAILABILITY):
+        parts.append(_price_lines(facts))
+    if intent in (AVAILABILITY, PRICE_AND_AVAILABILITY):
+        parts.append(_availability_lines(facts))
+    if not parts:
+        raise ValueError(f"no template for intent {intent!r}")
+    zh = "親愛的客人您好，感謝您的詢問。" + "".join(p[0] for p in parts) + "如需預訂或其他協助，歡迎隨時告訴我們。"
+    en = ("Dear Guest, thank you for your inquiry. " + " ".join(p[1] for p in parts)
+          + " Please let us know if you would like to book or need anything else.")
+    return f"**中文**\n{zh}\n\n**English**\n{en}"
+
+
+def route(question: str, facts: dict) -> tuple[Intent, str | None]:
+    """(intent, 模板回覆)；回覆為 None → 交給 crew"""
+    intent = classify(question)
+    if intent.name == OTHER:
+        return intent, None
+    try:
+        return intent, render_reply(intent.name, facts)
+    except (KeyError, TypeError, ValueError) as e:  # facts 缺欄位 / 值是 None → 保守起見走 crew
+        return Intent(OTHER, intent.matched, reason=f"template failed: {e!r}"), None
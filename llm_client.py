@@ -0,0 +1,465 @@
+# llm_client.py
+"""
+共用 LLM client：連線池 + token bucket 限流（RPM / TPM）+ 自適應並行 + 抖動退避重試 + 逐請求 token 記帳
+
+    llm = get_llm_client()                       # 全域一個；HOTEL_LLM=pool 時 run_crew 預設就用它
+    Agent(llm=crewai_llm("gpt-5"), ...)          # CrewAI agent 也走同一個 client（crew_core：HOTEL_LLM=crewai-pool）
+    run_crew("下週雙人房多少？", llm=llm)
+    llm.stats()                                  # calls / retries / throttled / tokens / 目前並行上限
+    llm.requests[-1]                             # 最近一筆：tokens、排隊 / 限流等待、延遲、重試次數
+
+    # 離線壓測：同一個 process 裡起 stub_openai（可模擬 429），打 N 個並行請求
+    python llm_client.py --requests 300 --concurrency 64 --server-rpm 600 --latency 0.2
+
+- 連線池：每個 host 重用 HTTP/1.1 keep-alive 連線（http.client，標準庫），不每次重新握手
+- 限流：送出前先從 RPM bucket 拿 1、從 TPM bucket 拿「prompt 估計 + max_tokens（有設才算）」；
+  回來後依實際 usage 多退少補
+- 推理模型（gpt-5 / o 系列）：上限改送 max_completion_tokens，不送 stop（這兩個參數會被回 400）
+- 自適應並行（AIMD）：成功 → 上限 +1/上限；429 / 5xx / 逾時 → 上限減半
+- 重試：429、408、5xx、連線錯誤；full jitter 指數退避，有 Retry-After 就照它，
+  而且整個 client 一起暫停到那個時間（背壓），不會一群請求同時重送
+- 設定（環境變數）：OPENAI_BASE_URL、OPENAI_API_KEY、OPENAI_MODEL、LLM_RPM、LLM_TPM、
+  LLM_MAX_CONCURRENCY、LLM_MAX_RETRIES、LLM_TIMEOUT_S、LLM_MAX_TOKENS（預設不設上限）
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import contextvars
+import functools
+import http.client
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from stub_llm import estimate_tokens
+from tracing import current
+
+RETRY_STATUS = {408, 409, 429, 500, 502, 503, 504}
+REASONING_PREFIXES = ("gpt-5", "o1", "o3", "o4")
+
+
+def is_reasoning_model(model: str) -> bool:
+    """gpt-5 / o1 / o3 / o4 系列：不收 max_tokens、stop"""
+    return str(model).rsplit("/", 1)[-1].lower().startswith(REASONING_PREFIXES)
+
+
+class LLMError(RuntimeError):
+    def __init__(self, message: str, status: int | None = None, retry_after: float | None = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        return self.status is None or self.status in RETRY_STATUS
+
+
+# ---------- 限流 ----------
+class TokenBucket:
+    """每分鐘 per_minute 單位、容量 burst；per_minute 為 0 / None → 不限"""
+
+    def __init__(self, per_minute: float | None, burst: float | None = None):
+        self.rate = float(per_minute or 0) / 60.0
+        self.capacity = float(burst or per_minute or 0)
+        self.level = self.capacity
+        self._t = time.monotonic()
+        self._cond = threading.Condition()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._t) * self.rate)
+        self._t = now
+
+    def try_acquire(self, n: float = 1.0) -> float:
+        """拿得到 → 扣掉並回 0；拿不到 → 不扣，回還要等幾秒"""
+        if not self.rate:
+            return 0.0
+        with self._cond:
+            self._refill()
+            need = min(float(n), self.capacity)  # 比容量大的請求：等到滿了就放行（之後變負債）
+            if self.level >= need:
+                self.level -= float(n)
+                return 0.0
+            return (need - self.level) / self.rate
+
+    def acquire(self, n: float = 1.0) -> float:
+        """阻塞直到拿到；回傳等了幾秒"""
+        waited = 0.0
+        while True:
+            wait = self.try_acquire(n)
+            if wait <= 0:
+                return waited
+            time.sleep(min(wait, 1.0))
+            waited += min(wait, 1.0)
+
+    def adjust(self, n: float) -> None:
+        """事後校正：n > 0 再扣（實際用得比預留多），n < 0 退回"""
+        if not self.rate:
+            return
+        with self._cond:
+            self._refill()
+            self.level = min(self.capacity, self.level - float(n))
+
+
+class AdaptiveLimiter:
+    """AIMD 並行上限：成功慢慢加、被限流就減半"""
+
+    def __init__(self, initial: int = 4, min_limit: int = 1, max_limit: int = 32):
+        self.min_limit, self.max_limit = int(min_limit), int(max_limit)
+        self.limit = float(max(self.min_limit, min(int(initial), self.max_limit)))
+        self.inflight = 0
+        self._cond = threading.Condition()
+
+    def acquire(self) -> float:
+        t = time.perf_counter()
+        with self._cond:
+            while self.inflight >= int(self.limit):
+                self._cond.wait()
+            self.inflight += 1
+        return time.perf_counter() - t
+
+    def release(self, ok: bool, throttled: bool = False) -> None:
+        with self._cond:
+            self.inflight -= 1
+            if throttled:
+                self.limit = max(float(self.min_limit), self.limit * 0.5)
+            elif ok:
+                self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+
+# ---------- 連線池 ----------
+class _ConnectionPool:
+    """同一個 host 的 keep-alive 連線；用完放回，出錯就丟掉"""
+
+    def __init__(self, base_url: str, timeout: float, max_idle: int = 64):
+        u = urlsplit(base_url)
+        self.https = u.scheme == "https"
+        self.host = u.hostname or "127.0.0.1"
+        self.port = u.port or (443 if self.https else 80)
+        self.prefix = u.path.rstrip("/")
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self._idle: deque = deque()
+        self._lock = threading.Lock()
+        self.opened = 0
+
+    def get(self) -> http.client.HTTPConnection:
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+            self.opened += 1
+        cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        return cls(self.host, self.port, timeout=self.timeout)
+
+    def put(self, conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def close(self) -> None:
+        with self._lock:
+            while self._idle:
+                self._idle.pop().close()
+
+
+# ---------- client ----------
+class PooledLLM:
+    """complete(prompt, role) -> str / acomplete（同 StubLLM 介面，run_crew 的 llm= 直接可用）"""
+
+    def __init__(
+        self,
+        base_url: str = "https://api.openai.com/v1",
+        api_key: str | None = None,
+        model: str = "gpt-4o-mini",
+        rpm: float | None = None,
+        tpm: float | None = None,
+        max_concurrency: int = 16,
+        initial_concurrency: int = 4,
+        max_retries: int = 5,
+        timeout_s: float = 60.0,
+        max_tokens: int | None = None,
+        backoff_base_s: float = 0.5,
+        backoff_cap_s: float = 20.0,
+    ):
+        self.model = model
+        self.api_key = api_key
+        self.max_retries = int(max_retries)
+        self.max_tokens = int(max_tokens) if max_tokens else None  # None → 不設上限（回覆不會被截斷）
+        self.backoff_base_s, self.backoff_cap_s = float(backoff_base_s), float(backoff_cap_s)
+        self.rpm, self.tpm = TokenBucket(rpm), TokenBucket(tpm)
+        self.limiter = AdaptiveLimiter(initial_concurrency, 1, max_concurrency)
+        self.pool = _ConnectionPool(base_url, timeout_s, max_idle=max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, int(max_concurrency)), thread_name_prefix="llm")
+        self._lock = threading.Lock()
+        self._cooldown_until = 0.0  # 收到 429 + Retry-After → 整個 client 一起暫停，不只被擋的那一個
+        self.requests: deque = deque(maxlen=1000)  # 逐請求記帳
+        self.totals = {"calls": 0, "failed": 0, "retries": 0, "throttled": 0,
+                       "prompt_tokens": 0, "completion_tokens": 0, "rate_wait_s": 0.0, "queue_wait_s": 0.0}
+
+    # ----- HTTP -----
+    def _post(self, payload: dict) -> dict:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        headers = {"Content-Type": "application/json", "Connection": "keep-alive"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        conn = self.pool.get()
+        try:
+            conn.request("POST", f"{self.pool.prefix}/chat/completions", body=body, headers=headers)
+            resp = conn.getresponse()
+            raw = resp.read()
+        except Exception as e:  # OSError / HTTPException / 其他傳輸層錯誤 → 一律 LLMError（可重試）
+            conn.close()
+            raise LLMError(f"connection error: {e!r}") from e
+        if resp.getheader("Connection", "").lower() == "close":
+            conn.close()
+        else:
+            self.pool.put(conn)
+        if resp.status != 200:
+            ra = resp.getheader("Retry-After")
+            raise LLMError(f"HTTP {resp.status}: {raw[:200]!r}", resp.status, float(ra) if ra else None)
+        try:
+            data = json.loads(raw)
+            data["choices"][0]["message"].get("content")
+        except (ValueError, KeyError, IndexError, TypeError, AttributeError) as e:
+            raise LLMError(f"bad response body: {raw[:200]!r}", resp.status) from e  # 200 但內容壞掉：不重試
+        return data
+
+    def _backoff(self, attempt: int, err: LLMError) -> float:
+        if err.retry_after is not None:
+            # 照 Retry-After，再加一段抖動，避免同一批被擋下的請求同時重送
+            return err.retry_after + random.uniform(0, max(self.backoff_base_s, err.retry_after))
+        return random.uniform(0, min(self.backoff_cap_s, self.backoff_base_s * (2 ** attempt)))  # full jitter
+
+    # ----- 對外 -----
+    def complete(self, prompt: str, role: str = "") -> str:
+        messages = ([{"role": "system", "content": role}] if role else []) + [{"role": "user", "content": prompt}]
+        return self.chat(messages)
+
+    def chat(self, messages: list[dict], model: str | None = None, stop: list[str] | None = None) -> str:
+        """OpenAI chat messages → 回覆文字（complete / CrewAI adapter 共用）"""
+        model = model or self.model
+        reasoning = is_reasoning_model(model)
+        payload = {"model": model, "messages": messages}
+        if self.max_tokens:
+            payload["max_completion_tokens" if reasoning else "max_tokens"] = self.max_tokens
+        if stop and not reasoning:
+            payload["stop"] = list(stop)
+        prompt = "\n".join(str(m.get("content") or "") for m in messages)
+        reserved = estimate_tokens(prompt) + (self.max_tokens or 0)
+        rec = {"id": uuid.uuid4().hex[:12], "retries": 0, "throttled": 0, "rate_wait_s": 0.0, "queue_wait_s": 0.0}
+        t0 = time.perf_counter()
+        attempt = 0
+        while True:
+            pause = self._cooldown_until - time.monotonic()
+            if pause > 0:
+                time.sleep(pause)
+                rec["rate_wait_s"] += pause
+            rec["rate_wait_s"] += self.rpm.acquire(1) + self.tpm.acquire(reserved)
+            rec["queue_wait_s"] += self.limiter.acquire()
+            data, err = None, None
+            try:
+                data = self._post(payload)
+            except LLMError as e:
+                err = e
+            finally:
+                # 不管成功、LLMError 或其他例外，並行名額一定要還（否則 limiter 會永遠卡住）
+                throttled = err is not None and (err.status == 429 or err.status is None or err.status >= 500)
+                self.limiter.release(ok=data is not None, throttled=throttled)
+                if data is None:
+                    self.tpm.adjust(-reserved)  # 沒真的用到，退回
+            if err is None:
+                break
+            rec["throttled"] += int(err.status == 429)
+            if err.status == 429 and err.retry_after:
+                self._cooldown_until = max(self._cooldown_until, time.monotonic() + err.retry_after)
+            if not err.retryable or attempt >= self.max_retries:
+                self._account(rec, t0, None, error=repr(err))
+                raise err
+            attempt += 1
+            rec["retries"] = attempt
+            time.sleep(self._backoff(attempt, err))
+
+        usage = data.get("usage") or {}
+        text = data["choices"][0]["message"].get("content") or ""
+        used = int(usage.get("total_tokens") or estimate_tokens(prompt) + estimate_tokens(text))
+        self.tpm.adjust(used - reserved)
+        self._account(rec, t0, usage or {"prompt_tokens": estimate_tokens(prompt),
+                                         "completion_tokens": estimate_tokens(text)})
+        return text
+
+    async def acomplete(self, prompt: str, role: str = "") -> str:
+        """asyncio 版：在 client 自己的 thread pool 跑（大小 = 並行上限），contextvars 照帶"""
+        ctx = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, functools.partial(ctx.run, self.complete, prompt, role)
+        )
+
+    def _account(self, rec: dict, t0: float, usage: dict | None, error: str | None = None) -> None:
+        rec["latency_s"] = time.perf_counter() - t0
+        rec["error"] = error
+        rec["prompt_tokens"] = int((usage or {}).get("prompt_tokens") or 0)
+        rec["completion_tokens"] = int((usage or {}).get("completion_tokens") or 0)
+        with self._lock:
+            self.requests.append(rec)
+            t = self.totals
+            t["calls"] += 1
+            t["failed"] += int(error is not None)
+            for k in ("retries", "throttled", "prompt_tokens", "completion_tokens", "rate_wait_s", "queue_wait_s"):
+                t[k] += rec[k]
+        # tracing：llm.task span 記真實 usage（crew_core 的粗估就不會蓋掉）
+        current().set(prompt_tokens=rec["prompt_tokens"], completion_tokens=rec["completion_tokens"],
+                      llm_retries=rec["retries"], llm_wait_ms=round((rec["rate_wait_s"] + rec["queue_wait_s"]) * 1000, 1))
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self.totals)
+        out.update(concurrency_limit=round(self.limiter.limit, 2), inflight=self.limiter.inflight,
+                   connections_opened=self.pool.opened)
+        return out
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+        self.pool.close()
+
+
+_DEFAULT_CLIENT: PooledLLM | None = None
+_CLIENT_LOCK = threading.Lock()
+
+
+def get_llm_client() -> PooledLLM:
+    """全域 client（所有 agent / 請求共用同一組限流與連線池）"""
+    global _DEFAULT_CLIENT
+    with _CLIENT_LOCK:
+        if _DEFAULT_CLIENT is None:
+            env = os.getenv
+            _DEFAULT_CLIENT = PooledLLM(
+                base_url=env("OPENAI_BASE_URL", "https://api.openai.com/v1"),
+                api_key=env("OPENAI_API_KEY"),
+                model=env("OPENAI_MODEL", "gpt-4o-mini"),
+                rpm=float(env("LLM_RPM", "0")) or None,
+                tpm=float(env("LLM_TPM", "0")) or None,
+                max_concurrency=int(env("LLM_MAX_CONCURRENCY", "16")),
+                max_retries=int(env("LLM_MAX_RETRIES", "5")),
+                timeout_s=float(env("LLM_TIMEOUT_S", "60")),
+                max_tokens=int(env("LLM_MAX_TOKENS", "0")) or None,
+            )
+    return _DEFAULT_CLIENT
+
+
+# ---------- CrewAI adapter ----------
+@functools.lru_cache(maxsize=None)
+def _crewai_adapter_class(base):
+    class PooledCrewLLM(base):
+        """CrewAI Agent 的 llm：每次呼叫都經過共用 client 的限流 / 並行控制 / 記帳"""
+
+        def __init__(self, client: PooledLLM, model: str):
+            super().__init__(model=model)
+            self.client = client
+
+        def call(self, messages, tools=None, callbacks=None, available_functions=None, **kwargs) -> str:
+            if isinstance(messages, str):
+                messages = [{"role": "user", "content": messages}]
+            return self.client.chat(messages, model=self.model, stop=getattr(self, "stop", None))
+
+        def supports_function_calling(self) -> bool:
+            return False
+
+        def supports_stop_words(self) -> bool:
+            return not is_reasoning_model(self.model)
+
+        def get_context_window_size(self) -> int:
+            return int(os.getenv("LLM_CONTEXT_WINDOW", "128000"))
+
+    return PooledCrewLLM
+
+
+def crewai_llm(model: str | None = None, client: PooledLLM | None = None):
+    """
+    給 crewai.Agent(llm=...) 的自訂 LLM（crewai.BaseLLM）；底下是 get_llm_client()
+    crewai 版本沒有 BaseLLM → None（呼叫端退回 model 字串，走 CrewAI 內建的 LLM）
+    """
+    try:
+        from crewai import BaseLLM
+    except ImportError:
+        return None
+    client = client or get_llm_client()
+    return _crewai_adapter_class(BaseLLM)(client, model or client.model)
+
+
+# ---------- 離線壓測 ----------
+def _start_stub(latency: float, rpm: float | None, tpm: float | None, max_inflight: int | None) -> str:
+    """背景 thread 起 stub_openai；回傳 base_url"""
+    import socket
+    from mini_http import make_handler
+    from stub_llm import StubLLM
+    from stub_openai import build_routes
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    routes = build_routes(StubLLM(latency_s=latency), rpm=rpm, tpm=tpm, max_inflight=max_inflight)
+    ready = threading.Event()
+
+    async def run():
+        server = await asyncio.start_server(make_handler(routes), "127.0.0.1", port)
+        ready.set()
+        async with server:
+            await server.serve_forever()
+
+    threading.Thread(target=lambda: asyncio.run(run()), daemon=True).start()
+    ready.wait(10)
+    return f"http://127.0.0.1:{port}/v1"
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="LLM client load test against a local OpenAI-compatible stub")
+    ap.add_argument("--requests", type=int, default=200)
+    ap.add_argument("--concurrency", type=int, default=32, help="同時送出的呼叫端數")
+    ap.add_argument("--latency", type=float, default=0.2, help="stub 每次回覆延遲（秒）")
+    ap.add_argument("--server-rpm", type=float, default=None, help="stub 端限流（超過回 429）")
+    ap.add_argument("--server-tpm", type=float, default=None)
+    ap.add_argument("--server-inflight", type=int, default=None, help="stub 端同時處理上限（超過回 429）")
+    ap.add_argument("--rpm", type=float, default=None, help="client 端 RPM bucket")
+    ap.add_argument("--tpm", type=float, default=None)
+    ap.add_argument("--max-concurrency", type=int, default=32)
+    args = ap.parse_args(argv)
+
+    base = _start_stub(args.latency, args.server_rpm, args.server_tpm, args.server_inflight)
+    llm = PooledLLM(base_url=base, model="stub", rpm=args.rpm, tpm=args.tpm, max_concurrency=args.max_concurrency,
+                    backoff_base_s=0.2, backoff_cap_s=5.0)
+    prompts = [f"請估計第 {i} 天的雙人房價格\n" + "入住率 80%，競品均價 150。" * 5 for i in range(args.requests)]
+
+    t = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as callers:
+        results = list(callers.map(lambda p: _safe(llm, p), prompts))
+    wall = time.perf_counter() - t
+
+    lat = sorted(r["latency_s"] for r in llm.requests)
+    pct = lambda q: lat[min(len(lat) - 1, int(q * len(lat)))] if lat else float("nan")  # noqa: E731
+    s = llm.stats()
+    print(f"{args.requests} requests in {wall:.2f}s → {args.requests / wall:.1f} req/s "
+          f"({sum(r is None for r in results)} failed)")
+    print(f"latency p50 {pct(0.5):.3f}s  p95 {pct(0.95):.3f}s  max {lat[-1] if lat else float('nan'):.3f}s")
+    print(f"retries {s['retries']}  429s {s['throttled']}  tokens {s['prompt_tokens']}+{s['completion_tokens']}  "
+          f"concurrency limit {s['concurrency_limit']}  connections {s['connections_opened']}")
+    llm.close()
+
+
+def _safe(llm: PooledLLM, prompt: str):
+    try:
+        return llm.complete(prompt, role="Pricing Analyst")
+    except LLMError:
+        return None
+
+
+if __name__ == "__main__":
+    main()
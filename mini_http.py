@@ -0,0 +1,89 @@
+# mini_http.py
+"""
+極簡 asyncio HTTP/1.1 JSON server（只用標準庫）
+
+service.py 與 stub_openai.py 共用；支援 keep-alive、Content-Length body。
+handler：async fn(body: dict, query: dict) -> (status, obj)
+"""
+from __future__ import annotations
+import asyncio
+import json
+from urllib.parse import parse_qsl, urlsplit
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 429: "Too Many Requests", 500: "Internal Server Error"}
+MAX_BODY = 8 << 20
+
+
+def _encode(status: int, obj, keep_alive: bool, extra_headers: dict | None = None) -> bytes:
+    body = json.dumps(obj, ensure_ascii=False, default=str).encode("utf-8")
+    headers = {
+        "Content-Type": "application/json; charset=utf-8",
+        "Content-Length": str(len(body)),
+        "Connection": "keep-alive" if keep_alive else "close",
+        **(extra_headers or {}),
+    }
+    head = f"HTTP/1.1 {status} {_REASONS.get(status, 'OK')}\r\n"
+    head += "".join(f"{k}: {v}\r\n" for k, v in headers.items()) + "\r\n"
+    return head.encode("latin-1") + body
+
+
+def make_handler(routes: dict):
+    """routes：{("POST", "/price"): handler, ...}"""
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    method, target, version = line.decode("latin-1").split()
+                except ValueError:
+                    writer.write(_encode(400, {"error": "bad request line"}, False))
+                    break
+                headers = {}
+                while True:
+                    h = await reader.readline()
+                    if h in (b"\r\n", b"\n", b""):
+                        break
+                    k, _, v = h.decode("latin-1").partition(":")
+                    headers[k.strip().lower()] = v.strip()
+                length = int(headers.get("content-length", "0") or 0)
+                if length > MAX_BODY:
+                    writer.write(_encode(400, {"error": "body too large"}, False))
+                    break
+                raw = await reader.readexactly(length) if length else b""
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+
+                url = urlsplit(target)
+                fn = routes.get((method.upper(), url.path))
+                extra = None
+                if fn is None:
+                    status, obj = 404, {"error": f"no route {method} {url.path}"}
+                else:
+                    try:
+                        body = json.loads(raw) if raw else {}
+                        result = await fn(body, dict(parse_qsl(url.query)))
+                        status, obj = result[0], result[1]
+                        extra = result[2] if len(result) > 2 else None
+                    except (ValueError, KeyError, TypeError) as e:
+                        status, obj = 400, {"error": repr(e)}
+                    except Exception as e:
+                        status, obj = 500, {"error": repr(e)}
+                writer.write(_encode(status, obj, keep_alive, extra))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+    return handle
+
+
+async def serve(routes: dict, host: str = "127.0.0.1", port: int = 8000):
+    """啟動並一直跑（Ctrl+C 結束）"""
+    server = await asyncio.start_server(make_handler(routes), host, port)
+    async with server:
+        await server.serve_forever()
@@ -0,0 +1,151 @@
+# model_artifacts.py
+"""
+模型檔案格式：精簡二進位、可 mmap、多 process 共用
+
+    save_booster("models/pricing/P001.ubj", pipe)          # XGBoost 原生 UBJ（不經 pickle / joblib）
+    pipe = pricing_pipeline(load_booster("models/pricing/P001.ubj"), PRICING_FEATURES)
+
+    save_prophet("models/prophet/P001", model)             # P001.prophet.json + P001.<param>.npy
+    model = load_prophet("models/prophet/P001")            # 參數 np.load(mmap_mode="r")：同一台機器所有 process 共用 page cache
+
+多 process 部署（service.py）：
+    ctx = forkserver_context()          # forkserver 先 import 重型套件 + 預載 registry 裡的定價模型，
+    ProcessPoolExecutor(mp_context=ctx) # worker 從它 fork → 共用這些頁面，啟動幾乎不花時間
+
+- 載入都是 lazy：registry / IncrementalRefresher 第一次用到才讀檔
+- 環境變數 MODEL_ARTIFACTS_PRELOAD=1 時，import 本模組就會 preload()（forkserver 用這個入口）
+"""
+from __future__ import annotations
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+HEAVY_MODULES = ("data_utils", "xgboost", "sklearn.pipeline", "sklearn.compose", "prophet")
+
+
+# ---------- XGBoost ----------
+def save_booster(path, model) -> None:
+    """Pipeline（取最後一步）/ XGBRegressor → UBJ"""
+    est = model.named_steps["model"] if hasattr(model, "named_steps") else model
+    path = Path(path)
+    tmp = path.with_name(path.stem + ".tmp.ubj")
+    est.save_model(tmp)
+    os.replace(tmp, path)
+
+
+def load_booster(path):
+    from xgboost import XGBRegressor
+
+    model = XGBRegressor()
+    model.load_model(path)
+    return model
+
+
+def pricing_pipeline(model, feats: list[str]):
+    """
+    把載入的 XGBRegressor 包回 train_xgb_pricing_model 的 Pipeline 形狀
+    （ColumnTransformer passthrough 只需要知道欄位，用一列假資料 fit 即可）
+    """
+    import pandas as pd
+    from sklearn.compose import ColumnTransformer
+    from sklearn.pipeline import Pipeline
+
+    prep = ColumnTransformer(transformers=[("passthrough", "passthrough", list(feats))])
+    prep.fit(pd.DataFrame([[0.0] * len(feats)], columns=list(feats)))
+    return Pipeline(steps=[("prep", prep), ("model", model)])
+
+
+# ---------- Prophet ----------
+def _prophet_paths(prefix) -> tuple[Path, Path]:
+    prefix = Path(prefix)
+    return prefix.with_name(prefix.name + ".prophet.json"), prefix.parent
+
+
+def save_prophet(prefix, model) -> None:
+    """Prophet → <prefix>.prophet.json（結構、歷史）+ <prefix>.<param>.npy（Stan 參數）"""
+    from prophet.serialize import model_to_dict
+
+    meta_p, root = _prophet_paths(prefix)
+    root.mkdir(parents=True, exist_ok=True)
+    d = model_to_dict(model)
+    params = d.pop("params")
+    names = []
+    for name, value in params.items():
+        tmp = root / f"{Path(prefix).name}.{name}.tmp.npy"
+        np.save(tmp, np.asarray(value, dtype=np.float64))
+        os.replace(tmp, root / f"{Path(prefix).name}.{name}.npy")
+        names.append(name)
+    d["params"] = {}
+    d["param_names"] = names
+    tmp = meta_p.with_suffix(".tmp")
+    tmp.write_text(json.dumps(d), encoding="utf-8")
+    os.replace(tmp, meta_p)
+
+
+def load_prophet(prefix, mmap: bool = True):
+    """反序列化 Prophet；mmap=True → 參數是唯讀 memmap（predict 只讀不寫）"""
+    from prophet.serialize import model_from_dict
+
+    meta_p, root = _prophet_paths(prefix)
+    d = json.loads(meta_p.read_text(encoding="utf-8"))
+    names = d.pop("param_names", [])
+    model = model_from_dict(d)
+    model.params = {
+        name: np.load(root / f"{Path(prefix).name}.{name}.npy", mmap_mode="r" if mmap else None)
+        for name in names
+    }
+    return model
+
+
+def prophet_exists(prefix) -> bool:
+    return _prophet_paths(prefix)[0].exists()
+
+
+# ---------- 多 process ----------
+def preload() -> None:
+    """import 重型套件 + 載入 registry 裡所有定價模型（在 fork 之前呼叫）"""
+    import importlib
+
+    for mod in HEAVY_MODULES:
+        try:
+            importlib.import_module(mod)
+        except ImportError:
+            pass
+    from model_registry import get_model_registry
+
+    get_model_registry().preload()
+
+
+def forkserver_context(preload_models: bool = True):
+    """
+    forkserver context：server process 啟動時 import 本模組並 preload()，
+    之後 worker 都從它 fork（共用已載入的套件與模型，不用每個 worker 各 import 一次）
+    沒有 forkserver 的平台退回 spawn（worker 第一次用到才載入）
+
+    MODEL_ARTIFACTS_PRELOAD 只在啟動 forkserver 的那一刻設定，之後還原 →
+    之後另外開的 spawn / forkserver 子程序不會跟著 preload。
+    forkserver 每個 process 只有一個：已經啟動過就沿用（preload_models 以第一次為準）
+    """
+    import multiprocessing
+    from multiprocessing import forkserver
+
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("spawn")
+    ctx = multiprocessing.get_context("forkserver")
+    ctx.set_forkserver_preload(["model_artifacts"])
+    prev = os.environ.get("MODEL_ARTIFACTS_PRELOAD")
+    os.environ["MODEL_ARTIFACTS_PRELOAD"] = "1" if preload_models else "0"
+    try:
+        forkserver.ensure_running()
+    finally:
+        if prev is None:
+            os.environ.pop("MODEL_ARTIFACTS_PRELOAD", None)
+        else:
+            os.environ["MODEL_ARTIFACTS_PRELOAD"] = prev
+    return ctx
+
+
+if os.getenv("MODEL_ARTIFACTS_PRELOAD") == "1":
+    preload()
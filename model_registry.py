@@ -0,0 +1,208 @@
+# model_registry.py
+"""
+定價模型 registry：訓練好的 Pipeline + 特徵 schema + 資料指紋 + MAE 一起存檔
+
+- 指紋相同且未過期 → 直接載入（毫秒級），不重新訓練
+- 有新的標籤資料（指紋改變）或超過 max_age_days → 重新訓練並覆寫
+- 模型本體存成 XGBoost UBJ（model_artifacts.py）；舊的 .joblib 檔仍可讀
+- 第一次 load 才讀檔；preload() 一次載入全部（多 process 部署在 fork 前呼叫）
+- key 沒指定 → registry_key(history)：依 property_id / room_type 或資料本身區分，不同資料集不會互相覆寫
+- 每個 key 一把鎖：不同飯店 / 房型可以同時訓練，同一個 key 不會重複訓練
+"""
+from __future__ import annotations
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from tracing import current
+
+_SAFE_KEY = re.compile(r"[^\w.\-]")
+
+
+def training_fingerprint(history: pd.DataFrame, feats: list[str], label: str = "price") -> str:
+    """只看有標籤的列（以及用到的欄位），其他欄位變動不觸發重訓"""
+    cols = ["date", label] + [c for c in feats if c in history.columns and c != "date"]
+    labeled = history.loc[history[label].notna(), [c for c in cols if c in history.columns]]
+    digest = pd.util.hash_pandas_object(labeled, index=False).values.tobytes()
+    return hashlib.sha1(digest).hexdigest()
+
+
+def registry_key(history: pd.DataFrame, label: str = "price", fallback: str | None = None) -> str:
+    """
+    歷史資料 → registry key
+    - property_id / room_type 各只有一個值 → "<property_id>" 或 "<property_id>__<room_type>"（與 precompute 相同）
+    - 其他 → fallback（呼叫端有穩定的身分時，例如 incremental 用 CSV 路徑）
+    - 再沒有 → "data-<hash>"：全部有標籤列（date + label）的雜湊（同 training_fingerprint）；
+      前段相同、後面不同的資料集不會共用 key，但資料一變 key 就跟著變
+    """
+    ids = {}
+    for col in ("property_id", "room_type"):
+        if col in history.columns:
+            vals = history[col].dropna().unique()
+            if len(vals) > 1:
+                ids = None
+                break
+            if len(vals) == 1:
+                ids[col] = str(vals[0])
+    if ids and "property_id" in ids:
+        rt = ids.get("room_type", "")
+        return f"{ids['property_id']}__{rt}" if rt else ids["property_id"]
+    if fallback:
+        return fallback
+    if label not in history.columns:
+        cols = [c for c in ("date",) if c in history.columns]
+        digest = hashlib.sha1(pd.util.hash_pandas_object(history[cols], index=False).values.tobytes()).hexdigest()
+        return f"data-{digest[:12]}"
+    return f"data-{training_fingerprint(history, [], label)[:12]}"
+
+
+class PricingModelRegistry:
+    """存放在 root/<key>.ubj + root/<key>.json"""
+
+    def __init__(self, root: str = "models/pricing", max_age_days: float | None = 7.0):
+        self.root = Path(root)
+        self.max_age_days = max_age_days
+        self._mem: dict[str, tuple[object, dict]] = {}
+        self._lock = threading.Lock()
+        self._key_locks: dict[str, threading.RLock] = {}
+        self.loads = 0
+        self.trains = 0
+
+    def _paths(self, key: str) -> tuple[Path, Path]:
+        name = _SAFE_KEY.sub("_", key)  # property_id 直接進檔名 → 不允許路徑字元
+        return self.root / f"{name}.ubj", self.root / f"{name}.json"
+
+    def _lock_for(self, key: str) -> threading.RLock:
+        """同一個 key 的訓練 / 更新互斥；可重入（incremental 持鎖時還會呼叫 get_or_train）"""
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.RLock())
+
+    def load_params(self, key: str) -> dict | None:
+        """調參結果（root/<key>.params.json 的 params）；沒調過 → None"""
+        p = self._paths(key)[1].with_suffix(".params.json")
+        if not p.exists():
+            return None
+        return json.loads(p.read_text(encoding="utf-8")).get("params")
+
+    def save_params(self, key: str, params: dict, info: dict | None = None) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        p = self._paths(key)[1].with_suffix(".params.json")
+        body = {"key": key, "params": params, **(info or {})}  # 檔名是清過的 key → 原本的 key 另外記
+        p.write_text(json.dumps(body, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    def _stale(self, meta: dict) -> bool:
+        if self.max_age_days is None:
+            return False
+        return (time.time() - float(meta.get("trained_at", 0))) > self.max_age_days * 86400
+
+    def read_meta(self, key: str) -> dict | None:
+        _, meta_p = self._paths(key)
+        if not meta_p.exists():
+            return None
+        return json.loads(meta_p.read_text(encoding="utf-8"))
+
+    def load(self, key: str):
+        """回傳 (pipeline, meta) 或 None；記憶體有就不碰磁碟"""
+        if key in self._mem:
+            return self._mem[key]
+        model_p, _ = self._paths(key)
+        meta = self.read_meta(key)
+        if meta is None:
+            return None
+        if model_p.exists():
+            from model_artifacts import load_booster, pricing_pipeline
+            pipe = pricing_pipeline(load_booster(model_p), meta.get("features") or [])
+        elif model_p.with_suffix(".joblib").exists():  # 舊格式
+            import joblib
+            pipe = joblib.load(model_p.with_suffix(".joblib"))
+        else:
+            return None
+        self._mem[key] = (pipe, meta)
+        self.loads += 1
+        return pipe, meta
+
+    def save(self, key: str, pipe, meta: dict) -> None:
+        from model_artifacts import save_booster
+        self.root.mkdir(parents=True, exist_ok=True)
+        model_p, meta_p = self._paths(key)
+        meta = {**meta, "key": key}  # 檔名是清過的 key（_SAFE_KEY）→ 原本的 key 記在 meta，keys() 才還得回來
+        save_booster(model_p, pipe)
+        meta_p.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+        self._mem[key] = (pipe, meta)
+
+    def keys(self) -> list[str]:
+        """存過模型的 key（呼叫端原本傳的，不是清過的檔名）；舊檔沒記 key → 用檔名"""
+        out = []
+        for p in self.root.glob("*.json"):
+            if p.name.endswith(".params.json"):
+                continue
+            try:
+                key = json.loads(p.read_text(encoding="utf-8")).get("key")
+            except (OSError, ValueError):
+                key = None
+            out.append(key if isinstance(key, str) and key else p.stem)
+        return sorted(out)
+
+    def preload(self) -> int:
+        """把 root 底下所有模型載進記憶體；回傳載入數"""
+        return sum(self.load(k) is not None for k in self.keys())
+
+    def get_or_train(self, history: pd.DataFrame, train_fn, feats: list[str], key: str | None = None,
+                     params: dict | None = None, force: bool = False):
+        """
+        train_fn(history) -> (pipeline, mae) | None
+        回傳 (pipeline, mae) 或 None（沒有 price 標籤）
+        key=None → registry_key(history)
+        params：訓練用的超參數；跟存檔時不同也會重訓
+        force：不看指紋 / 年齡，一定完整重訓
+        """
+        if "price" not in history.columns:
+            return None
+        key = key or registry_key(history)
+        fp = training_fingerprint(history, feats)
+        with self._lock_for(key):
+            hit = None if force else self.load(key)
+            if hit is not None:
+                pipe, meta = hit
+                if (meta.get("fingerprint") == fp and meta.get("features") == feats
+                        and meta.get("params") == params and not self._stale(meta)):
+                    current().set(model_registry="hit")
+                    return pipe, meta.get("mae")
+
+            current().set(model_registry="trained")
+            trained = train_fn(history)
+            if trained is None:
+                return None
+            pipe, mae = trained
+            self.trains += 1
+            self.save(key, pipe, {
+                "key": key,
+                "features": list(feats),
+                "fingerprint": fp,
+                "mae": mae,
+                "n_rows": int(history["price"].notna().sum()),
+                "params": params,
+                "trained_at": time.time(),
+            })
+            return pipe, mae
+
+
+_DEFAULT_REGISTRY: PricingModelRegistry | None = None
+
+
+def get_model_registry() -> PricingModelRegistry:
+    """全域 registry；PRICING_MODEL_DIR / PRICING_MODEL_MAX_AGE_DAYS 可調"""
+    global _DEFAULT_REGISTRY
+    if _DEFAULT_REGISTRY is None:
+        age = os.getenv("PRICING_MODEL_MAX_AGE_DAYS", "7")
+        _DEFAULT_REGISTRY = PricingModelRegistry(
+            root=os.getenv("PRICING_MODEL_DIR", "models/pricing"),
+            max_age_days=float(age) if age else None,
+        )
+    return _DEFAULT_REGISTRY
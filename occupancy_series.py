@@ -0,0 +1,133 @@
+# occupancy_series.py
+"""
+精簡的入住率序列：起始日 + int32 日偏移 + float32 數值（__slots__，沒有 DataFrame 開銷）
+
+    s = OccupancySeries.from_frame(hist)          # 一次轉換
+    w = s.window(lookback_days=14)                # 零拷貝：共用同一塊 buffer
+    fit_prophet_and_forecast(w, periods=7)        # data_utils 直接吃 OccupancySeries
+    w.to_prophet_frame()                          # Prophet 輸入（只配置 ds / y 兩欄）
+
+送進 process pool 時 pickle 只帶 offsets / values 兩個陣列（每列 8 bytes）。
+split_portfolio(df, keys) 把多館 long-format 資料排序一次後切成每條序列的 view。
+"""
+from __future__ import annotations
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+
+class OccupancySeries:
+    __slots__ = ("start", "offsets", "values")
+
+    def __init__(self, start, offsets: np.ndarray, values: np.ndarray):
+        self.start = np.datetime64(start, "D")
+        self.offsets = offsets  # int32，遞增
+        self.values = values    # float32
+
+    # ---------- 建立 ----------
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, date_col: str = "date", value_col: str = "occupancy_pct") -> "OccupancySeries":
+        days = df[date_col].to_numpy(dtype="datetime64[D]").astype(np.int64)
+        vals = df[value_col].to_numpy(dtype=np.float32)
+        if len(days) > 1 and (np.diff(days) < 0).any():
+            order = np.argsort(days, kind="stable")
+            days, vals = days[order], vals[order]
+        base = int(days[0]) if len(days) else 0
+        return cls(np.datetime64(base, "D"), (days - base).astype(np.int32), np.ascontiguousarray(vals))
+
+    @classmethod
+    def from_arrays(cls, dates, values) -> "OccupancySeries":
+        return cls.from_frame(pd.DataFrame({"date": pd.to_datetime(dates), "occupancy_pct": values}))
+
+    def __getstate__(self):
+        # pickle（送進 worker）時 view 只帶自己那一段
+        return (str(self.start), np.ascontiguousarray(self.offsets), np.ascontiguousarray(self.values))
+
+    def __setstate__(self, state):
+        start, offsets, values = state
+        self.start, self.offsets, self.values = np.datetime64(start, "D"), offsets, values
+
+    # ---------- 基本 ----------
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __repr__(self) -> str:
+        if not len(self):
+            return "OccupancySeries(empty)"
+        return f"OccupancySeries({self.first_date.date()} ~ {self.last_date.date()}, n={len(self)})"
+
+    @property
+    def days(self) -> np.ndarray:
+        """epoch 天數（int64）"""
+        return self.start.astype(np.int64) + self.offsets.astype(np.int64)
+
+    @property
+    def dates(self) -> np.ndarray:
+        return self.days.astype("datetime64[D]").astype("datetime64[ns]")
+
+    @property
+    def first_date(self) -> pd.Timestamp:
+        return pd.Timestamp(self.start + int(self.offsets[0]))
+
+    @property
+    def last_date(self) -> pd.Timestamp:
+        return pd.Timestamp(self.start + int(self.offsets[-1]))
+
+    @property
+    def nbytes(self) -> int:
+        return self.offsets.nbytes + self.values.nbytes
+
+    def fingerprint(self) -> str:
+        """內容 hash（給 forecast cache 當 key）"""
+        h = hashlib.sha1()
+        h.update(np.int64(self.start.astype(np.int64) + (int(self.offsets[0]) if len(self) else 0)).tobytes())
+        h.update(np.ascontiguousarray(self.offsets - (self.offsets[0] if len(self) else 0)).tobytes())
+        h.update(np.ascontiguousarray(self.values).tobytes())
+        return h.hexdigest()
+
+    # ---------- 零拷貝視窗 ----------
+    def window(self, lookback_days: int | None = None, start=None, end=None) -> "OccupancySeries":
+        """回傳共用 buffer 的 view（numpy slice，不複製資料）"""
+        lo, hi = 0, len(self)
+        if not hi:
+            return self
+        if start is not None:
+            off = (np.datetime64(pd.Timestamp(start).date(), "D") - self.start).astype(np.int64)
+            lo = max(lo, int(np.searchsorted(self.offsets, off, side="left")))
+        if end is not None:
+            off = (np.datetime64(pd.Timestamp(end).date(), "D") - self.start).astype(np.int64)
+            hi = min(hi, int(np.searchsorted(self.offsets, off, side="right")))
+        if lookback_days is not None and lookback_days > 0:
+            cutoff = int(self.offsets[hi - 1]) - int(lookback_days) + 1 if hi > lo else 0
+            lo = max(lo, int(np.searchsorted(self.offsets, cutoff, side="left")))
+        return OccupancySeries(self.start, self.offsets[lo:hi], self.values[lo:hi])
+
+    # ---------- adapters ----------
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame({"date": self.dates, "occupancy_pct": self.values.astype(np.float64)})
+
+    def to_prophet_frame(self) -> pd.DataFrame:
+        """Prophet.fit 的輸入：ds / y 兩欄"""
+        return pd.DataFrame({"ds": self.dates, "y": self.values.astype(np.float64)})
+
+
+def split_portfolio(df: pd.DataFrame, keys: list[str]) -> dict[tuple, OccupancySeries]:
+    """多館 long-format → {key tuple: OccupancySeries}（依 key 排序）；排序一次，每條序列都是同一塊 buffer 的 view"""
+    days = df["date"].to_numpy(dtype="datetime64[D]").astype(np.int64)
+    codes, uniques = pd.MultiIndex.from_frame(df[keys]).factorize(sort=True)
+    order = np.lexsort((days, codes))
+    order = order[codes[order] >= 0]  # key 缺值的列不算（同 groupby 預設）
+    codes, days = codes[order], days[order]
+    vals = df["occupancy_pct"].to_numpy(dtype=np.float32)[order]
+    base = int(days.min()) if len(days) else 0
+    offsets = (days - base).astype(np.int32)
+    bounds = np.flatnonzero(np.diff(codes)) + 1
+    out = {}
+    for lo, hi in zip(np.r_[0, bounds], np.r_[bounds, len(codes)]):
+        if hi > lo:
+            key = uniques[codes[lo]]
+            out[key if isinstance(key, tuple) else (key,)] = OccupancySeries(
+                np.datetime64(base, "D"), offsets[lo:hi], vals[lo:hi]
+            )
+    return out
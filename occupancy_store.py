@@ -0,0 +1,388 @@
+# occupancy_store.py
+"""
+入住率歷史的欄式快取（Arrow IPC / Feather v2，未壓縮 → 可 memory-map、zero-copy）
+
+- 第一次讀 CSV 時轉成 Arrow 段落檔（字串用 dictionary 存）；manifest <csv>.arrow.json
+  記錄來源簽章與各段落的檔名 / 每個 batch 的日期範圍
+- 之後 memory-map 讀取；只取需要的欄位（projection），
+  日期範圍用每個 record batch 的 min/max 先跳過（predicate pushdown），
+  所以「最近 14 天」只會碰到最後一兩個 batch
+- 讀出的型別跟 pandas 路徑（read_csv + to_datetime）一致：int64 / float64、
+  同樣的 datetime 單位與字串型別 → 換路徑不會改變資料指紋
+- stream=True：逐塊讀 CSV 寫 batch，處理比記憶體還大的檔案
+  （逐塊推不出整欄型別 → 已知的數值欄一律 float64）
+- append_rows：新列寫成一個新的小段落（不重寫歷史）；段落超過 MAX_SEGMENTS 才整份重建
+- 段落檔名唯一、寫完才由 manifest（tmp + os.replace）指到 → 讀的人不會看到寫一半的檔案
+- 寫快取失敗（唯讀目錄、磁碟滿）→ load_occupancy_csv 退回 pandas 路徑
+
+pyarrow 是可選依賴，第一次用到才 import；沒裝時 load_occupancy_csv 會退回原本的 pandas 路徑。
+"""
+from __future__ import annotations
+import functools
+import io
+import json
+import os
+import tempfile
+from contextlib import ExitStack
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+BATCH_ROWS = 64_000
+MAX_SEGMENTS = 32
+READ_ATTEMPTS = 3  # 讀的時候段落檔被別的 process 換掉 → 最多重建幾次
+FLOAT_COLS = ("occupancy_pct", "price", "comp_min", "comp_max", "comp_mean")
+
+
+@functools.lru_cache(maxsize=None)
+def _arrow():
+    """pyarrow 到第一次讀寫快取才 import（import data_utils 不會連帶載入）"""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pacsv
+    return pa, pc, pacsv
+
+
+def available() -> bool:
+    try:
+        _arrow()
+    except ImportError:  # pragma: no cover - optional dependency
+        return False
+    return True
+
+
+def cache_path_for(csv_path: str | Path) -> Path:
+    """<csv>.arrow（段落檔的前綴）；設定 OCC_CACHE_DIR 則統一放在那個資料夾"""
+    p = Path(csv_path)
+    cache_dir = os.getenv("OCC_CACHE_DIR")
+    if cache_dir:
+        return Path(cache_dir) / (p.name + ".arrow")
+    return p.with_name(p.name + ".arrow")
+
+
+def _source_sig(csv_path: Path) -> dict:
+    st = csv_path.stat()
+    return {"source_size": st.st_size, "source_mtime": st.st_mtime}
+
+
+@functools.lru_cache(maxsize=None)
+def _pandas_dtypes() -> tuple:
+    """pandas 路徑在這個 pandas 版本下的 (日期, 字串) 型別"""
+    probe = pd.read_csv(io.StringIO("date,s\n2024-01-01,a\n"))
+    return pd.to_datetime(probe["date"]).dtype, probe["s"].dtype
+
+
+def _normalize(table: "pa.Table | pa.RecordBatch", encode_strings: bool = True):
+    """
+    欄名 strip+lower、date 轉 timestamp；回傳同型別物件
+    encode_strings=False（串流）：字串不轉字典、已知數值欄固定 float64（各塊推出的型別才會一致）
+    """
+    pa, pc, _ = _arrow()
+    names = [c.strip().lower() for c in table.schema.names]
+    cols = []
+    for name, col in zip(names, table.columns):
+        t = col.type
+        if name == "date":
+            if not pa.types.is_timestamp(t):
+                col = pc.cast(col, pa.timestamp("s"))
+        elif not encode_strings and name in FLOAT_COLS:
+            col = pc.cast(col, pa.float64())
+        elif encode_strings and (pa.types.is_string(t) or pa.types.is_large_string(t)):
+            col = pc.dictionary_encode(col)
+        cols.append(col)
+    if isinstance(table, pa.RecordBatch):
+        return pa.RecordBatch.from_arrays(cols, names=names)
+    return pa.Table.from_arrays(cols, names=names)
+
+
+def _csv_read_options(csv_path: Path):
+    pa, _, pacsv = _arrow()
+    # 先看表頭，確保 date 欄位直接 parse 成 timestamp
+    with open(csv_path, "r", encoding="utf-8-sig") as f:
+        header = f.readline().strip().split(",")
+    date_cols = {c: pa.timestamp("s") for c in header if c.strip().lower() == "date"}
+    return pacsv.ConvertOptions(column_types=date_cols)
+
+
+def _check_columns(schema) -> None:
+    if "date" not in schema.names or "occupancy_pct" not in schema.names:
+        raise ValueError("CSV 需要包含 columns: 'date','occupancy_pct'")
+
+
+def _meta_path(cache: Path) -> Path:
+    return cache.with_name(cache.name + ".json")
+
+
+def _write_segment(cache: Path, schema, batches) -> dict:
+    """
+    batches 寫成一個新的段落檔（檔名唯一，逐 batch 寫、不整份留在記憶體）
+    回傳 manifest 的段落項目 {"file", "batch_ranges"}；失敗時刪掉寫一半的檔案
+    """
+    pa, pc, _ = _arrow()
+    cache.parent.mkdir(parents=True, exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix=cache.name + ".", suffix=".seg", dir=cache.parent)
+    os.close(fd)
+    ranges = []
+    try:
+        with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+            for b in batches:
+                mm = pc.min_max(b.column("date")).as_py()
+                lo, hi = mm["min"], mm["max"]
+                ranges.append([
+                    None if lo is None else int(pd.Timestamp(lo).timestamp()),
+                    None if hi is None else int(pd.Timestamp(hi).timestamp()),
+                ])
+                writer.write_batch(b)
+    except BaseException:
+        Path(path).unlink(missing_ok=True)
+        raise
+    return {"file": os.path.basename(path), "batch_ranges": ranges}
+
+
+def _write_manifest(cache: Path, sig: dict, segments: list[dict], old: dict | None = None) -> None:
+    """manifest 原子替換（同目錄唯一 tmp + os.replace）；舊 manifest 裡不再用到的段落檔順手刪掉"""
+    fd, tmp = tempfile.mkstemp(prefix=cache.name + ".", suffix=".json.tmp", dir=cache.parent)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({**sig, "segments": segments}, f)
+        os.replace(tmp, _meta_path(cache))
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+    keep = {s["file"] for s in segments}
+    for s in (old or {}).get("segments", []):
+        if s["file"] not in keep:
+            (cache.parent / s["file"]).unlink(missing_ok=True)
+
+
+def _read_manifest(cache: Path) -> dict | None:
+    meta_p = _meta_path(cache)
+    if not meta_p.exists():
+        return None
+    try:
+        return json.loads(meta_p.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def _stream_batches(csv_path: Path, block_bytes: int):
+    _, _, pacsv = _arrow()
+    reader = pacsv.open_csv(
+        csv_path,
+        read_options=pacsv.ReadOptions(block_size=block_bytes),
+        convert_options=_csv_read_options(csv_path),
+    )
+    for batch in reader:
+        # IPC file 格式不支援跨 batch 換字典 → 串流模式字串維持原樣，讀出時再轉 category
+        yield _normalize(batch, encode_strings=False)
+
+
+def build_cache(csv_path: str | Path, stream: bool = False, block_bytes: int = 64 << 20) -> Path:
+    """CSV → Arrow 段落檔 + manifest；stream=True 逐塊轉換（不排序，靠 batch 範圍做 pushdown）"""
+    _build(Path(csv_path), stream, block_bytes)
+    return cache_path_for(csv_path)
+
+
+def _build(csv_path: Path, stream: bool = False, block_bytes: int = 64 << 20) -> dict:
+    """build_cache 本體；回傳剛寫進去的 manifest（不重讀檔案，別的 process 同時改 manifest 也不受影響）"""
+    _, _, pacsv = _arrow()
+    csv_path = Path(csv_path)
+    cache = cache_path_for(csv_path)
+    sig = _source_sig(csv_path)
+    old = _read_manifest(cache)
+
+    if stream:
+        it = _stream_batches(csv_path, block_bytes)
+        first = next(it)
+        _check_columns(first.schema)
+
+        def batches():
+            yield first
+            yield from it
+        seg = _write_segment(cache, first.schema, batches())
+    else:
+        table = pacsv.read_csv(csv_path, convert_options=_csv_read_options(csv_path))
+        table = _normalize(table)
+        _check_columns(table.schema)
+        table = table.sort_by("date").combine_chunks()
+        seg = _write_segment(cache, table.schema, table.to_batches(max_chunksize=BATCH_ROWS))
+    _write_manifest(cache, sig, [seg], old)
+    return {**sig, "segments": [seg]}
+
+
+def _fresh(cache: Path, csv_path: Path) -> dict | None:
+    """manifest 存在、是段落格式且來源 CSV 沒變 → 回傳 manifest"""
+    meta = _read_manifest(cache)
+    if meta is None or "segments" not in meta:
+        return None
+    sig = _source_sig(csv_path)
+    if meta.get("source_size") != sig["source_size"] or meta.get("source_mtime") != sig["source_mtime"]:
+        return None
+    return meta
+
+
+def read_occupancy(
+    csv_path: str | Path,
+    columns: list[str] | None = None,
+    start=None,
+    end=None,
+    lookback_days: int | None = None,
+    stream: bool = False,
+) -> pd.DataFrame:
+    """
+    從欄式快取讀資料（必要時先建快取）
+
+    - columns：只讀這些欄位（date 一定會帶上）
+    - start / end：日期範圍（含端點）
+    - lookback_days：只取最後 N 天（依整份資料的最大日期）
+    """
+    csv_path = Path(csv_path)
+    if not csv_path.exists():
+        raise FileNotFoundError(f"CSV not found: {csv_path.resolve()}")
+    cache = cache_path_for(csv_path)
+    meta = _fresh(cache, csv_path)
+    for _ in range(READ_ATTEMPTS):
+        if meta is None:
+            meta = _build(csv_path, stream=stream)
+        try:
+            df = _read_segments(cache, meta, columns, start, end, lookback_days)
+            break
+        except FileNotFoundError:
+            # 讀 manifest 之後別的 process 重建了快取（舊段落已刪）→ 重建再讀
+            meta = None
+    else:
+        # OSError：data_utils.load_occupancy_csv 會改讀 CSV
+        raise OSError(f"Arrow cache for {csv_path} kept being rebuilt by another process; read the CSV instead")
+
+    date_dtype, str_dtype = _pandas_dtypes()
+    df["date"] = df["date"].astype(date_dtype)
+    for c in df.columns:
+        if c != "date" and (isinstance(df[c].dtype, pd.CategoricalDtype) or pd.api.types.is_string_dtype(df[c])):
+            df[c] = df[c].astype(str_dtype)
+    if not df["date"].is_monotonic_increasing:
+        df = df.sort_values("date", kind="stable")
+    return df.reset_index(drop=True)
+
+
+def _read_segments(cache: Path, meta: dict, columns, start, end, lookback_days) -> pd.DataFrame:
+    pa, pc, _ = _arrow()
+    segments = meta["segments"]
+    lo = None if start is None else pd.Timestamp(start)
+    hi = None if end is None else pd.Timestamp(end)
+    if lookback_days is not None and lookback_days > 0:
+        max_ts = max((r[1] for seg in segments for r in seg["batch_ranges"] if r[1] is not None), default=None)
+        if max_ts is not None:
+            cut = pd.Timestamp(max_ts, unit="s") - pd.Timedelta(days=int(lookback_days) - 1)
+            lo = cut if lo is None else max(lo, cut)
+    lo_s = None if lo is None else int(lo.timestamp())
+    hi_s = None if hi is None else int(hi.timestamp())
+
+    with ExitStack() as stack:
+        readers = [
+            pa.ipc.open_file(stack.enter_context(pa.memory_map(str(cache.parent / seg["file"]), "r")))
+            for seg in segments
+        ]
+        base = readers[0].schema
+        names = base.names
+        if columns is not None:
+            want = ["date"] + [c for c in columns if c != "date"]
+            missing = [c for c in want if c not in names]
+            if missing:
+                raise KeyError(f"columns not in store: {missing}")
+        else:
+            want = names
+        parts = []
+        for reader, seg in zip(readers, segments):
+            for i, (b_lo, b_hi) in enumerate(seg["batch_ranges"]):
+                if b_lo is None:
+                    continue
+                if (lo_s is not None and b_hi < lo_s) or (hi_s is not None and b_lo > hi_s):
+                    continue  # 整個 batch 不在範圍內 → 不讀
+                batch = reader.get_batch(i).select(want)
+                if (lo_s is not None and b_lo < lo_s) or (hi_s is not None and b_hi > hi_s):
+                    d = batch.column("date")
+                    mask = None
+                    if lo_s is not None:
+                        mask = pc.greater_equal(d, pa.scalar(lo.to_pydatetime(), pa.timestamp("s")))
+                    if hi_s is not None:
+                        m2 = pc.less_equal(d, pa.scalar(hi.to_pydatetime(), pa.timestamp("s")))
+                        mask = m2 if mask is None else pc.and_(mask, m2)
+                    batch = batch.filter(mask)
+                parts.append(batch)
+        schema = pa.schema([base.field(c) for c in want])
+        return pa.Table.from_batches(parts, schema=schema).to_pandas(split_blocks=True)
+
+
+def stream_csv_chunks(csv_path: str | Path, chunksize: int = 500_000, columns: list[str] | None = None):
+    """逐塊 yield DataFrame（型別同串流快取：已知數值欄 float64），給比記憶體大的 CSV 做串流處理"""
+    date_dtype, _ = _pandas_dtypes()
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+        chunk.columns = [c.strip().lower() for c in chunk.columns]
+        if columns is not None:
+            chunk = chunk[["date"] + [c for c in columns if c != "date"]]
+        chunk["date"] = pd.to_datetime(chunk["date"]).astype(date_dtype)
+        for c in chunk.columns:
+            if c in FLOAT_COLS:
+                chunk[c] = chunk[c].astype(np.float64)
+        yield chunk
+
+
+def append_csv_rows(csv_path: str | Path, new_rows: pd.DataFrame) -> None:
+    """把新列接在 CSV 尾端（依既有表頭順序；日期寫成 YYYY-MM-DD）"""
+    csv_path = Path(csv_path)
+    with open(csv_path, "r", encoding="utf-8-sig") as f:
+        header = f.readline().rstrip("\r\n").split(",")
+    out = new_rows.copy()
+    out.columns = [c.strip().lower() for c in out.columns]
+    out["date"] = pd.to_datetime(out["date"]).dt.strftime("%Y-%m-%d")
+    out = out.reindex(columns=[c.strip().lower() for c in header])
+    with open(csv_path, "rb+") as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() > 0:
+            f.seek(-1, os.SEEK_END)
+            needs_nl = f.read(1) != b"\n"
+        else:
+            needs_nl = False
+    with open(csv_path, "a", encoding="utf-8", newline="") as f:
+        if needs_nl:
+            f.write("\n")
+        out.to_csv(f, header=False, index=False, lineterminator="\n")
+
+
+def append_rows(csv_path: str | Path, new_rows: pd.DataFrame) -> bool:
+    """
+    CSV 尾端 append new_rows，同一批列寫成快取的一個新段落（不重新 parse、不重寫歷史）。
+    段落數超過 MAX_SEGMENTS → 整份重建一次（把小段落合併）。
+    呼叫端負責去重（見 incremental.append_occupancy）。
+    回傳 True 表示快取已同步更新；False 表示快取不存在/過期/寫不進去，下次讀取時會重建
+    （或退回 pandas 路徑）。
+    """
+    csv_path = Path(csv_path)
+    cache = cache_path_for(csv_path)
+    meta = _fresh(cache, csv_path) if available() else None
+    append_csv_rows(csv_path, new_rows)
+    if meta is None:
+        return False
+    pa = _arrow()[0]
+
+    try:
+        if len(meta["segments"]) >= MAX_SEGMENTS:
+            build_cache(csv_path)
+            return True
+        with pa.memory_map(str(cache.parent / meta["segments"][0]["file"]), "r") as src:
+            schema = pa.ipc.open_file(src).schema
+        add = new_rows.copy()
+        add.columns = [c.strip().lower() for c in add.columns]
+        add["date"] = pd.to_datetime(add["date"])
+        add = add.reindex(columns=schema.names).sort_values("date", kind="stable")
+        plain = pa.schema([
+            pa.field(f.name, f.type.value_type if pa.types.is_dictionary(f.type) else f.type) for f in schema
+        ])
+        new = pa.Table.from_pandas(add, schema=plain, preserve_index=False).cast(schema)
+        seg = _write_segment(cache, schema, new.combine_chunks().to_batches(max_chunksize=BATCH_ROWS))
+        _write_manifest(cache, _source_sig(csv_path), [*meta["segments"], seg], meta)
+    except (OSError, pa.ArrowInvalid):
+        # 寫不進去 / 新列型別跟快取不合（例如整數欄出現小數）→ manifest 沒更新，CSV 已變 → 之後讀取時重建
+        return False
+    return True
@@ -0,0 +1,119 @@
+# portfolio.py
+"""
+多飯店 / 多房型批次預測
+
+輸入 long-format DataFrame：date, occupancy_pct, property_id（可選 room_type）
+每條序列獨立 fit + forecast，丟到 process pool 平行跑；
+單條失敗只 fallback 該條，不會拖垮整批。
+method="hw" / "seasonal_naive" / "ses"：改走 fast_forecast 一次向量化算完全部序列（不開 pool）。
+"""
+from __future__ import annotations
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from data_utils import (
+    fit_prophet_and_forecast, fit_hw_and_forecast, fallback_forecast, summarize_forecast
+)
+from fast_forecast import METHODS, forecast_matrix, to_forecast_frame
+from occupancy_series import split_portfolio
+
+SERIES_KEYS = ("property_id", "room_type")
+
+
+def _split_series(df: pd.DataFrame, keys: list[str], lookback_days: int | None):
+    """依 keys 切成多條 OccupancySeries（排序一次、零拷貝 view）；送進 worker 每列只有 8 bytes"""
+    for key, series in split_portfolio(df, keys).items():
+        yield key, series.window(lookback_days=lookback_days)
+
+
+def _forecast_one(job):
+    """worker：單條序列；任何錯誤都改走 fallback，並回報錯誤訊息"""
+    key, part, periods = job
+    try:
+        fcst = fit_prophet_and_forecast(part, periods=periods, series_key=repr(key))
+        return key, fcst, "Prophet", None
+    except Exception as e:
+        part = part.to_frame()
+        try:
+            return key, fit_hw_and_forecast(part, periods=periods), "Holt-Winters", repr(e)
+        except Exception:
+            pass
+        try:
+            return key, fallback_forecast(part, periods=periods), "Fallback(14天均值)", repr(e)
+        except Exception as e2:
+            return key, None, "failed", repr(e2)
+
+
+def _forecast_vectorized(df, keys, periods, lookback_days, method):
+    """所有序列對齊成 (series × days) 矩陣，一次算完"""
+    wide = df.pivot_table(index=keys, columns="date", values="occupancy_pct", aggfunc="last", observed=True)
+    wide = wide.reindex(columns=pd.date_range(wide.columns.min(), wide.columns.max(), freq="D"))
+    if lookback_days is not None and lookback_days > 0:
+        wide = wide.iloc[:, -int(lookback_days):]
+    pred, lo, hi = forecast_matrix(wide.to_numpy(), periods=periods, method=method)
+    ids = wide.index.to_frame(index=False)
+    fcst = to_forecast_frame(pred, lo, hi, last_date=wide.columns.max(), keys=ids)
+    return fcst.assign(source=method)
+
+
+def forecast_portfolio(
+    df: pd.DataFrame,
+    periods: int = 7,
+    lookback_days: int | None = None,
+    keys: tuple[str, ...] = SERIES_KEYS,
+    max_workers: int | None = None,
+    method: str = "prophet",
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    回傳 (forecast_df, summary_df)
+
+    - forecast_df：keys + date, occ_pred, occ_lo, occ_hi, source
+    - summary_df：keys + summarize_forecast 的欄位 + source, error
+    - max_workers：process 數（None → CPU 數；1 → 不開 pool，直接在本 process 跑）
+    - method："prophet"（逐條 fit）或 fast_forecast.METHODS 之一（向量化）
+    """
+    keys = [k for k in keys if k in df.columns]
+    if not keys:
+        raise ValueError("需要 'property_id' 欄位（可選 'room_type'）")
+
+    if method in METHODS:
+        fcst = _forecast_vectorized(df, keys, int(periods), lookback_days, method)
+        summary_df = pd.DataFrame([
+            {**dict(zip(keys, key if isinstance(key, tuple) else (key,))),
+             "source": method, "error": None, **summarize_forecast(grp)}
+            for key, grp in fcst.groupby(keys, sort=True, observed=True)
+        ])
+        return fcst, summary_df
+    if method != "prophet":
+        raise ValueError(f"unknown method: {method!r}")
+
+    jobs = [(key, part, int(periods)) for key, part in _split_series(df, keys, lookback_days)]
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = max(1, min(int(max_workers), len(jobs) or 1))
+
+    if max_workers == 1:
+        results = [_forecast_one(j) for j in jobs]
+    else:
+        chunksize = max(1, len(jobs) // (max_workers * 4))
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            results = list(pool.map(_forecast_one, jobs, chunksize=chunksize))
+
+    frames, rows = [], []
+    for key, fcst, src, err in results:
+        ident = dict(zip(keys, key))
+        row = {**ident, "source": src, "error": err}
+        if fcst is not None:
+            fcst = fcst.assign(**ident, source=src)
+            frames.append(fcst)
+            row.update(summarize_forecast(fcst))
+        rows.append(row)
+
+    cols = keys + ["date", "occ_pred", "occ_lo", "occ_hi", "source"]
+    forecast_df = (
+        pd.concat(frames, ignore_index=True)[cols] if frames else pd.DataFrame(columns=cols)
+    )
+    summary_df = pd.DataFrame(rows)
+    return forecast_df, summary_df
@@ -0,0 +1,325 @@
+# precompute.py
+"""
+夜間批次：預先算好每間飯店未來 N 天的入住率預測與每日價帶，寫進 SQLite
+
+    python precompute.py --csv sample_data/occupancy_history.csv --db precomputed.db --days 30
+
+白天的請求（run_crew / Streamlit）只要查表：
+    PrecomputedStore("precomputed.db").facts("下週雙人房多少？", property_id="default")
+查詢走 (property_id, room_type, date) 主鍵索引，毫秒級。
+
+有 rate shop 資料時加 --comp-store data/comp_rates（comp_rates.CompetitorRateStore）：
+訓練列與預測列都用 as-of join 接上當時的競品價（comp_mean 等），取代固定的 comp_min / comp_max。
+一個 store = 一間飯店的競品組；多館用 --comp-store P001=data/comp/P001 P002=data/comp/P002
+"""
+from __future__ import annotations
+import argparse
+import sqlite3
+import time
+import uuid
+from pathlib import Path
+
+import pandas as pd
+
+from comp_rates import CompetitorRateStore
+from data_utils import apply_occupancy_boost, get_pricing_model, infer_price_grid, load_occupancy_csv
+from portfolio import forecast_portfolio
+
+DEFAULT_DB = "precomputed.db"
+DEFAULT_PROPERTY = "default"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    started_at REAL, finished_at REAL,
+    csv_path TEXT, periods INTEGER, n_series INTEGER,
+    comp_min REAL, comp_max REAL, method TEXT, lookback_days INTEGER
+);
+CREATE TABLE IF NOT EXISTS forecasts (
+    property_id TEXT NOT NULL, room_type TEXT NOT NULL, date TEXT NOT NULL,
+    occ_pred REAL, occ_lo REAL, occ_hi REAL, source TEXT, run_id TEXT,
+    PRIMARY KEY (property_id, room_type, date)
+);
+CREATE TABLE IF NOT EXISTS prices (
+    property_id TEXT NOT NULL, room_type TEXT NOT NULL, date TEXT NOT NULL,
+    occ_pred REAL, comp_mean REAL, price_mid REAL, price_lo REAL, price_hi REAL,
+    basis TEXT, model_mae REAL, run_id TEXT, comp_source TEXT,
+    PRIMARY KEY (property_id, room_type, date)
+);
+"""
+
+
+def connect(db_path: str = DEFAULT_DB) -> sqlite3.Connection:
+    con = sqlite3.connect(db_path)
+    con.executescript(_SCHEMA)
+    cols = {r[1] for r in con.execute("PRAGMA table_info(runs)")}
+    if "lookback_days" not in cols:  # 舊版 DB
+        con.execute("ALTER TABLE runs ADD COLUMN lookback_days INTEGER")
+    if "comp_source" not in {r[1] for r in con.execute("PRAGMA table_info(prices)")}:
+        con.execute("ALTER TABLE prices ADD COLUMN comp_source TEXT")  # NULL = 舊 run，當作 fixed
+    return con
+
+
+def _with_keys(df: pd.DataFrame) -> pd.DataFrame:
+    out = df
+    if "property_id" not in out.columns:
+        out = out.assign(property_id=DEFAULT_PROPERTY)
+    if "room_type" not in out.columns:
+        out = out.assign(room_type="")
+    return out.astype({"property_id": str, "room_type": str})
+
+
+def _comp_stores(comp_store, hist: pd.DataFrame) -> dict[str, CompetitorRateStore]:
+    """comp_store 參數 → {property_id: store}（空的 store 略過）"""
+    if comp_store is None:
+        return {}
+    if isinstance(comp_store, CompetitorRateStore):
+        pids = hist["property_id"].astype(str).unique()
+        if len(pids) > 1:
+            raise ValueError(
+                f"一個 comp_store 不能套到 {len(pids)} 間飯店；多館請傳 {{property_id: CompetitorRateStore}}"
+            )
+        comp_store = {pids[0]: comp_store} if len(pids) else {}
+    return {str(pid): st for pid, st in comp_store.items() if len(st)}
+
+
+def run_precompute(
+    csv_path: str,
+    db_path: str = DEFAULT_DB,
+    periods: int = 30,
+    lookback_days: int | None = None,
+    comp_min: float | None = 120.0,
+    comp_max: float | None = 180.0,
+    comp_rates: pd.DataFrame | None = None,
+    method: str = "prophet",
+    max_workers: int | None = None,
+    comp_store: CompetitorRateStore | dict[str, CompetitorRateStore] | None = None,
+) -> dict:
+    """
+    整批預測 + 定價 → SQLite；回傳這次 run 的摘要
+    comp_store：競品價 store；訓練列接上入住當天的競品統計，預測列接上最新的（優先於 comp_rates）
+    多館 → {property_id: store}（沒有 store 的飯店照舊用 comp_rates / comp_min / comp_max）；
+    只給一個 store 但資料有多間飯店 → ValueError（不同館的競品組不能共用）
+    """
+    started = time.time()
+    run_id = uuid.uuid4().hex[:12]
+    hist = _with_keys(load_occupancy_csv(csv_path))
+    stores = _comp_stores(comp_store, hist)
+    if stores:
+        hist = pd.concat(
+            [stores[pid].attach(g) if pid in stores else g for pid, g in hist.groupby("property_id", sort=False)]
+        ).sort_index()
+
+    fcst, summary = forecast_portfolio(
+        hist, periods=periods, lookback_days=lookback_days, method=method, max_workers=max_workers
+    )
+    fcst = _with_keys(fcst)
+
+    prices = []
+    hist_parts = dict(iter(hist.groupby(["property_id", "room_type"], sort=False)))
+    for (pid, rt), part in fcst.groupby(["property_id", "room_type"], sort=False):
+        h = hist_parts.get((pid, rt), hist.iloc[0:0])
+        trained = get_pricing_model(h, key=f"{pid}__{rt}" if rt else pid)
+        model, mae = trained if trained is not None else (None, None)
+        rates, source = None, "fixed"
+        if pid in stores:
+            rates, source = stores[pid].attach(part[["date"]], room_type=rt)[["date", "comp_mean"]], "store"
+        elif comp_rates is not None:
+            rates, source = comp_rates, "rates"
+            if "property_id" in rates.columns:
+                rates = rates[rates["property_id"].astype(str) == pid].drop(columns="property_id")
+        grid = infer_price_grid(
+            model, part[["date", "occ_pred"]], comp_rates=rates, comp_min=comp_min, comp_max=comp_max
+        )
+        prices.append(grid.assign(property_id=pid, room_type=grid.get("room_type", rt), model_mae=mae,
+                                  comp_source=source))
+    price_df = pd.concat(prices, ignore_index=True) if prices else pd.DataFrame()
+
+    con = connect(db_path)
+    with con:
+        f = fcst.assign(date=fcst["date"].dt.strftime("%Y-%m-%d"), run_id=run_id)
+        con.executemany(
+            "INSERT OR REPLACE INTO forecasts VALUES (?,?,?,?,?,?,?,?)",
+            f[["property_id", "room_type", "date", "occ_pred", "occ_lo", "occ_hi", "source", "run_id"]]
+            .itertuples(index=False, name=None),
+        )
+        if len(price_df):
+            p = price_df.assign(date=price_df["date"].dt.strftime("%Y-%m-%d"), run_id=run_id)
+            p["model_mae"] = p["model_mae"].astype(float)
+            cols = ["property_id", "room_type", "date", "occ_pred", "comp_mean", "price_mid",
+                    "price_lo", "price_hi", "basis", "model_mae", "run_id", "comp_source"]
+            con.executemany(
+                f"INSERT OR REPLACE INTO prices ({', '.join(cols)}) VALUES ({','.join('?' * len(cols))})",
+                p[cols].itertuples(index=False, name=None),
+            )
+        finished = time.time()
+        con.execute(
+            "INSERT INTO runs (run_id, started_at, finished_at, csv_path, periods, n_series, "
+            "comp_min, comp_max, method, lookback_days) VALUES (?,?,?,?,?,?,?,?,?,?)",
+            (run_id, started, finished, str(csv_path), int(periods), int(len(summary)),
+             comp_min, comp_max, method, lookback_days),
+        )
+    con.close()
+    return {
+        "run_id": run_id,
+        "n_series": int(len(summary)),
+        "forecast_rows": int(len(fcst)),
+        "price_rows": int(len(price_df)),
+        "seconds": round(finished - started, 2),
+    }
+
+
+class PrecomputedStore:
+    """讀取端：依 property / room_type / 日期範圍查表"""
+
+    def __init__(self, db_path: str = DEFAULT_DB):
+        if not Path(db_path).exists():
+            raise FileNotFoundError(f"precomputed store not found: {db_path}")
+        self.db_path = db_path
+
+    def _query(self, sql: str, params: tuple) -> pd.DataFrame:
+        con = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+        try:
+            df = pd.read_sql_query(sql, con, params=params)
+        finally:
+            con.close()
+        if "date" in df.columns:
+            df["date"] = pd.to_datetime(df["date"])
+        return df
+
+    def _window(self, table: str, property_id: str, room_type: str, start, days: int) -> pd.DataFrame:
+        # start=None → 這個 key 最近一次 run 的預測起點（舊 run 留下的過去日期不會混進來）
+        if start is None:
+            sql = (f"SELECT * FROM {table} WHERE property_id=? AND room_type=? AND run_id=("
+                   f"SELECT run_id FROM {table} WHERE property_id=? AND room_type=? "
+                   f"ORDER BY rowid DESC LIMIT 1) ORDER BY date LIMIT ?")
+            return self._query(sql, (property_id, room_type, property_id, room_type, int(days)))
+        sql = (f"SELECT * FROM {table} WHERE property_id=? AND room_type=? AND date>=? "
+               f"ORDER BY date LIMIT ?")
+        return self._query(sql, (property_id, room_type, pd.Timestamp(start).strftime("%Y-%m-%d"), int(days)))
+
+    def forecast(self, property_id: str = DEFAULT_PROPERTY, room_type: str = "", start=None, days: int = 7):
+        return self._window("forecasts", property_id, room_type, start, days)
+
+    def prices(self, property_id: str = DEFAULT_PROPERTY, room_type: str = "", start=None, days: int = 7):
+        return self._window("prices", property_id, room_type, start, days)
+
+    def run(self, run_id: str | None = None) -> dict | None:
+        """指定 run 的參數（None → 最近一次）"""
+        if run_id is None:
+            df = self._query("SELECT * FROM runs ORDER BY finished_at DESC LIMIT 1", ())
+        else:
+            df = self._query("SELECT * FROM runs WHERE run_id=?", (run_id,))
+        return None if df.empty else df.iloc[0].to_dict()
+
+    def facts(
+        self,
+        user_question: str,
+        property_id: str = DEFAULT_PROPERTY,
+        room_type: str = "",
+        start=None,
+        days: int = 7,
+        comp_min: float | None = None,
+        comp_max: float | None = None,
+        event_boost: float = 0.0,
+        lookback_days: int | None = None,
+    ) -> dict | None:
+        """
+        組出與 crew_core.build_facts 相同格式的 facts；查不到回 None
+        - lookback_days 跟當次 run 不同 → None（預測本身就不一樣，呼叫端要現算）
+        - 當晚用固定競品價（comp_source=fixed）：comp_min / comp_max 跟 run 不同、或 event_boost ≠ 0
+          → 用存下來的 occ_pred 重新定價（模型從 registry 載入，不重算預測）
+        - 當晚用逐日競品價（comp_store / comp_rates）：呼叫端的 comp_min / comp_max 不採用，
+          event_boost ≠ 0 時用存下來的逐日 comp_mean 重新定價；
+          回報的 comp_min / comp_max 是該期間 comp_mean 的範圍
+        """
+        fc = self.forecast(property_id, room_type, start, days)
+        pr = self.prices(property_id, room_type, start, days)
+        if fc.empty or pr.empty:
+            return None
+        run = self.run(str(pr["run_id"].iloc[-1])) or {}
+        run_lookback = run.get("lookback_days")
+        run_lookback = None if run_lookback is None or pd.isna(run_lookback) else int(run_lookback)
+        if run_lookback != (None if lookback_days is None else int(lookback_days)):
+            return None
+        source = pr["comp_source"].iloc[0] if "comp_source" in pr.columns else None
+        source = "fixed" if source is None or pd.isna(source) else str(source)
+        if event_boost:
+            fc, _ = apply_occupancy_boost(fc, event_boost)
+        if source == "fixed":
+            comp_min = run.get("comp_min") if comp_min is None else float(comp_min)
+            comp_max = run.get("comp_max") if comp_max is None else float(comp_max)
+            if event_boost or comp_min != run.get("comp_min") or comp_max != run.get("comp_max"):
+                pr = self._reprice(fc, property_id, room_type, pr["model_mae"], comp_min=comp_min, comp_max=comp_max)
+        else:
+            comp_min, comp_max = round(float(pr["comp_mean"].min()), 1), round(float(pr["comp_mean"].max()), 1)
+            if event_boost:
+                pr = self._reprice(fc, property_id, room_type, pr["model_mae"], comp_rates=pr[["date", "comp_mean"]])
+        mae = pr["model_mae"].dropna()
+        return {
+            "question": user_question,
+            "forecast_window": f"{fc['date'].min().date().isoformat()} ~ {fc['date'].max().date().isoformat()}",
+            "avg_occ": round(float(fc["occ_pred"].mean()), 1),
+            "min_occ": round(float(fc["occ_pred"].min()), 1),
+            "max_occ": round(float(fc["occ_pred"].max()), 1),
+            "occ_source": str(fc["source"].iloc[0]),
+            "comp_min": comp_min,
+            "comp_max": comp_max,
+            "comp_source": source,
+            "price_mid": round(float(pr["price_mid"].mean()), 1),
+            "price_lo": round(float(pr["price_lo"].mean()), 1),
+            "price_hi": round(float(pr["price_hi"].mean()), 1),
+            "pricing_basis": str(pr["basis"].iloc[0]),
+            "xgb_mae": None if mae.empty else round(float(mae.iloc[0]), 2),
+        }
+
+    @staticmethod
+    def _reprice(fc: pd.DataFrame, property_id: str, room_type: str, mae, comp_rates=None,
+                 comp_min=None, comp_max=None) -> pd.DataFrame:
+        """
+        存下來的 occ_pred + 競品價（呼叫端的固定值，或當晚存下的逐日 comp_mean）→ 價帶
+        模型用 precompute 當時存進 registry 的那一個
+        """
+        from model_registry import get_model_registry
+
+        hit = get_model_registry().load(f"{property_id}__{room_type}" if room_type else property_id)
+        grid = infer_price_grid(hit[0] if hit is not None else None, fc[["date", "occ_pred"]],
+                                comp_rates=comp_rates, comp_min=comp_min, comp_max=comp_max)
+        return grid.assign(model_mae=mae.iloc[0] if hit is not None and len(mae) else None)
+
+
+def _parse_comp_stores(items: list[str]):
+    """["DIR"] → 單一 store；["P001=DIR", ...] → {property_id: store}"""
+    if not items:
+        return None
+    if len(items) == 1 and "=" not in items[0]:
+        return CompetitorRateStore.open(items[0])
+    pairs = [item.split("=", 1) for item in items]
+    if any(len(p) != 2 for p in pairs):
+        raise SystemExit("--comp-store: 多館請用 PROPERTY_ID=DIR")
+    return {pid: CompetitorRateStore.open(d) for pid, d in pairs}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="nightly forecast + price precompute")
+    ap.add_argument("--csv", default="sample_data/occupancy_history.csv")
+    ap.add_argument("--db", default=DEFAULT_DB)
+    ap.add_argument("--days", type=int, default=30)
+    ap.add_argument("--lookback", type=int, default=None)
+    ap.add_argument("--comp-min", type=float, default=120.0)
+    ap.add_argument("--comp-max", type=float, default=180.0)
+    ap.add_argument("--method", default="prophet", help="prophet / hw / seasonal_naive / ses")
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--comp-store", nargs="*", default=[],
+                    help="CompetitorRateStore directory (comp_rates.py); multi-property: PROPERTY_ID=DIR ...")
+    args = ap.parse_args(argv)
+    out = run_precompute(
+        args.csv, db_path=args.db, periods=args.days, lookback_days=args.lookback,
+        comp_min=args.comp_min, comp_max=args.comp_max, method=args.method, max_workers=args.workers,
+        comp_store=_parse_comp_stores(args.comp_store),
+    )
+    print(out)
+
+
+if __name__ == "__main__":
+    main()
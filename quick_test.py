@@ -33,7 +33,8 @@ def main():
 
     # 2) 定價（有 price → XGBoost，沒有 → 規則）
     xgb_tuple = train_xgb_pricing_model(hist)  # 需 CSV 有 'price' 才會生效，否則 None
-    price = infer_price_range(xgb_tuple, avg_occ=avg_occ, comp_min=COMP_MIN, comp_max=COMP_MAX)
+    xgb_model = xgb_tuple[0] if xgb_tuple is not None else None
+    price = infer_price_range(xgb_model, avg_occ=avg_occ, comp_min=COMP_MIN, comp_max=COMP_MAX)
 
         # 3) 輸出摘要
     print("\n=== OCCUPANCY FORECAST ===")
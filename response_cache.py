@@ -0,0 +1,193 @@
+# response_cache.py
+"""
+run_crew 回覆快取 + 同請求合併（in-flight coalescing）
+
+key = 正規化後的問題 + facts（數字部分）+ 模型名稱
+- TTL + LRU 淘汰
+- 同一個 key 同時有多個請求 → 只跑一次 kickoff，其他人等同一個結果
+- asyncio 版的 in-flight 也存 concurrent.futures.Future（等待端 asyncio.wrap_future）：
+  run_crew(concurrent=True) 每次呼叫各自 asyncio.run，不同 thread / event loop 的請求也能合併
+"""
+from __future__ import annotations
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from tracing import current
+
+
+class OwnerCancelled(Exception):
+    """同請求合併：負責計算的那個被取消了；等待者收到這個就自己重新搶著算"""
+
+
+_TRAILING = re.compile(r"[\s?？!！。．.,，~～]+$")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_question(q: str) -> str:
+    """全形轉半形、小寫、空白壓縮、去掉結尾標點"""
+    q = unicodedata.normalize("NFKC", q or "").strip().lower()
+    q = _SPACES.sub(" ", q)
+    return _TRAILING.sub("", q)
+
+
+def make_response_key(question: str, facts: dict, model: str) -> str:
+    body = {k: v for k, v in facts.items() if k != "question"}
+    raw = json.dumps(
+        {"q": normalize_question(question), "facts": body, "model": model},
+        sort_keys=True, ensure_ascii=False, default=str,
+    )
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = 512, ttl_s: float | None = 3600.0):
+        self.max_entries = int(max_entries)
+        self.ttl_s = ttl_s
+        self._data: OrderedDict[str, tuple[float, object]] = OrderedDict()
+        self._inflight: dict[str, Future] = {}
+        self._ainflight: dict[str, Future] = {}  # 不綁 event loop
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def _get_locked(self, key: str):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        ts, value = item
+        if self.ttl_s is not None and time.time() - ts > self.ttl_s:
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return item
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._get_locked(key)
+            return None if item is None else item[1]
+
+    def put(self, key: str, value) -> None:
+        with self._lock:
+            self._data[key] = (time.time(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def get_or_run(self, key: str, fn):
+        """命中 → 直接回；有人正在算 → 等他；否則自己算（錯誤不快取，會傳給所有等待者）"""
+        with self._lock:
+            item = self._get_locked(key)
+            if item is not None:
+                self.hits += 1
+                current().set(response_cache="hit")
+                return item[1]
+            fut = self._inflight.get(key)
+            if fut is not None:
+                self.coalesced += 1
+                current().set(response_cache="coalesced")
+                owner = False
+            else:
+                self.misses += 1
+                current().set(response_cache="miss")
+                fut = self._inflight[key] = Future()
+                owner = True
+
+        if not owner:
+            return fut.result()
+
+        try:
+            value = fn()
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        else:
+            self.put(key, value)
+            fut.set_result(value)
+            return value
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    async def aget_or_run(self, key: str, coro_fn):
+        """
+        get_or_run 的 asyncio 版：coro_fn() 回傳 coroutine；等待中不會卡住 event loop
+        負責計算的請求被取消（客戶斷線）→ 不把 CancelledError 傳給等待者，由其中一個接手重算
+        """
+        while True:
+            with self._lock:
+                item = self._get_locked(key)
+                if item is not None:
+                    self.hits += 1
+                    current().set(response_cache="hit")
+                    return item[1]
+                fut = self._ainflight.get(key)
+                if fut is not None:
+                    self.coalesced += 1
+                    current().set(response_cache="coalesced")
+                    owner = False
+                else:
+                    self.misses += 1
+                    current().set(response_cache="miss")
+                    fut = self._ainflight[key] = Future()
+                    owner = True
+
+            if not owner:
+                try:
+                    return await asyncio.shield(asyncio.wrap_future(fut))
+                except OwnerCancelled:
+                    continue
+            return await self._arun_owner(key, fut, coro_fn)
+
+    async def _arun_owner(self, key: str, fut: Future, coro_fn):
+        try:
+            value = await coro_fn()
+        except asyncio.CancelledError:
+            fut.set_exception(OwnerCancelled())
+            raise
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        else:
+            self.put(key, value)
+            fut.set_result(value)
+            return value
+        finally:
+            with self._lock:
+                if self._ainflight.get(key) is fut:
+                    self._ainflight.pop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "size": len(self._data),
+        }
+
+
+_DEFAULT_CACHE: ResponseCache | None = None
+
+
+def get_response_cache() -> ResponseCache:
+    """全域快取；RESPONSE_CACHE_TTL（秒）/ RESPONSE_CACHE_MAX 可調"""
+    global _DEFAULT_CACHE
+    if _DEFAULT_CACHE is None:
+        ttl = os.getenv("RESPONSE_CACHE_TTL", "3600")
+        _DEFAULT_CACHE = ResponseCache(
+            max_entries=int(os.getenv("RESPONSE_CACHE_MAX", "512")),
+            ttl_s=float(ttl) if ttl else None,
+        )
+    return _DEFAULT_CACHE
@@ -0,0 +1,102 @@
+# scenarios.py
+"""
+What-if 情境掃描：boost_pct × comp_min × comp_max × date
+
+    from scenarios import scenario_sweep
+    grid = scenario_sweep(hist, boosts=np.linspace(-10, 20, 50),
+                          comp_mins=np.linspace(80, 200, 50), comp_maxs=np.linspace(120, 300, 50))
+
+預測與定價模型各 fit 一次；所有情境共用一次 batched predict：
+模型特徵只看 (occ, comp_mean, date)，所以只對「boost × 不重複的 comp_mean × date」預測，
+再用索引展開回每個 (comp_min, comp_max) 組合。
+"""
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+from data_utils import get_pricing_model, price_arrays, simple_occupancy_forecast
+
+
+def _occ_matrix(fcst: pd.DataFrame, boosts: np.ndarray) -> np.ndarray:
+    """(B, D)：與 apply_occupancy_boost 相同的乘法加成 + clip"""
+    base = fcst["occ_pred"].to_numpy(dtype=float)
+    return np.clip(base[None, :] * (1.0 + boosts[:, None] / 100.0), 0.0, 100.0)
+
+
+def scenario_sweep(
+    history: pd.DataFrame,
+    boosts,
+    comp_mins,
+    comp_maxs,
+    periods: int = 7,
+    lookback_days: int | None = None,
+    model_key: str | None = None,
+    fcst: pd.DataFrame | None = None,
+    trained=None,
+    by_date: bool = True,
+) -> pd.DataFrame:
+    """
+    回傳 tidy frame（一列一個情境 × 日期）：
+        boost_pct, comp_min, comp_max, date, occ_pred, comp_mean, price_mid, price_lo, price_hi, basis
+    - comp_min > comp_max 的組合會被略過
+    - fcst / trained：已經 fit 好的預測（未加成）與 (model, mae)，給了就不再 fit
+    - by_date=False：每個情境一列（各日取平均），適合直接畫 heatmap
+    """
+    boosts = np.asarray(boosts, dtype=float).ravel()
+    comp_mins = np.asarray(comp_mins, dtype=float).ravel()
+    comp_maxs = np.asarray(comp_maxs, dtype=float).ravel()
+
+    if fcst is None:
+        fcst, _ = simple_occupancy_forecast(history, lookback_days=lookback_days, boost=0.0, periods=periods)
+    if trained is None:
+        trained = get_pricing_model(history, key=model_key)
+    model = trained[0] if trained is not None else None
+
+    dates = pd.DatetimeIndex(fcst["date"])
+    D, B = len(dates), len(boosts)
+    occ = _occ_matrix(fcst, boosts)  # (B, D)
+
+    # 有效的 (comp_min, comp_max) 組合與其 comp_mean；只對不重複的 comp_mean 預測
+    mi, ma = np.meshgrid(comp_mins, comp_maxs, indexing="ij")
+    valid = mi <= ma
+    pair_min, pair_max = mi[valid], ma[valid]
+    uniq, inv = np.unique((pair_min + pair_max) / 2.0, return_inverse=True)
+    P, U = len(pair_min), len(uniq)
+
+    # 特徵網格 (B, U, D) → 一次 predict
+    f_occ = np.broadcast_to(occ[:, None, :], (B, U, D)).ravel()
+    f_comp = np.broadcast_to(uniq[None, :, None], (B, U, D)).ravel()
+    f_date = np.tile(dates.values, B * U)
+    mid, band, basis = price_arrays(model, f_occ, f_comp, f_date)
+    mid, band = mid.reshape(B, U, D), band.reshape(B, U, D)
+
+    # 展開回每個情境 (B, P, D)
+    mid, band = mid[:, inv, :], band[:, inv, :]
+    lo, hi = mid - band, mid + band
+    if not by_date:
+        return pd.DataFrame({
+            "boost_pct": np.repeat(boosts, P),
+            "comp_min": np.tile(pair_min, B),
+            "comp_max": np.tile(pair_max, B),
+            "occ_pred": np.repeat(occ.mean(axis=1), P),
+            "comp_mean": np.tile(uniq[inv], B),
+            "price_mid": mid.mean(axis=2).ravel(),
+            "price_lo": lo.mean(axis=2).ravel(),
+            "price_hi": hi.mean(axis=2).ravel(),
+            "basis": basis,
+        })
+
+    return pd.DataFrame({
+        "boost_pct": np.repeat(boosts, P * D),
+        "comp_min": np.tile(np.repeat(pair_min, D), B),
+        "comp_max": np.tile(np.repeat(pair_max, D), B),
+        "date": np.tile(dates.values, B * P),
+        "occ_pred": np.repeat(occ, P, axis=0).ravel(),
+        "comp_mean": np.tile(np.repeat(uniq[inv], D), B),
+        "price_mid": mid.ravel(),
+        "price_lo": lo.ravel(),
+        "price_hi": hi.ravel(),
+        "basis": basis,
+    })
+
@@ -0,0 +1,221 @@
+# service.py
+"""
+本機 async HTTP 服務：/forecast、/price、/concierge
+
+    python service.py --port 8000 --workers 2            # LLM 走 CrewAI（OPENAI_*）
+    python service.py --llm stub                           # 離線：StubLLM
+    curl -XPOST localhost:8000/price -d '{"comp_min":120,"comp_max":180}'
+
+- CPU 重的 fit（Prophet / XGB / facts）丟到常駐的 process pool，event loop 不會被卡住；
+  worker process 不會結束，forecast cache / model registry 留在記憶體裡
+- pool 用 model_artifacts.forkserver_context()：套件與模型在 forkserver 載入一次，worker 共用
+- 同樣的請求同時進來 → 合併成一次計算（Coalescer）
+- /concierge 的 LLM 部分用 crew_core.arun_crew（DAG 並行 + 回覆快取）
+- 請求只能指定 property_id（→ <data_dir>/<property_id>.csv）或 data_dir 底下的 csv_path；
+  data_dir 外的路徑一律 400（HOTEL_DATA_DIR，預設 = --csv 所在目錄）
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from mini_http import serve
+from model_artifacts import forkserver_context
+from response_cache import OwnerCancelled
+
+DEFAULT_CSV = "sample_data/occupancy_history.csv"
+
+
+# ---------- worker（在 process pool 裡跑；必須是 top-level function） ----------
+def _forecast_job(csv_path: str, lookback_days: int | None, boost: float, periods: int) -> dict:
+    from data_utils import load_occupancy_csv, simple_occupancy_forecast
+    hist = load_occupancy_csv(csv_path)
+    fcst, summary = simple_occupancy_forecast(hist, lookback_days=lookback_days, boost=boost, periods=periods)
+    rows = fcst.assign(date=fcst["date"].dt.strftime("%Y-%m-%d")).to_dict(orient="records")
+    return {"summary": summary, "forecast": rows}
+
+
+def _price_job(csv_path: str, comp_min: float | None, comp_max: float | None) -> dict:
+    from data_utils import load_occupancy_csv, dynamic_pricing
+    return dynamic_pricing(load_occupancy_csv(csv_path), comp_min=comp_min, comp_max=comp_max)
+
+
+def _facts_job(question: str, csv_path: str, comp_min: float, comp_max: float) -> dict:
+    from crew_core import build_facts
+    return build_facts(question, csv_path=csv_path, comp_min=comp_min, comp_max=comp_max)
+
+
+# ---------- 請求合併 ----------
+class Coalescer:
+    """同 key 的請求同時進來只算一次；算完就移除（結果快取交給下層 cache）"""
+
+    def __init__(self):
+        self._inflight: dict[str, asyncio.Future] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def run(self, key: str, coro_fn):
+        """負責計算的請求被取消 → 等待者不跟著失敗，其中一個接手重算"""
+        while True:
+            fut = self._inflight.get(key)
+            if fut is None:
+                break
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(fut)
+            except OwnerCancelled:
+                continue
+        fut = self._inflight[key] = asyncio.get_running_loop().create_future()
+        self.started += 1
+        try:
+            value = await coro_fn()
+        except asyncio.CancelledError:
+            fut.set_exception(OwnerCancelled())
+            fut.exception()
+            raise
+        except BaseException as e:
+            fut.set_exception(e)
+            fut.exception()
+            raise
+        else:
+            fut.set_result(value)
+            return value
+        finally:
+            if self._inflight.get(key) is fut:
+                self._inflight.pop(key)
+
+
+def _key(endpoint: str, params: dict) -> str:
+    raw = endpoint + json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _opt_float(v):
+    return None if v is None else float(v)
+
+
+# ---------- 服務 ----------
+class HotelService:
+    def __init__(self, workers: int | None = None, llm=None, csv_path: str = DEFAULT_CSV,
+                 data_dir: str | None = None):
+        # 不用 fork：fork 出來的 worker 會繼承已連線的 socket，client 端收不到 EOF
+        # forkserver 先 import 重型套件、預載定價模型，worker 從它 fork 出來就共用這些頁面
+        ctx = forkserver_context()
+        self.pool = ProcessPoolExecutor(
+            max_workers=workers or max(1, (os.cpu_count() or 2) - 1), mp_context=ctx
+        )
+        self.llm = llm
+        self.csv_path = csv_path
+        data_dir = data_dir or os.getenv("HOTEL_DATA_DIR") or os.path.dirname(csv_path) or "."
+        self.data_dir = os.path.realpath(data_dir)
+        self.coalescer = Coalescer()
+
+    def _csv_path(self, body: dict) -> str:
+        """請求裡的 property_id / csv_path → data_dir 底下的 CSV；跑出 data_dir 或不是 .csv → ValueError（400）"""
+        if body.get("property_id") is not None:
+            name = f"{body['property_id']}.csv"
+        elif body.get("csv_path") is not None:
+            name = str(body["csv_path"])
+        else:
+            return self.csv_path
+        path = os.path.realpath(os.path.join(self.data_dir, name))
+        if os.path.commonpath([path, self.data_dir]) != self.data_dir or not path.endswith(".csv"):
+            raise ValueError(f"csv must be a .csv file under the service data dir: {name!r}")
+        if not os.path.isfile(path):
+            raise ValueError(f"no such csv: {name!r}")
+        return path
+
+    async def _offload(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.pool, fn, *args)
+
+    async def forecast(self, body: dict, query: dict):
+        params = dict(
+            csv_path=self._csv_path(body),
+            lookback_days=body.get("lookback_days"),
+            boost=float(body.get("boost", 0.0)),
+            periods=int(body.get("periods", 7)),
+        )
+        out = await self.coalescer.run(
+            _key("forecast", params), lambda: self._offload(_forecast_job, *params.values())
+        )
+        return 200, out
+
+    async def price(self, body: dict, query: dict):
+        params = dict(
+            csv_path=self._csv_path(body),
+            comp_min=_opt_float(body.get("comp_min", 120.0)),
+            comp_max=_opt_float(body.get("comp_max", 180.0)),
+        )
+        out = await self.coalescer.run(
+            _key("price", params), lambda: self._offload(_price_job, *params.values())
+        )
+        return 200, out
+
+    async def concierge(self, body: dict, query: dict):
+        from crew_core import arun_crew
+
+        question = str(body["question"])
+        params = dict(
+            question=question,
+            csv_path=self._csv_path(body),
+            comp_min=float(body.get("comp_min", 120.0)),
+            comp_max=float(body.get("comp_max", 180.0)),
+        )
+
+        async def compute():
+            facts = await self._offload(_facts_job, *params.values())
+            return await arun_crew(question, llm=self.llm, facts=facts)
+
+        out = await self.coalescer.run(_key("concierge", params), compute)
+        return 200, out
+
+    async def health(self, body: dict, query: dict):
+        return 200, {
+            "status": "ok",
+            "inflight_started": self.coalescer.started,
+            "coalesced": self.coalescer.coalesced,
+        }
+
+    def routes(self) -> dict:
+        return {
+            ("POST", "/forecast"): self.forecast,
+            ("POST", "/price"): self.price,
+            ("POST", "/concierge"): self.concierge,
+            ("GET", "/health"): self.health,
+        }
+
+    def close(self) -> None:
+        self.pool.shutdown(cancel_futures=True)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Hotel pricing / concierge HTTP service")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8000)
+    ap.add_argument("--workers", type=int, default=None, help="CPU worker process 數")
+    ap.add_argument("--csv", default=DEFAULT_CSV)
+    ap.add_argument("--data-dir", default=None, help="請求可讀的 CSV 目錄（預設 HOTEL_DATA_DIR 或 --csv 所在目錄）")
+    ap.add_argument("--llm", choices=["crewai", "stub"], default="crewai")
+    ap.add_argument("--stub-latency", type=float, default=0.0)
+    args = ap.parse_args(argv)
+
+    llm = None
+    if args.llm == "stub":
+        from stub_llm import StubLLM
+        llm = StubLLM(latency_s=args.stub_latency)
+
+    svc = HotelService(workers=args.workers, llm=llm, csv_path=args.csv, data_dir=args.data_dir)
+    print(f"hotel service on http://{args.host}:{args.port}  (llm={args.llm})")
+    try:
+        asyncio.run(serve(svc.routes(), args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        svc.close()
+
+
+if __name__ == "__main__":
+    main()
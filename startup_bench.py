@@ -0,0 +1,66 @@
+# startup_bench.py
+"""
+冷啟動量測：每個模組都在全新的 python process 裡 import，量 import 時間，
+並列出被順便載入的重型套件（prophet / xgboost / sklearn / crewai）。
+
+    python startup_bench.py                 # 預設模組
+    python startup_bench.py data_utils --budget 1.5   # 超過 1.5 秒 → exit code 1
+"""
+from __future__ import annotations
+import argparse
+import json
+import subprocess
+import sys
+
+DEFAULT_MODULES = ["data_utils", "backends", "fast_forecast", "portfolio", "crew_core"]
+HEAVY = ["prophet", "xgboost", "sklearn", "crewai", "cmdstanpy"]
+
+_PROBE = """
+import json, sys, time
+t = time.perf_counter()
+import {mod}
+dt = time.perf_counter() - t
+heavy = [m for m in {heavy!r} if m in sys.modules]
+print(json.dumps({{"seconds": dt, "heavy_loaded": heavy}}))
+"""
+
+
+def measure(mod: str, repeat: int = 3) -> dict:
+    """同一模組跑 repeat 次取最小值（減少磁碟快取影響）"""
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", _PROBE.format(mod=mod, heavy=HEAVY)],
+            capture_output=True, text=True,
+        )
+        if out.returncode != 0:
+            return {"module": mod, "error": out.stderr.strip().splitlines()[-1:]}
+        runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    best = min(runs, key=lambda r: r["seconds"])
+    return {"module": mod, **best}
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="import-time benchmark")
+    ap.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--budget", type=float, default=None, help="每個模組允許的最長 import 秒數")
+    args = ap.parse_args(argv)
+
+    over = False
+    print(f"{'module':<16}{'import(s)':>10}  heavy deps loaded")
+    for mod in args.modules:
+        r = measure(mod, repeat=args.repeat)
+        if "error" in r:
+            print(f"{mod:<16}{'ERROR':>10}  {r['error']}")
+            over = True
+            continue
+        flag = ""
+        if args.budget is not None and r["seconds"] > args.budget:
+            flag, over = "  ← over budget", True
+        print(f"{mod:<16}{r['seconds']:>10.3f}  {', '.join(r['heavy_loaded']) or '-'}{flag}")
+    return 1 if over else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,17 @@
 import os
-import io
+import hashlib
+import tempfile
 import pandas as pd
 import streamlit as st
 from dotenv import load_dotenv
 
 
-from data_utils import load_occupancy_csv, simple_occupancy_forecast, dynamic_price_suggestion
+from data_utils import load_occupancy_csv, simple_occupancy_forecast
+from data_utils import apply_occupancy_boost, get_pricing_model, price_with_model, recent_avg_occ, _next_week
 from crew_core import run_crew
-from data_utils import fit_prophet_and_forecast, summarize_forecast, infer_price_range
+from precompute import DEFAULT_DB, PrecomputedStore
+from scenarios import scenario_sweep
+import tracing
 
 
 load_dotenv()
@@ -18,22 +22,67 @@ st.title("Hotel CrewAI Assistant — RMS")
 st.caption("多代理人｜入住率 × 動態定價｜雙語回覆")
 
 
+# --- Compute layer：fit 與 apply 分開 ---
+# fit（Prophet / XGB）依「資料指紋 + lookback」快取成跨 session 共用的 resource；
+# boost 與競品價只重跑便宜的後處理。max_entries + ttl 讓記憶體有上限。
+# cached 物件是共用的：後處理一律回新 frame，不要 in-place 改。
+def _data_key(path: str) -> str:
+    st_ = os.stat(path)
+    return f"{os.path.abspath(path)}:{st_.st_size}:{st_.st_mtime_ns}"
+
+
+@st.cache_resource(max_entries=4, ttl=3600, show_spinner=False)
+def cached_history(data_key: str, path: str) -> pd.DataFrame:
+    return load_occupancy_csv(path)
+
+
+@st.cache_resource(max_entries=16, ttl=3600, show_spinner="預測模型訓練中…")
+def cached_base_forecast(data_key: str, lookback: int, _df: pd.DataFrame) -> pd.DataFrame:
+    fcst, _ = simple_occupancy_forecast(_df, lookback_days=lookback, boost=0.0)
+    return fcst
+
+
+@st.cache_resource(max_entries=4, ttl=3600, show_spinner="定價模型訓練中…")
+def cached_pricer(data_key: str, model_key: str | None, _df: pd.DataFrame):
+    # model_key：registry key（上傳檔 = 內容指紋；None → 由資料推導），不同上傳不會共用同一個模型
+    return get_pricing_model(_df, key=model_key), recent_avg_occ(_df), _next_week(_df)
+
+
+@st.cache_data(max_entries=8, ttl=3600, show_spinner="情境掃描中…")
+def cached_sweep(data_key, model_key, lookback, boosts, comp_mins, comp_maxs, _df):
+    return scenario_sweep(
+        _df, boosts, comp_mins, comp_maxs,
+        fcst=cached_base_forecast(data_key, lookback, _df),
+        trained=cached_pricer(data_key, model_key, _df)[0],
+        by_date=False,
+    )
+
+
 # --- Sidebar: Data/Options ---
 st.sidebar.header("📂 資料與參數")
 
 
 uploaded = st.sidebar.file_uploader("上傳入住率 CSV (date, occupancy_pct)", type=["csv"])
 
+csv_path = None
+model_key = None
 if uploaded is not None:
-    data_bytes = uploaded.read()
-    df = pd.read_csv(io.BytesIO(data_bytes))
+    data_bytes = uploaded.getvalue()
+    # run_crew 吃檔案路徑：上傳內容依 hash 落地一次；同一個 hash 也是定價模型的 registry key
+    model_key = f"upload_{hashlib.sha1(data_bytes).hexdigest()[:12]}"
+    csv_path = os.path.join(tempfile.gettempdir(), f"{model_key}.csv")
+    if not os.path.exists(csv_path):
+        with open(csv_path, "wb") as fh:
+            fh.write(data_bytes)
+    df = cached_history(_data_key(csv_path), csv_path)
 else:
     # 使用內建 sample
     sample_path = os.path.join("sample_data", "occupancy_history.csv")
-if os.path.exists(sample_path):
-        df = load_occupancy_csv(sample_path)
+    if os.path.exists(sample_path):
+        csv_path = sample_path
+        df = cached_history(_data_key(sample_path), sample_path)
         st.sidebar.info("使用範例資料 sample_data/occupancy_history.csv")
-else:
+    else:
         df = pd.DataFrame(columns=["date", "occupancy_pct"])  # 空表
 
 
@@ -44,6 +93,16 @@ boost = st.sidebar.slider("活動/季節加成 (％)", min_value=-10.0, max_valu
 comp_min = st.sidebar.number_input("競品價（低）USD", value=120.0, min_value=50.0, max_value=500.0, step=1.0)
 comp_max = st.sidebar.number_input("競品價（高）USD", value=180.0, min_value=50.0, max_value=800.0, step=1.0)
 
+# 夜間預算結果（python precompute.py）；只適用未上傳的資料
+store_path = os.getenv("PRECOMPUTED_DB", DEFAULT_DB)
+use_store = False
+if uploaded is None and os.path.exists(store_path):
+    use_store = st.sidebar.checkbox(f"使用夜間預算結果（{store_path}）", value=True)
+
+show_trace = st.sidebar.checkbox("🔍 診斷面板（tracing）", value=tracing.enabled())
+if show_trace and not tracing.enabled():
+    tracing.enable(os.getenv("HOTEL_TRACE_PATH", tracing.DEFAULT_PATH))
+
 
 st.sidebar.divider()
 openai_key = os.getenv("OPENAI_API_KEY")
@@ -63,21 +122,28 @@ if df.empty:
 # 1) 顯示最近 10 筆
 st.dataframe(df.tail(10), use_container_width=True)
 
+data_key = _data_key(csv_path)
+
 # 2) 入住率預測（支援 lookback / boost）
-fcst, summary = simple_occupancy_forecast(
-    df,
-    lookback_days=lookback,
-    boost=boost,
-)
-est = float(summary["avg_occ"])
-rationale = f"{summary['start']} → {summary['end']} 平均 {est:.1f}%"
+# 預算結果只在 lookback 相同時採用；競品價 / 加成不同 → 用存下來的 occ_pred 重新定價
+stored = PrecomputedStore(store_path).facts(
+    "", comp_min=comp_min, comp_max=comp_max, event_boost=boost, lookback_days=lookback,
+) if use_store else None
+if stored is not None:
+    est = float(stored["avg_occ"])
+    rationale = f"{stored['forecast_window']} 平均 {est:.1f}%（預算結果）"
+else:
+    fcst, summary = apply_occupancy_boost(cached_base_forecast(data_key, lookback, df), boost)
+    est = float(summary["avg_occ"])
+    rationale = f"{summary['start']} → {summary['end']} 平均 {est:.1f}%"
 
 # 3) 動態定價（強韌解包：不管回傳是 dict / 二值 / 三值都能吃）
-try:
-    result = dynamic_price_suggestion(df, comp_min, comp_max)
-except TypeError:
-    # 若函式其實吃的是平均入住率，就用 est 再試一次
-    result = dynamic_price_suggestion(est, comp_min, comp_max)
+if stored is not None:
+    result = {"lo": stored["price_lo"], "hi": stored["price_hi"],
+              "basis": stored["pricing_basis"], "avg_occ": est}
+else:
+    trained, avg_occ, price_dates = cached_pricer(data_key, model_key, df)
+    result = price_with_model(trained, avg_occ, price_dates, comp_min=comp_min, comp_max=comp_max)
 
 if isinstance(result, dict):
     low = float(result["lo"])
@@ -102,6 +168,37 @@ else:
 st.info(f"估計下週入住率：{est:.1f}%｜依據：{rationale}")
 st.info(f"參考動態房價：USD {low:.1f} – {high:.1f}｜依據：{price_reason}")
 
+# What-if：boost × 競品價 heatmap（fit 一次、整個網格一次 batched predict）
+with st.expander("🔥 情境分析（活動加成 × 競品價）"):
+    import altair as alt
+    import numpy as np
+
+    n = st.select_slider("每軸格點數", options=[10, 20, 30, 50], value=20)
+    b_lo, b_hi = st.slider("加成範圍 (％)", -10.0, 20.0, (-10.0, 20.0), step=0.5)
+    cmin_lo, cmin_hi = st.slider("競品低價範圍 USD", 50.0, 500.0, (80.0, 200.0), step=5.0)
+    cmax_lo, cmax_hi = st.slider("競品高價範圍 USD", 50.0, 800.0, (120.0, 300.0), step=5.0)
+    sweep = cached_sweep(
+        data_key, model_key, lookback,
+        tuple(np.linspace(b_lo, b_hi, n).round(2)),
+        tuple(np.linspace(cmin_lo, cmin_hi, n).round(1)),
+        tuple(np.linspace(cmax_lo, cmax_hi, n).round(1)),
+        df,
+    )
+    if sweep.empty:
+        st.warning("競品低價範圍全部高於高價範圍，沒有可用情境。")
+    else:
+        b_sel = st.select_slider("顯示的加成 (％)", options=sorted(sweep["boost_pct"].unique()))
+        view = sweep[sweep["boost_pct"] == b_sel]
+        st.altair_chart(
+            alt.Chart(view).mark_rect().encode(
+                x=alt.X("comp_min:O", title="競品低價"),
+                y=alt.Y("comp_max:O", title="競品高價", sort="descending"),
+                color=alt.Color("price_mid:Q", title="建議價中位"),
+                tooltip=["comp_min", "comp_max", "occ_pred", "price_lo", "price_mid", "price_hi"],
+            ),
+            use_container_width=True,
+        )
+
 
 # Chat
 st.subheader("客人問題 / 問句")
@@ -114,19 +211,19 @@ if run:
         st.warning("請先輸入一個問題")
         st.stop()
 
-    facts = {
-        "est_occupancy_pct": est if not df.empty else None,
-        "occ_rationale": rationale if not df.empty else None,
-        "event_boost_pct": boost,
-        "comp_min_usd": float(comp_min),
-        "comp_max_usd": float(comp_max),
-        "occ_hint": "資料由 UI 提供；如為空則交由模型估算。",
-    }
-
     with st.spinner("Crew 正在協作中…"):
-        out = run_crew(user_q, facts)
+        out = run_crew(
+            user_q,
+            csv_path=csv_path,
+            comp_min=float(comp_min),
+            comp_max=float(comp_max),
+            event_boost=boost,
+            store=store_path if use_store else None,
+        )
+    facts = out["facts"]
 
-    st.success("完成！")
+    st.success("完成！" + ("（快取）" if out["cached"] else "")
+               + ("" if out["route"] == "crew" else f"（模板回覆：{out['route']}，未呼叫 LLM）"))
 
 
 
@@ -142,4 +239,29 @@ if run:
 
 
     st.markdown("### 🧾 模型回覆（Final Output）")
-    st.write(out)
+    st.write(out["final"])
+
+
+# Diagnostics：最近一次完整 trace（每個階段耗時、列數、快取命中、token）
+def _trace_frame(spans: list[dict]) -> pd.DataFrame:
+    depth = {}
+    for r in spans:  # 已依開始時間排序 → parent 一定先出現
+        depth[r["span_id"]] = depth.get(r["parent_id"], -1) + 1
+    return pd.DataFrame([
+        {
+            "stage": "　" * depth[r["span_id"]] + r["name"],
+            "ms": r["duration_ms"],
+            **{k: (v if isinstance(v, (int, float, str, bool)) or v is None else str(v)) for k, v in r["attrs"].items()},
+            "error": r["error"],
+        }
+        for r in spans
+    ])
+
+
+if show_trace:
+    with st.expander("🔍 診斷（最近一次 trace）", expanded=False):
+        spans = tracing.last_trace()
+        if spans:
+            st.dataframe(_trace_frame(spans), use_container_width=True)
+        else:
+            st.caption("尚無 trace；按下「產生回覆」後會出現 run_crew 的各階段耗時。")
@@ -0,0 +1,65 @@
+# stub_llm.py
+"""
+本機 stub LLM：不連網、不花 token，回覆可重現
+
+給快取 / 並行 / 壓測在離線環境使用：
+    run_crew("下週雙人房多少？", llm=StubLLM(latency_s=0.2))
+或設定環境變數 HOTEL_LLM=stub，run_crew 預設就用它。
+"""
+from __future__ import annotations
+import asyncio
+import hashlib
+import threading
+import time
+
+
+def estimate_tokens(text: str) -> int:
+    """粗估 token 數（中英混合約 1 token ≈ 2~4 字元，取 3）"""
+    return max(1, len(text) // 3)
+
+
+class StubLLM:
+    """complete(prompt, role) -> str；記錄呼叫次數與 token 數"""
+
+    def __init__(self, latency_s: float = 0.0, model: str = "stub"):
+        self.latency_s = float(latency_s)
+        self.model = model
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def render(prompt: str, role: str = "") -> str:
+        """回覆內容：角色 + prompt 第一行 + prompt hash（同 prompt 同回覆）"""
+        head = next((line for line in prompt.splitlines() if line.strip()), "")
+        tag = hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:8]
+        return f"[{role or 'assistant'}] {head}\n(stub reply {tag})"
+
+    def record(self, prompt: str, text: str) -> None:
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += estimate_tokens(prompt)
+            self.completion_tokens += estimate_tokens(text)
+
+    def complete(self, prompt: str, role: str = "") -> str:
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        text = self.render(prompt, role)
+        self.record(prompt, text)
+        return text
+
+    async def acomplete(self, prompt: str, role: str = "") -> str:
+        """asyncio 版：等待用 asyncio.sleep，不佔 thread"""
+        if self.latency_s:
+            await asyncio.sleep(self.latency_s)
+        text = self.render(prompt, role)
+        self.record(prompt, text)
+        return text
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+        }
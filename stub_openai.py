@@ -0,0 +1,105 @@
+# stub_openai.py
+"""
+OpenAI 相容的本機 stub server（離線壓測用）
+
+    python stub_openai.py --port 8901 --latency 0.5
+    OPENAI_BASE_URL=http://127.0.0.1:8901/v1 OPENAI_API_KEY=stub python service.py
+
+支援 POST /v1/chat/completions（非串流）與 GET /v1/models；
+回覆內容由 StubLLM 產生，usage 欄位用粗估 token 數。
+
+模擬供應商限流（測 llm_client 的退避 / 背壓）：
+    python stub_openai.py --rpm 600 --tpm 200000 --max-inflight 8
+超過就回 429 + Retry-After。
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import time
+import uuid
+
+from llm_client import TokenBucket
+from mini_http import serve
+from stub_llm import StubLLM, estimate_tokens
+
+
+def build_routes(llm: StubLLM, rpm: float | None = None, tpm: float | None = None,
+                 max_inflight: int | None = None) -> dict:
+    rpm_bucket, tpm_bucket = TokenBucket(rpm), TokenBucket(tpm)
+    inflight = 0
+    rejected = 0
+
+    def too_many(wait: float):
+        nonlocal rejected
+        rejected += 1
+        return 429, {"error": {"type": "rate_limit_exceeded", "message": "stub rate limit"}}, \
+            {"Retry-After": f"{max(wait, 0.05):.2f}"}
+
+    async def chat(body: dict, query: dict):
+        nonlocal inflight
+        messages = body.get("messages") or []
+        if not isinstance(messages, list) or not messages:
+            raise ValueError("messages is required")
+        prompt = "\n".join(str(m.get("content", "")) for m in messages)
+        role = next((str(m.get("content", ""))[:40] for m in messages if m.get("role") == "system"), "")
+        if max_inflight is not None and inflight >= max_inflight:
+            return too_many(max(llm.latency_s, 0.05))
+        wait = rpm_bucket.try_acquire(1)
+        if wait > 0:
+            return too_many(wait)
+        wait = tpm_bucket.try_acquire(estimate_tokens(prompt) + int(body.get("max_tokens") or 0))
+        if wait > 0:
+            return too_many(wait)
+        inflight += 1
+        try:
+            if llm.latency_s:
+                await asyncio.sleep(llm.latency_s)
+        finally:
+            inflight -= 1
+        text = llm.render(prompt, role=role)
+        llm.record(prompt, text)
+        p_tok, c_tok = estimate_tokens(prompt), estimate_tokens(text)
+        return 200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", llm.model),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": p_tok, "completion_tokens": c_tok, "total_tokens": p_tok + c_tok},
+        }
+
+    async def models(body: dict, query: dict):
+        return 200, {"object": "list", "data": [{"id": llm.model, "object": "model", "owned_by": "stub"}]}
+
+    async def stats(body: dict, query: dict):
+        return 200, {**llm.stats(), "rejected_429": rejected, "inflight": inflight}
+
+    return {
+        ("POST", "/v1/chat/completions"): chat,
+        ("GET", "/v1/models"): models,
+        ("GET", "/stats"): stats,
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="OpenAI-compatible stub server")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8901)
+    ap.add_argument("--latency", type=float, default=0.0, help="每次回覆的模擬延遲（秒）")
+    ap.add_argument("--model", default="stub")
+    ap.add_argument("--rpm", type=float, default=None, help="每分鐘請求上限（超過回 429）")
+    ap.add_argument("--tpm", type=float, default=None, help="每分鐘 token 上限（超過回 429）")
+    ap.add_argument("--max-inflight", type=int, default=None, help="同時處理上限（超過回 429）")
+    args = ap.parse_args(argv)
+    llm = StubLLM(latency_s=args.latency, model=args.model)
+    print(f"stub OpenAI server on http://{args.host}:{args.port}/v1")
+    routes = build_routes(llm, rpm=args.rpm, tpm=args.tpm, max_inflight=args.max_inflight)
+    asyncio.run(serve(routes, args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+import asyncio
+import threading
+
+from response_cache import ResponseCache
+
+
+def test_coalescing_across_event_loops():
+    """兩個 thread 各自 asyncio.run（同 run_crew(concurrent=True)）→ 只算一次，兩邊拿到同一個結果"""
+    cache = ResponseCache()
+    calls = []
+    started = threading.Event()
+    results, errors = [], []
+
+    async def work():
+        calls.append(1)
+        started.set()
+        await asyncio.sleep(0.2)
+        return "answer"
+
+    def request():
+        try:
+            results.append(asyncio.run(cache.aget_or_run("k", work)))
+        except Exception as e:  # pragma: no cover - 失敗時由 assert 顯示
+            errors.append(e)
+
+    owner = threading.Thread(target=request)
+    owner.start()
+    assert started.wait(5)
+    waiter = threading.Thread(target=request)
+    waiter.start()
+    owner.join(5)
+    waiter.join(5)
+
+    assert not owner.is_alive() and not waiter.is_alive()
+    assert errors == []
+    assert results == ["answer", "answer"]
+    assert len(calls) == 1
+    assert cache.stats()["coalesced"] == 1
+
+
+def test_waiter_recomputes_when_owner_cancelled():
+    cache = ResponseCache()
+
+    async def main():
+        slow = asyncio.ensure_future(cache.aget_or_run("k", lambda: asyncio.sleep(10, "late")))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(cache.aget_or_run("k", lambda: asyncio.sleep(0, "fresh")))
+        await asyncio.sleep(0)
+        slow.cancel()
+        return await asyncio.wait_for(waiter, 5)
+
+    assert asyncio.run(main()) == "fresh"
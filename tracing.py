@@ -0,0 +1,167 @@
+# tracing.py
+"""
+輕量 span / timer：每個階段花多久、處理幾列、快取有沒有命中、LLM 用了多少 token
+
+    HOTEL_TRACE=traces/trace.jsonl python crew_core.py      # 環境變數開啟（=1 → 預設路徑）
+    import tracing; tracing.enable("traces/trace.jsonl")    # 或程式裡開
+
+    with span("forecast.fit", rows=len(df)) as sp:
+        ...
+        sp.set(source="prophet")
+    current().set(forecast_cache="hit")                      # 標在目前所在的 span 上
+
+- 關閉時 span() / current() 直接回共用的 no-op 物件：一次屬性讀取 + 一個 if，幾乎零成本
+- span 結束時寫一行 JSON（trace_id / span_id / parent_id / name / start / duration_ms / attrs / error）
+  到 JSONL，並留一份在記憶體 ring buffer（recent()，給 Streamlit 診斷面板）
+- 巢狀關係用 contextvars：asyncio task 會自動繼承；丟到 thread pool 的要自己
+  contextvars.copy_context().run(...)（crew_core._in_pool 已處理）
+"""
+from __future__ import annotations
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from pathlib import Path
+
+DEFAULT_PATH = "traces/trace.jsonl"
+
+_enabled = False
+_path: Path | None = None
+_fh = None
+_lock = threading.Lock()
+_recent: deque = deque(maxlen=2000)
+_current: contextvars.ContextVar = contextvars.ContextVar("hotel_trace_span", default=None)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **attrs):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attrs", "start", "_t0", "_token")
+
+    def __init__(self, name: str, attrs: dict):
+        parent = _current.get()
+        self.name = name
+        self.trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent is not None else None
+        self.span_id = uuid.uuid4().hex[:8]
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+        return self
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration_ms = (time.perf_counter() - self._t0) * 1000.0
+        _current.reset(self._token)
+        _emit({
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": round(self.start, 6),
+            "duration_ms": round(duration_ms, 3),
+            "attrs": self.attrs,
+            "error": None if exc is None else repr(exc),
+        })
+        return False
+
+
+def _emit(record: dict) -> None:
+    line = json.dumps(record, ensure_ascii=False, default=str)
+    with _lock:
+        _recent.append(record)
+        if _fh is not None:
+            _fh.write(line + "\n")
+            _fh.flush()
+
+
+# ---------- API ----------
+def span(name: str, **attrs):
+    """with span("stage", rows=n) as sp: ...；關閉時回 no-op"""
+    if not _enabled:
+        return _NOOP
+    return Span(name, attrs)
+
+
+def current():
+    """目前所在的 span（沒有 / 關閉時回 no-op），給下層標註 cache hit 之類的屬性"""
+    if not _enabled:
+        return _NOOP
+    return _current.get() or _NOOP
+
+
+def enable(path: str | None = DEFAULT_PATH) -> None:
+    """開啟 tracing；path=None → 只留在記憶體（recent()），不寫檔"""
+    global _enabled, _path, _fh
+    with _lock:
+        if _fh is not None:
+            _fh.close()
+            _fh = None
+        _path = Path(path) if path else None
+        if _path is not None:
+            _path.parent.mkdir(parents=True, exist_ok=True)
+            _fh = open(_path, "a", encoding="utf-8")
+        _enabled = True
+
+
+def disable() -> None:
+    global _enabled, _fh
+    with _lock:
+        _enabled = False
+        if _fh is not None:
+            _fh.close()
+            _fh = None
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def recent(trace_id: str | None = None) -> list[dict]:
+    """記憶體裡最近的 span（依結束時間）；trace_id=None → 全部"""
+    with _lock:
+        items = list(_recent)
+    return items if trace_id is None else [r for r in items if r["trace_id"] == trace_id]
+
+
+def last_trace() -> list[dict]:
+    """最近一個結束的 root span 所屬的整條 trace（依開始時間排序）"""
+    with _lock:
+        items = list(_recent)
+    root = next((r for r in reversed(items) if r["parent_id"] is None), None)
+    if root is None:
+        return []
+    return sorted((r for r in items if r["trace_id"] == root["trace_id"]), key=lambda r: r["start"])
+
+
+def clear() -> None:
+    with _lock:
+        _recent.clear()
+
+
+_env = os.getenv("HOTEL_TRACE", "")
+if _env and _env.lower() not in ("0", "false", "no"):
+    enable(DEFAULT_PATH if _env.lower() in ("1", "true", "yes") else _env)
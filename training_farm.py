@@ -0,0 +1,238 @@
+# training_farm.py
+"""
+分段定價模型訓練農場：property_id × room_type × channel 各一個 XGB 模型
+
+    python training_farm.py --csv portfolio.csv --out models/segments --workers 8
+    report = train_segments(hist, out_dir="models/segments")
+    store = SegmentModelStore("models/segments")
+    trained = store.get(("P001", "std", "ota"))      # (model, mae) | None，可直接給 price_with_model
+
+- 整個 portfolio 的 _build_pricing_features 只算一次，依 (segment, date) 排好，
+  X / y 放進一塊 SharedMemory；worker 在 initializer 掛上一次，
+  每個 job 只帶 (segment, lo, hi) 三個數字，不會把資料 pickle 進每個 worker
+- 每段的訓練方式與 train_xgb_pricing_model 相同（時間切分，最後 25% 當 holdout 算 MAE），
+  n_jobs=1，平行度放在段與段之間
+- 產出：<out>/<segment>.ubj（XGBoost 原生格式）+ <out>/manifest.json（每段的檔名 / MAE / 列數 / 參數）
+- 標籤列少於 min_rows 的段跳過（報表裡 status="skipped"），定價時退回全域模型或規則
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from data_utils import PRICING_FEATURES, XGB_DEFAULT_PARAMS, _build_pricing_features
+
+SEGMENT_KEYS = ("property_id", "room_type", "channel")
+DEFAULT_DIR = "models/segments"
+MANIFEST = "manifest.json"
+
+
+def segment_name(key: tuple) -> str:
+    """segment tuple → 檔名（非英數字元換成 _）"""
+    return "__".join(re.sub(r"[^0-9A-Za-z_.-]+", "_", str(k)) for k in key)
+
+
+# ---------- 特徵矩陣（只建一次） ----------
+def build_segment_matrix(history: pd.DataFrame, keys: list[str]):
+    """
+    回傳 (X float32 [n, len(PRICING_FEATURES)], y float32 [n], segments)
+    segments = [(key tuple, lo, hi)]：X[lo:hi] 是該段依日期排好的標籤列
+    """
+    df = _build_pricing_features(history)
+    codes, uniques = pd.MultiIndex.from_frame(history[keys]).factorize(sort=True)
+    codes = np.where(df["price"].notna().to_numpy(), codes, -1)  # 沒標籤 / key 缺值的列不用
+    days = df["date"].to_numpy(dtype="datetime64[D]").astype(np.int64)
+    order = np.lexsort((days, codes))
+    order = order[codes[order] >= 0]
+    codes = codes[order]
+    X = df[PRICING_FEATURES].to_numpy(dtype=np.float32)[order]
+    y = df["price"].to_numpy(dtype=np.float32)[order]
+    bounds = np.flatnonzero(np.diff(codes)) + 1
+    segments = [
+        (tuple(uniques[codes[lo]]), int(lo), int(hi))
+        for lo, hi in zip(np.r_[0, bounds], np.r_[bounds, len(codes)])
+        if hi > lo
+    ]
+    return np.ascontiguousarray(X), y, segments
+
+
+def _to_shared(X: np.ndarray, y: np.ndarray):
+    """X、y 複製進同一塊 SharedMemory → (descriptor, shm)"""
+    from multiprocessing import shared_memory
+
+    shm = shared_memory.SharedMemory(create=True, size=max(1, X.nbytes + y.nbytes))
+    np.ndarray(X.shape, dtype=X.dtype, buffer=shm.buf)[:] = X
+    np.ndarray(y.shape, dtype=y.dtype, buffer=shm.buf, offset=X.nbytes)[:] = y
+    return {"name": shm.name, "x_shape": X.shape, "x_nbytes": X.nbytes}, shm
+
+
+# ---------- worker ----------
+_SHM = None
+_X: np.ndarray | None = None
+_Y: np.ndarray | None = None
+_OUT: Path | None = None
+_PARAMS: dict = {}
+
+
+def _init_worker(desc: dict, out_dir: str, params: dict) -> None:
+    """每個 worker 只掛一次 shared memory（零拷貝）"""
+    from multiprocessing import shared_memory
+
+    global _SHM, _X, _Y, _OUT, _PARAMS
+    _SHM = shared_memory.SharedMemory(name=desc["name"])
+    n = desc["x_shape"][0]
+    _X = np.ndarray(desc["x_shape"], dtype=np.float32, buffer=_SHM.buf)
+    _Y = np.ndarray((n,), dtype=np.float32, buffer=_SHM.buf, offset=desc["x_nbytes"])
+    _OUT, _PARAMS = Path(out_dir), params
+
+
+def _train_segment(job: tuple) -> dict:
+    """job = (key, lo, hi, min_rows)"""
+    from xgboost import XGBRegressor
+
+    key, lo, hi, min_rows = job
+    n = hi - lo
+    if n < min_rows:
+        return {"key": key, "status": "skipped", "n_rows": n}
+    t = time.perf_counter()
+    X, y = _X[lo:hi], _Y[lo:hi]
+    cut = min(n - 1, max(1, int(n * 0.75)))  # 同 train_xgb_pricing_model：最後 25% 當 holdout
+    model = XGBRegressor(**{**XGB_DEFAULT_PARAMS, "n_jobs": 1, **_PARAMS})
+    try:
+        model.fit(X[:cut], y[:cut])
+        mae = float(np.mean(np.abs(model.predict(X[cut:]) - y[cut:])))
+        booster = model.get_booster()
+        booster.feature_names = list(PRICING_FEATURES)  # 推論時可以直接吃 PRICING_FEATURES 的 DataFrame
+        name = segment_name(key)
+        tmp = _OUT / f"{name}.tmp.ubj"
+        booster.save_model(tmp)
+        os.replace(tmp, _OUT / f"{name}.ubj")
+    except Exception as e:
+        return {"key": key, "status": "failed", "n_rows": n, "error": repr(e)}
+    return {"key": key, "status": "trained", "file": f"{name}.ubj", "n_rows": n, "mae": mae,
+            "seconds": time.perf_counter() - t}
+
+
+# ---------- 對外 ----------
+def train_segments(
+    history: pd.DataFrame,
+    out_dir: str = DEFAULT_DIR,
+    keys: tuple[str, ...] = SEGMENT_KEYS,
+    params: dict | None = None,
+    max_workers: int | None = None,
+    min_rows: int = 30,
+) -> pd.DataFrame:
+    """
+    每個 segment 訓練一個定價模型，存到 out_dir；回傳報表
+    （keys + status, n_rows, mae, seconds, file, error）
+    - keys：history 裡沒有的欄位自動略過（例如沒有 channel）
+    - params：覆寫 XGB_DEFAULT_PARAMS
+    """
+    keys = [k for k in keys if k in history.columns]
+    if not keys:
+        raise ValueError("需要至少一個 segment 欄位（property_id / room_type / channel）")
+    if "price" not in history.columns:
+        raise ValueError("訓練需要 'price' 欄位")
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+
+    X, y, segments = build_segment_matrix(history, keys)
+    jobs = [(key, lo, hi, int(min_rows)) for key, lo, hi in segments]
+    workers = max(1, min(int(max_workers or os.cpu_count() or 1), len(jobs) or 1))
+    params = {"tree_method": "hist", **(params or {})}
+
+    started = time.time()
+    desc, shm = _to_shared(X, y)
+    del X, y  # 父 process 只留 shared memory 那一份
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(desc, str(out), params)) as pool:
+            results = list(pool.map(_train_segment, jobs, chunksize=max(1, len(jobs) // (workers * 8))))
+    finally:
+        shm.close()
+        shm.unlink()
+
+    manifest = _read_manifest(out)
+    for r in results:
+        if r["status"] == "trained":
+            manifest[segment_name(r["key"])] = {
+                "key": list(r["key"]), "keys": keys, "file": r["file"], "mae": r["mae"],
+                "n_rows": r["n_rows"], "features": list(PRICING_FEATURES), "params": params,
+                "trained_at": started,
+            }
+    tmp = out / f"{MANIFEST}.tmp"
+    tmp.write_text(json.dumps(manifest, ensure_ascii=False, indent=1), encoding="utf-8")
+    os.replace(tmp, out / MANIFEST)
+
+    report = pd.DataFrame([{**dict(zip(keys, r["key"])), **{k: v for k, v in r.items() if k != "key"}}
+                           for r in results])
+    return report
+
+
+def _read_manifest(root: Path) -> dict:
+    p = root / MANIFEST
+    return json.loads(p.read_text(encoding="utf-8")) if p.exists() else {}
+
+
+class SegmentModelStore:
+    """讀 train_segments 的產出；模型第一次 get 才載入，之後留在記憶體"""
+
+    def __init__(self, root: str = DEFAULT_DIR):
+        self.root = Path(root)
+        self.manifest = _read_manifest(self.root)
+        self._mem: dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, key) -> bool:
+        return segment_name(tuple(key)) in self.manifest
+
+    def __len__(self) -> int:
+        return len(self.manifest)
+
+    def get(self, key) -> tuple[object, float] | None:
+        """(model, mae) 或 None（沒有這一段）；格式同 get_pricing_model，可直接給 price_with_model"""
+        name = segment_name(tuple(key))
+        meta = self.manifest.get(name)
+        if meta is None:
+            return None
+        with self._lock:
+            model = self._mem.get(name)
+            if model is None:
+                from xgboost import XGBRegressor
+
+                model = XGBRegressor()
+                model.load_model(self.root / meta["file"])
+                self._mem[name] = model
+        return model, meta["mae"]
+
+
+def main(argv=None):
+    from data_utils import load_occupancy_csv
+
+    ap = argparse.ArgumentParser(description="per-segment XGB pricing-model training farm")
+    ap.add_argument("--csv", default="sample_data/occupancy_history.csv")
+    ap.add_argument("--out", default=DEFAULT_DIR)
+    ap.add_argument("--keys", nargs="+", default=list(SEGMENT_KEYS))
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--min-rows", type=int, default=30)
+    args = ap.parse_args(argv)
+
+    t = time.perf_counter()
+    report = train_segments(load_occupancy_csv(args.csv), out_dir=args.out, keys=tuple(args.keys),
+                            max_workers=args.workers, min_rows=args.min_rows)
+    counts = report["status"].value_counts().to_dict()
+    print(f"{len(report)} segments {counts} in {time.perf_counter() - t:.1f}s → {args.out}")
+    if "mae" in report.columns:
+        print(f"median MAE {report['mae'].median():.3f}, mean fit {report['seconds'].mean():.3f}s/segment")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+# xgb_tuning.py
+"""
+定價模型（XGB）調參：有時間 / 次數預算、TimeSeriesSplit、平行、早停、剪枝
+
+    python xgb_tuning.py --csv priced.csv --property P001 --budget 60 --trials 40
+    tune_pricing_model(hist, key="P001", budget_s=120)
+
+- 每個 trial 在 TimeSeriesSplit 的每一折用 tree_method="hist" 訓練：
+  早停只看 train 尾端切出的內部驗證段（INNER_VALID_FRAC），定好樹數後用整段 train 重訓，
+  再在沒碰過的 validation 折上算 MAE（與不早停的基準 trial 公平比較）
+- 剪枝：trial 逐折訓練，前幾折平均 MAE 比「已完成 trials 同折的中位數」差超過 prune_ratio → 提早放棄
+- trials 一波一波（每波 = worker 數）丟進 process pool；超過 budget_s 就不再開新的一波，
+  進行中的 trial 也會在 deadline 後停止
+- 最佳設定：n_estimators 取各折 best_iteration 的平均，在全部資料上重訓，
+  存進 model registry（<key>.params.json + 模型本體）；之後 get_pricing_model 重訓也沿用這組參數
+  （key 沒給 → registry_key(history)，跟 get_pricing_model 對同一份資料推出來的 key 相同）
+"""
+from __future__ import annotations
+import argparse
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from data_utils import PRICING_FEATURES, XGB_DEFAULT_PARAMS, _build_pricing_features, train_xgb_pricing_model
+from model_registry import get_model_registry, registry_key, training_fingerprint
+
+MAX_TREES = 2000
+EARLY_STOPPING = 30
+INNER_VALID_FRAC = 0.2  # 早停用的內部驗證段：每折 train 的最後 20%
+
+
+def sample_params(rng: np.random.Generator) -> dict:
+    """搜尋空間（隨機取樣）"""
+    return {
+        "max_depth": int(rng.integers(2, 9)),
+        "learning_rate": float(math.exp(rng.uniform(math.log(0.02), math.log(0.3)))),
+        "min_child_weight": float(rng.choice([1, 2, 4, 8])),
+        "subsample": float(rng.uniform(0.6, 1.0)),
+        "colsample_bytree": float(rng.uniform(0.6, 1.0)),
+        "reg_lambda": float(math.exp(rng.uniform(math.log(0.1), math.log(10.0)))),
+        "max_bin": int(rng.choice([64, 128, 256])),
+    }
+
+
+# ---------- worker ----------
+_X: np.ndarray | None = None
+_Y: np.ndarray | None = None
+_SPLITS: list | None = None
+
+
+def _init_worker(X: np.ndarray, y: np.ndarray, splits: list) -> None:
+    """資料每個 worker 只傳一次，不是每個 trial 都 pickle 一遍"""
+    global _X, _Y, _SPLITS
+    _X, _Y, _SPLITS = X, y, splits
+
+
+def _run_trial(job: tuple) -> dict:
+    """job = (trial_id, params, fold_thresholds, prune_ratio, deadline)"""
+    from xgboost import XGBRegressor
+
+    trial_id, params, thresholds, prune_ratio, deadline = job
+    t = time.perf_counter()
+    maes, iters = [], []
+    for i, (tr, va) in enumerate(_SPLITS):
+        if time.time() > deadline:
+            return {"trial": trial_id, "params": params, "status": "timeout", "fold_mae": maes,
+                    "seconds": time.perf_counter() - t}
+        if "n_estimators" in params:  # 固定樹數（基準 trial）：不早停
+            model = XGBRegressor(random_state=42, n_jobs=1, **params)
+            model.fit(_X[tr], _Y[tr])
+            pred, n_trees = model.predict(_X[va]), int(params["n_estimators"])
+        else:
+            # 早停只用 train 尾端（時間上最後一段）；va 留到最後評分，不參與選樹數
+            cut = len(tr) - max(1, int(len(tr) * INNER_VALID_FRAC))
+            inner, stop = tr[:cut], tr[cut:]
+            model = XGBRegressor(
+                n_estimators=MAX_TREES, tree_method="hist", early_stopping_rounds=EARLY_STOPPING,
+                random_state=42, n_jobs=1, **params,
+            )
+            model.fit(_X[inner], _Y[inner], eval_set=[(_X[stop], _Y[stop])], verbose=False)
+            n_trees = int(model.best_iteration) + 1
+            model = XGBRegressor(n_estimators=n_trees, tree_method="hist", random_state=42, n_jobs=1, **params)
+            model.fit(_X[tr], _Y[tr])
+            pred = model.predict(_X[va])
+        maes.append(float(np.mean(np.abs(pred - _Y[va]))))
+        iters.append(n_trees)
+        ref = thresholds[i] if i < len(thresholds) else None
+        if ref is not None and np.mean(maes) > ref * prune_ratio:
+            return {"trial": trial_id, "params": params, "status": "pruned", "fold_mae": maes,
+                    "seconds": time.perf_counter() - t}
+    return {
+        "trial": trial_id, "params": params, "status": "done", "fold_mae": maes,
+        "mae": float(np.mean(maes)), "n_estimators": int(np.mean(iters)), "seconds": time.perf_counter() - t,
+    }
+
+
+def _thresholds(done: list[dict], n_folds: int) -> list[float | None]:
+    """每一折：已完成 trials 到該折為止的平均 MAE 的中位數"""
+    out = []
+    for i in range(n_folds):
+        vals = [np.mean(r["fold_mae"][: i + 1]) for r in done if r["status"] == "done"]
+        out.append(float(np.median(vals)) if len(vals) >= 2 else None)
+    return out
+
+
+# ---------- 對外 ----------
+def tune_pricing_model(
+    history: pd.DataFrame,
+    key: str | None = None,
+    budget_s: float = 60.0,
+    max_trials: int = 30,
+    n_splits: int = 4,
+    max_workers: int | None = None,
+    prune_ratio: float = 1.15,
+    seed: int = 0,
+    save: bool = True,
+) -> dict:
+    """
+    回傳 {"best": {...}, "baseline_mae", "trials": DataFrame, "seconds"}
+    - 第 0 個 trial 一定是現行預設參數（XGB_DEFAULT_PARAMS），當比較基準
+    - save=True：最佳設定與重訓後的模型寫進 registry（key）
+    """
+    from sklearn.model_selection import TimeSeriesSplit
+
+    if "price" not in history.columns:
+        raise ValueError("調參需要 'price' 欄位")
+    key = key or registry_key(history)
+    df = _build_pricing_features(history).dropna(subset=["price"]).sort_values("date", kind="stable")
+    X = df[PRICING_FEATURES].to_numpy(dtype=np.float32)
+    y = df["price"].to_numpy(dtype=np.float32)
+    n_splits = max(2, min(int(n_splits), len(df) // 20))
+    splits = list(TimeSeriesSplit(n_splits=n_splits).split(X))
+
+    rng = np.random.default_rng(seed)
+    baseline = {k: v for k, v in XGB_DEFAULT_PARAMS.items() if k != "random_state"}
+    candidates = [baseline] + [sample_params(rng) for _ in range(max(0, int(max_trials) - 1))]
+
+    started = time.time()
+    deadline = started + float(budget_s)
+    workers = max(1, int(max_workers or os.cpu_count() or 1))
+    results: list[dict] = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(X, y, splits)) as pool:
+        for w in range(0, len(candidates), workers):
+            if time.time() > deadline:
+                break
+            thresholds = _thresholds(results, len(splits))
+            wave = [
+                (i, candidates[i], thresholds, prune_ratio, deadline)
+                for i in range(w, min(w + workers, len(candidates)))
+            ]
+            results.extend(pool.map(_run_trial, wave))
+
+    done = [r for r in results if r["status"] == "done"]
+    if not done:
+        raise RuntimeError("預算內沒有任何 trial 完成（加大 budget_s）")
+    best = min(done, key=lambda r: r["mae"])
+    base = next((r for r in results if r["trial"] == 0 and r["status"] == "done"), None)
+    best_params = {"tree_method": "hist", **best["params"], "n_estimators": best["n_estimators"]}
+
+    if save:
+        pipe, mae = train_xgb_pricing_model(history, params=best_params)
+        registry = get_model_registry()
+        registry.save_params(key, best_params, {
+            "cv_mae": best["mae"],
+            "baseline_cv_mae": None if base is None else base["mae"],
+            "n_splits": len(splits),
+            "trials": len(results),
+            "tuned_at": time.time(),
+        })
+        registry.save(key, pipe, {
+            "key": key,
+            "features": list(PRICING_FEATURES),
+            "fingerprint": training_fingerprint(history, PRICING_FEATURES),
+            "mae": mae,
+            "n_rows": int(history["price"].notna().sum()),
+            "params": best_params,
+            "trained_at": time.time(),
+        })
+
+    table = pd.DataFrame([
+        {"trial": r["trial"], "status": r["status"], "mae": r.get("mae"),
+         "n_estimators": r.get("n_estimators"), "folds_run": len(r["fold_mae"]),
+         "seconds": round(r["seconds"], 3), **r["params"]}
+        for r in results
+    ]).sort_values(["status", "mae"], na_position="last")
+    return {
+        "best": {"params": best_params, "cv_mae": best["mae"]},
+        "baseline_mae": None if base is None else base["mae"],
+        "trials": table.reset_index(drop=True),
+        "seconds": time.time() - started,
+    }
+
+
+def main(argv=None):
+    from data_utils import load_occupancy_csv
+
+    ap = argparse.ArgumentParser(description="budgeted XGB pricing-model tuning")
+    ap.add_argument("--csv", default="sample_data/occupancy_history.csv")
+    ap.add_argument("--key", default=None, help="model registry key（預設由資料推導，見 registry_key）")
+    ap.add_argument("--property", default=None, help="只用這個 property_id 的資料")
+    ap.add_argument("--budget", type=float, default=60.0, help="秒")
+    ap.add_argument("--trials", type=int, default=30)
+    ap.add_argument("--splits", type=int, default=4)
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--no-save", action="store_true")
+    args = ap.parse_args(argv)
+
+    hist = load_occupancy_csv(args.csv)
+    if args.property is not None:
+        hist = hist[hist["property_id"].astype(str) == args.property]
+    out = tune_pricing_model(
+        hist, key=args.key, budget_s=args.budget, max_trials=args.trials, n_splits=args.splits,
+        max_workers=args.workers, save=not args.no_save,
+    )
+    pd.set_option("display.width", 200)
+    print(out["trials"].round(4).head(10).to_string(index=False))
+    print(f"\nbaseline cv MAE: {out['baseline_mae']}")
+    print(f"best cv MAE    : {out['best']['cv_mae']:.4f}  params={out['best']['params']}")
+    print(f"{out['seconds']:.1f}s, {len(out['trials'])} trials")
+
+
+if __name__ == "__main__":
+    main()